@@ -2,16 +2,26 @@ import heapq
 import random
 from collections import defaultdict
 
+from grid import as_flat_grid, collect_steps
+from radix_heap import RadixHeap
+
+# Integer move costs for weighted maps; 577 / 408 matches sqrt(2) to 1e-5
+ORTHOGONAL_COST = 408
+DIAGONAL_COST = 577
+
 class PathResult:
     """
     Container for path finding results.
     
     :param shortest_path: List of coordinates representing the path.
     :param step_info: Dictionary containing step-by-step information of the algorithm.
+    :param step_frontier: For bidirectional searches, the same level -> "x,y" layout
+                          as step_info, mapping each expanded node to "forward" or "backward".
     """
-    def __init__(self, shortest_path, step_info):
+    def __init__(self, shortest_path, step_info, step_frontier=None):
         self.shortest_path = shortest_path
         self.step_info = step_info
+        self.step_frontier = step_frontier
 
 
 class Node:
@@ -40,79 +50,335 @@ def heuristic(a, b):
     return max(dx, dy) + (2**0.5 - 1) * min(dx, dy)
 
     
-def astar_algorithm(grid, start, end):
+def astar_algorithm(grid, start, end, bidirectional=False, stats=None, landmarks=None):
     """
     A* algorithm with diagonal exploration but orthogonal-only final path.
+
+    With bidirectional=True, searches from both endpoints (see bidirectional_astar).
+    Pass a SearchStats as `stats` to collect work counters. On maps with
+    terrain costs a move is scaled by the cost of the cell entered.
+    Pass a LandmarkTable (see landmarks.build_landmarks) as `landmarks` to
+    use ALT bounds instead of octile distance; the bidirectional search and
+    weighted maps ignore it.
+    """
+    flat = as_flat_grid(grid)
+    if bidirectional:
+        return bidirectional_astar(flat, start, end, stats)
+    step_info = {}
+    path = collect_steps(astar_steps(flat, start, end, stats, landmarks), step_info)
+    return PathResult(path, step_info)
+
+def astar_steps(grid, start, end, stats=None, landmarks=None):
     """
-    rows = len(grid)
-    cols = len(grid[0])
+    Generator form of astar_algorithm that yields every expansion as it
+    happens, so callers can stream the trace instead of holding it.
+
+    The octile heuristic is consistent, so a node's first pop is final:
+    expanded nodes go in a closed set, later heap entries for them are
+    skipped as stale, and no neighbour loop runs twice for the same node.
+    The landmark heuristic is consistent too, so the same holds with it.
+    Path costs are optimal either way, but ties between equal-cost paths
+    may break differently than without the closed set or the landmarks.
+
+    :yield: Tuples (level, {"x,y": [[next_x, next_y], ...]}).
+    :return: The path, or [] if end is unreachable (via StopIteration.value).
+    """
+    flat = as_flat_grid(grid)
+    if flat.costs is not None:
+        return (yield from weighted_astar_steps(flat, start, end, stats))
+    walkable = flat.walkable
+    stride = flat.stride
+    source = flat.index(*start)
+    target = flat.index(*end)
+    end_x, end_y = target // stride, target % stride
+    bounds = landmarks.heuristic(target) if landmarks is not None else None
     
     open_set = []
-    heapq.heappush(open_set, (0, start))
+    heapq.heappush(open_set, (0, source))
+    closed = bytearray(flat.size)
     
-    came_from = {}
-    g_score = defaultdict(lambda: float('inf'))
-    f_score = defaultdict(lambda: float('inf'))
+    came_from = flat.new_parents()
+    g_score = flat.new_scores()
     
-    g_score[start] = 0
-    f_score[start] = heuristic(start, end)
+    g_score[source] = 0
     
-    step_info = defaultdict(dict)
     current_level = 0
     
     # Keep diagonal exploration for better pathfinding
-    directions = [
-        (-1, -1), (-1, 0), (-1, 1),
-        (0, -1),           (0, 1),
-        (1, -1),  (1, 0),  (1, 1)
-    ]
+    moves = tuple(zip(flat.offsets8, flat.costs8))
+    pops = pushes = stale = 0
 
     while open_set:
         _, current = heapq.heappop(open_set)
+        pops += 1
+        if closed[current]:
+            stale += 1
+            continue
+        closed[current] = 1
         
-        if current == end:
-            # Reconstruct path with orthogonal movements only
-            path = []
-            curr = current
-            while curr in came_from:
-                path.append(curr)
-                prev = came_from[curr]
-                
-                # If this is a diagonal move, insert an intermediate point
-                dx = curr[0] - prev[0]
-                dy = curr[1] - prev[1]
-                if abs(dx) == 1 and abs(dy) == 1:
-                    # Insert intermediate point (either horizontal-first or vertical-first)
-                    # Here we choose horizontal-first
-                    intermediate = (prev[0], curr[1])
-                    path.append(intermediate)
-                
-                curr = prev
-            path.append(start)
-            path.reverse()
-            return PathResult(path, step_info)
+        if current == target:
+            if stats is not None:
+                stats.nodes_expanded += pops - stale - 1
+                stats.heap_pops += pops
+                stats.stale_pops += stale
+                stats.heap_pushes += pushes + 1
+            return orthogonal_path(flat, came_from, current, start)
 
         next_nodes = []
+        current_g = g_score[current]
         
-        for dx, dy in directions:
-            nx, ny = current[0] + dx, current[1] + dy
-            neighbor = (nx, ny)
+        for offset, movement_cost in moves:
+            neighbor = current + offset
             
-            if not (0 <= nx < rows and 0 <= ny < cols) or grid[nx][ny] == 6:
+            if not walkable[neighbor] or closed[neighbor]:
                 continue
                 
-            movement_cost = 2**0.5 if dx != 0 and dy != 0 else 1
-            tentative_g_score = g_score[current] + movement_cost
+            tentative_g_score = current_g + movement_cost
             
             if tentative_g_score < g_score[neighbor]:
                 came_from[neighbor] = current
                 g_score[neighbor] = tentative_g_score
-                f_score[neighbor] = tentative_g_score + heuristic(neighbor, end)
-                heapq.heappush(open_set, (f_score[neighbor], neighbor))
-                next_nodes.append([nx, ny])
+                if bounds is not None:
+                    f_score = tentative_g_score + bounds[neighbor]
+                else:
+                    # Same diagonal distance as heuristic(), on flat indices
+                    dx = abs(neighbor // stride - end_x)
+                    dy = abs(neighbor % stride - end_y)
+                    f_score = tentative_g_score + (max(dx, dy) + (2**0.5 - 1) * min(dx, dy))
+                heapq.heappush(open_set, (f_score, neighbor))
+                next_nodes.append(flat.cell_list(neighbor))
         
         if next_nodes:
-            step_info[current_level][f"{current[0]},{current[1]}"] = next_nodes
+            pushes += len(next_nodes)  # One push per queued neighbour
+            yield current_level, {flat.cell_key(current): next_nodes}
+            current_level += 1
+
+    if stats is not None:
+        stats.nodes_expanded += pops - stale
+        stats.heap_pops += pops
+        stats.stale_pops += stale
+        stats.heap_pushes += pushes + 1
+    return []
+
+
+def weighted_astar_steps(flat, start, end, stats=None):
+    """
+    astar_steps for a map with terrain costs.
+
+    Costs are integers: ORTHOGONAL_COST or DIAGONAL_COST times the terrain
+    cost of the cell entered. The heuristic is the same octile distance
+    scaled by the map's cheapest terrain, which keeps it consistent, so f
+    never decreases along the search and the open set is a RadixHeap.
+
+    :yield: Tuples (level, {"x,y": [[next_x, next_y], ...]}).
+    :return: The path, or [] if end is unreachable (via StopIteration.value).
+    """
+    walkable = flat.walkable
+    costs = flat.costs
+    stride = flat.stride
+    source = flat.index(*start)
+    target = flat.index(*end)
+    end_x, end_y = target // stride, target % stride
+    straight = ORTHOGONAL_COST * flat.min_cost
+    extra = (DIAGONAL_COST - ORTHOGONAL_COST) * flat.min_cost
+
+    open_set = RadixHeap()
+    open_set.push(0, source)
+    came_from = flat.new_parents()
+    g_score = flat.new_scores()
+    g_score[source] = 0
+    closed = bytearray(flat.size)
+
+    current_level = 0
+    moves = tuple((offset, round(cost * ORTHOGONAL_COST))
+                  for offset, cost in zip(flat.offsets8, flat.costs8))
+    pops = pushes = stale = 0
+
+    while open_set:
+        _, current = open_set.pop()
+        pops += 1
+        if closed[current]:
+            stale += 1
+            continue
+        closed[current] = 1
+
+        if current == target:
+            if stats is not None:
+                stats.nodes_expanded += pops - stale - 1
+                stats.heap_pops += pops
+                stats.stale_pops += stale
+                stats.heap_pushes += pushes + 1
+            return orthogonal_path(flat, came_from, current, start)
+
+        next_nodes = []
+        current_g = g_score[current]
+
+        for offset, movement_cost in moves:
+            neighbor = current + offset
+            if not walkable[neighbor]:
+                continue
+
+            tentative_g_score = current_g + movement_cost * costs[neighbor]
+            if tentative_g_score < g_score[neighbor]:
+                came_from[neighbor] = current
+                g_score[neighbor] = tentative_g_score
+                dx = abs(neighbor // stride - end_x)
+                dy = abs(neighbor % stride - end_y)
+                if dx < dy:
+                    dx, dy = dy, dx
+                open_set.push(tentative_g_score + straight * dx + extra * dy, neighbor)
+                next_nodes.append(flat.cell_list(neighbor))
+
+        if next_nodes:
+            pushes += len(next_nodes)
+            yield current_level, {flat.cell_key(current): next_nodes}
             current_level += 1
 
-    return PathResult([], step_info)
\ No newline at end of file
+    if stats is not None:
+        stats.nodes_expanded += pops - stale
+        stats.heap_pops += pops
+        stats.stale_pops += stale
+        stats.heap_pushes += pushes + 1
+    return []
+
+
+def orthogonal_path(flat, came_from, current, start):
+    """
+    Reconstruct the path to `current`, replacing each diagonal move with two
+    orthogonal ones (horizontal-first).
+    """
+    stride = flat.stride
+    path = []
+    curr = current
+    while came_from[curr] != -1:
+        path.append(flat.coords(curr))
+        prev = came_from[curr]
+
+        # If this is a diagonal move, insert an intermediate point
+        step = curr - prev
+        if step != 1 and step != -1 and step != stride and step != -stride:
+            path.append(flat.coords(prev + (curr % stride - prev % stride)))
+
+        curr = prev
+    path.append(tuple(start))
+    path.reverse()
+    return path
+
+
+FRONTIERS = ("forward", "backward")
+
+def bidirectional_astar(flat, start, end, stats=None):
+    """
+    A* from start towards end and from end towards start at once.
+
+    Both sides use the average potential (h_to_end - h_to_start) / 2 (negated
+    for the backward side), which keeps the two searches consistent with each
+    other. Each round expands the side with the lower key; every edge linking a
+    node to one reached by the other side is a candidate meeting point, and the
+    search stops once the two smallest keys add up to the best candidate.
+
+    On maps with terrain costs this falls back to the one-sided
+    weighted_astar_steps, so step_frontier is None there.
+    """
+    if flat.costs is not None:
+        step_info = {}
+        path = collect_steps(weighted_astar_steps(flat, start, end, stats), step_info)
+        return PathResult(path, step_info)
+    walkable = flat.walkable
+    stride = flat.stride
+    source = flat.index(*start)
+    target = flat.index(*end)
+    start_x, start_y = source // stride, source % stride
+    end_x, end_y = target // stride, target % stride
+
+    def potential(node):
+        # Half the difference of the diagonal distances to end and to start
+        dx = abs(node // stride - end_x)
+        dy = abs(node % stride - end_y)
+        to_end = max(dx, dy) + (2**0.5 - 1) * min(dx, dy)
+        dx = abs(node // stride - start_x)
+        dy = abs(node % stride - start_y)
+        to_start = max(dx, dy) + (2**0.5 - 1) * min(dx, dy)
+        return (to_end - to_start) / 2
+
+    g_scores = (flat.new_scores(), flat.new_scores())
+    came_from = (flat.new_parents(), flat.new_parents())
+    closed = (bytearray(flat.size), bytearray(flat.size))
+    open_sets = ([(potential(source), source)], [(-potential(target), target)])
+    g_scores[0][source] = 0
+    g_scores[1][target] = 0
+
+    step_info = defaultdict(dict)
+    step_frontier = defaultdict(dict)
+    current_level = 0
+    moves = tuple(zip(flat.offsets8, flat.costs8))
+
+    best = 0 if source == target else float('inf')
+    meeting = (source, source)  # (forward-side node, backward-side node)
+    pops = pushes = stale = 0
+
+    while open_sets[0] and open_sets[1]:
+        if open_sets[0][0][0] + open_sets[1][0][0] >= best:
+            break
+
+        side = 0 if open_sets[0][0][0] <= open_sets[1][0][0] else 1
+        _, current = heapq.heappop(open_sets[side])
+        pops += 1
+        if closed[side][current]:
+            stale += 1
+            continue
+        closed[side][current] = 1
+
+        own, theirs = g_scores[side], g_scores[1 - side]
+        sign = 1 if side == 0 else -1
+        current_g = own[current]
+        next_nodes = []
+
+        for offset, movement_cost in moves:
+            neighbor = current + offset
+            if not walkable[neighbor]:
+                continue
+
+            tentative_g_score = current_g + movement_cost
+
+            if tentative_g_score < own[neighbor]:
+                came_from[side][neighbor] = current
+                own[neighbor] = tentative_g_score
+                f_score = tentative_g_score + sign * potential(neighbor)
+                heapq.heappush(open_sets[side], (f_score, neighbor))
+                next_nodes.append(flat.cell_list(neighbor))
+
+            # Candidate meeting edge current -> neighbor
+            if tentative_g_score + theirs[neighbor] < best:
+                best = tentative_g_score + theirs[neighbor]
+                meeting = (current, neighbor) if side == 0 else (neighbor, current)
+
+        if next_nodes:
+            pushes += len(next_nodes)
+            key = flat.cell_key(current)
+            step_info[current_level][key] = next_nodes
+            step_frontier[current_level][key] = FRONTIERS[side]
+            current_level += 1
+
+    if stats is not None:
+        stats.nodes_expanded += pops - stale
+        stats.heap_pops += pops
+        stats.stale_pops += stale
+        stats.heap_pushes += pushes + 2
+
+    if best == float('inf'):
+        return PathResult([], step_info, step_frontier)
+
+    # Join start -> meeting[0] with meeting[1] -> end, then make it orthogonal
+    forward_node, backward_node = meeting
+    cells = flat.trace_path(came_from[0], forward_node)
+    if backward_node != forward_node:
+        cells.extend(reversed(flat.trace_path(came_from[1], backward_node)))
+
+    path = [cells[0]]
+    for prev, curr in zip(cells, cells[1:]):
+        if prev[0] != curr[0] and prev[1] != curr[1]:
+            # Horizontal-first intermediate point, as in astar_algorithm
+            path.append((prev[0], curr[1]))
+        path.append(curr)
+    return PathResult(path, step_info, step_frontier)
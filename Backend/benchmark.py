@@ -0,0 +1,381 @@
+"""
+Benchmark the search engines on seeded maps.
+
+Every engine runs on the same generated maps for each size, obstacle density
+and map type. A record holds wall time (best of --repeat runs), nodes
+expanded, queue pushes/pops, stale pops and JPS jump-scan cells (see
+search_stats.SearchStats), peak traced memory, whether the path is valid
+(orthogonal steps over free cells from start to end), and whether it is as
+short as a reference search. The results go to a JSON file, and per-engine
+totals over the cases every engine solved with a valid path are printed;
+runs with an invalid path are flagged and counted, never mixed into the
+totals. Pass an earlier
+file with --compare to print per-case speedups between two commits. With
+--max-cost above 1 the maps also get terrain costs (see
+map_generators.generate_terrain) and costs are measured with them.
+
+    python benchmark.py --sizes 20,100,500 --densities 0.1,0.3 --out bench.json
+    python benchmark.py --out new.json --compare bench.json
+    python benchmark.py --max-cost 9 --engines dijkstra,astar --out weighted.json
+"""
+import argparse
+import heapq
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+import astar
+import dijkstra
+import hpa
+import jps
+from grid import FlatGrid
+from jps_bits import build_jump_masks
+from jps_plus import build_jump_table
+from landmarks import build_landmarks
+from map_generators import GENERATORS, generate_grid, generate_terrain
+from search_stats import SearchStats
+
+DEFAULT_SIZES = (20, 50, 100, 200, 500, 1000, 2000)
+DEFAULT_DENSITIES = (0.1, 0.2, 0.3)
+
+
+# name -> (metric, prepare(flat), run(flat, start, end, prepared, stats))
+ENGINES = {
+    "dijkstra": ("4", None,
+                 lambda flat, s, e, _, stats: dijkstra.dijkstra_algorithm(flat, s, e, stats=stats)),
+    "dijkstra-bidirectional": ("4", None,
+                               lambda flat, s, e, _, stats: dijkstra.dijkstra_algorithm(
+                                   flat, s, e, bidirectional=True, stats=stats)),
+    "astar": ("8", None,
+              lambda flat, s, e, _, stats: astar.astar_algorithm(flat, s, e, stats=stats)),
+    "astar-bidirectional": ("8", None,
+                            lambda flat, s, e, _, stats: astar.astar_algorithm(
+                                flat, s, e, bidirectional=True, stats=stats)),
+    # Per-target landmark bounds are cached, so repeats after the first run are warm
+    "astar-alt": ("8", build_landmarks,
+                  lambda flat, s, e, table, stats: astar.astar_algorithm(flat, s, e, stats=stats, landmarks=table)),
+    "jps": ("8", None,
+            lambda flat, s, e, _, stats: jps.jps_algorithm(flat, s, e, stats=stats)),
+    "jps-plus": ("8", build_jump_table,
+                 lambda flat, s, e, table, stats: jps.jps_algorithm(flat, s, e, jump_table=table, stats=stats)),
+    "jps-bits": ("8", build_jump_masks,
+                 lambda flat, s, e, masks, stats: jps.jps_algorithm(flat, s, e, jump_table=masks, stats=stats)),
+    "jps-alt": ("8", build_landmarks,
+                lambda flat, s, e, table, stats: jps.jps_algorithm(flat, s, e, stats=stats, landmarks=table)),
+    # Near-optimal by design; intra-cluster edges are added lazily, so repeats after the first run are warm
+    "hpa": ("4", hpa.build_abstract_graph,
+            lambda flat, s, e, graph, stats: hpa.hpa_algorithm(flat, s, e, graph=graph, stats=stats)),
+}
+
+
+def reference_cost(flat, start, end, metric):
+    """
+    Shortest path cost from a plain reference search: BFS for the 4-connected
+    engines, Dijkstra with unit / sqrt(2) steps for the 8-connected ones.
+    """
+    walkable = flat.walkable
+    source = flat.index(*start)
+    target = flat.index(*end)
+    if flat.costs is not None:
+        return weighted_reference_cost(flat, source, target, metric)
+    if metric == "4":
+        distance = {source: 0}
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            if current == target:
+                return distance[current]
+            for offset in flat.offsets4:
+                neighbor = current + offset
+                if walkable[neighbor] and neighbor not in distance:
+                    distance[neighbor] = distance[current] + 1
+                    queue.append(neighbor)
+        return None
+
+    distance = flat.new_scores()
+    distance[source] = 0
+    queue = [(0, source)]
+    moves = tuple(zip(flat.offsets8, flat.costs8))
+    while queue:
+        d, current = heapq.heappop(queue)
+        if current == target:
+            return d
+        if d > distance[current]:
+            continue
+        for offset, cost in moves:
+            neighbor = current + offset
+            if walkable[neighbor] and d + cost < distance[neighbor]:
+                distance[neighbor] = d + cost
+                heapq.heappush(queue, (d + cost, neighbor))
+    return None
+
+
+def weighted_reference_cost(flat, source, target, metric):
+    """
+    reference_cost on a map with terrain costs: Dijkstra where a move costs
+    the entered cell's terrain, scaled by astar's integer step costs for the
+    8-connected metric so the engines' rounding is matched exactly.
+    """
+    walkable, costs = flat.walkable, flat.costs
+    if metric == "4":
+        moves, scale = tuple((offset, 1) for offset in flat.offsets4), 1
+    else:
+        moves = tuple((offset, round(cost * astar.ORTHOGONAL_COST))
+                      for offset, cost in zip(flat.offsets8, flat.costs8))
+        scale = astar.ORTHOGONAL_COST
+    distance = flat.new_scores()
+    distance[source] = 0
+    queue = [(0, source)]
+    while queue:
+        d, current = heapq.heappop(queue)
+        if current == target:
+            return d / scale
+        if d > distance[current]:
+            continue
+        for offset, step in moves:
+            neighbor = current + offset
+            if walkable[neighbor] and d + step * costs[neighbor] < distance[neighbor]:
+                distance[neighbor] = d + step * costs[neighbor]
+                heapq.heappush(queue, (distance[neighbor], neighbor))
+    return None
+
+
+def path_cost(path, metric, flat=None):
+    """
+    Cost of a returned path in the engine's own metric. The 8-connected
+    engines return diagonal moves as two orthogonal ones, so the cheapest
+    reading of the path (each L-shaped pair counted as one diagonal) is used.
+    Pass the FlatGrid to count terrain costs on weighted maps.
+    """
+    if not path:
+        return None
+    if flat is None or flat.costs is None:
+        terrain = lambda point: 1
+        straight, diagonal = 1, math.sqrt(2)
+    else:
+        terrain = lambda point: flat.costs[flat.index(*point)]
+        straight, diagonal = 1, astar.DIAGONAL_COST / astar.ORTHOGONAL_COST
+    if metric == "4":
+        return sum(terrain(point) for point in path[1:])
+    cost = [0.0] + [math.inf] * (len(path) - 1)
+    for i in range(len(path) - 1):
+        cost[i + 1] = min(cost[i + 1], cost[i] + straight * terrain(path[i + 1]))
+        if i + 2 < len(path):
+            (ax, ay), (bx, by) = path[i], path[i + 2]
+            if abs(ax - bx) == 1 and abs(ay - by) == 1:
+                cost[i + 2] = min(cost[i + 2], cost[i] + diagonal * terrain(path[i + 2]))
+    return cost[-1]
+
+
+def path_is_valid(flat, path, start, end) -> bool:
+    """
+    The path runs from start to end in orthogonal steps over walkable cells.
+    """
+    if not path or tuple(path[0]) != tuple(start) or tuple(path[-1]) != tuple(end):
+        return False
+    if not all(flat.is_walkable(x, y) for x, y in path):
+        return False
+    return all(abs(ax - bx) + abs(ay - by) == 1 for (ax, ay), (bx, by) in zip(path, path[1:]))
+
+
+def run_case(name, flat, start, end, repeat, measure_memory):
+    metric, prepare, run = ENGINES[name]
+
+    t0 = time.perf_counter()
+    prepared = prepare(flat) if prepare else None
+    prepare_seconds = time.perf_counter() - t0 if prepare else 0.0
+
+    # Counters from the first run; timings are the best of all runs
+    stats = SearchStats()
+    best = math.inf
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = run(flat, start, end, prepared, stats if i == 0 else None)
+        best = min(best, time.perf_counter() - t0)
+
+    peak = None
+    if measure_memory:
+        tracemalloc.start()
+        run(flat, start, end, prepared, None)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "engine": name,
+        "seconds": best,
+        "prepare_seconds": prepare_seconds,
+        **stats.as_dict(),
+        "peak_bytes": peak,
+        "path_length": len(result.shortest_path),
+        "valid": path_is_valid(flat, result.shortest_path, start, end),
+        "path_cost": path_cost(result.shortest_path, metric, flat),
+        "metric": metric,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, densities, map_types, engines, seed, repeat,
+                   measure_memory=True, verify=True, log=sys.stderr, max_cost=1):
+    records = []
+    for map_type in map_types:
+        for size in sizes:
+            for density in densities:
+                grid = generate_grid(size, size, int(density * size * size), map_type, seed)
+                costs = generate_terrain(size, size, max_cost, seed) if max_cost > 1 else None
+                flat = FlatGrid(grid, costs=costs)
+                start, end = (0, 0), (size - 1, size - 1)
+                references = {}
+                for name in engines:
+                    record = run_case(name, flat, start, end, repeat, measure_memory)
+                    metric = record["metric"]
+                    if verify:
+                        if metric not in references:
+                            references[metric] = reference_cost(flat, start, end, metric)
+                        ref = references[metric]
+                        record["reference_cost"] = ref
+                        # None: an invalid path says nothing about optimality
+                        record["optimal"] = (None if not record["valid"] else
+                                             ref is not None and abs(record["path_cost"] - ref) < 1e-6)
+                    record.update(map_type=map_type, size=size, density=density, seed=seed,
+                                  max_cost=max_cost)
+                    records.append(record)
+                    print(f"{map_type:8} {size:5} {density:4} {name:24} "
+                          f"{record['seconds'] * 1000:10.2f} ms {record['nodes_expanded']:9} nodes"
+                          + ("" if record["valid"] else "  INVALID PATH (excluded from totals)")
+                          + ("" if not record["valid"] or record.get("optimal", True) else "  NOT OPTIMAL"),
+                          file=log)
+    return records
+
+
+def summarize(records, log=sys.stdout):
+    """
+    Print per-engine totals over the cases every engine solved.
+
+    A run with an invalid path (a step through a wall or between cells that
+    don't touch, as the 8-connected engines' orthogonal expansion can
+    produce on dense maps) did not solve its case, so its time, node count
+    and optimality mean nothing. Totals cover only the cases where every
+    engine's path is valid, so all engines are summed over the same maps;
+    each engine's valid/total run count and the number of cases left out
+    are printed alongside.
+    """
+    def case(r):
+        return r["map_type"], r["size"], r["density"], r["seed"], r.get("max_cost", 1)
+
+    by_engine = {}
+    invalid_cases = set()
+    for record in records:
+        by_engine.setdefault(record["engine"], []).append(record)
+        if not record["valid"]:
+            invalid_cases.add(case(record))
+    cases = {case(r) for r in records}
+    print(f"{'engine':24} {'valid':>9} {'total ms':>11} {'nodes':>11} {'optimal':>9}", file=log)
+    for name, runs in by_engine.items():
+        shared = [r for r in runs if case(r) not in invalid_cases]
+        verified = [r for r in shared if r.get("optimal") is not None]
+        optimal = f"{sum(r['optimal'] for r in verified)}/{len(verified)}" if verified else "-"
+        print(f"{name:24} {sum(r['valid'] for r in runs):>4}/{len(runs):<4} "
+              f"{sum(r['seconds'] for r in shared) * 1000:11.2f} "
+              f"{sum(r['nodes_expanded'] for r in shared):11} {optimal:>9}", file=log)
+    print(f"Totals cover the {len(cases) - len(invalid_cases)} of {len(cases)} case(s) where every engine's "
+          f"path is valid; {len(invalid_cases)} case(s) with an INVALID PATH are excluded", file=log)
+
+
+def compare(records, baseline):
+    """
+    Print the speedup of every case present in both result sets, and the
+    total speedup over the cases whose path is valid in both. Cases invalid
+    on either side are flagged and left out of the total.
+    """
+    def key(r):
+        return r["map_type"], r["size"], r["density"], r["seed"], r.get("max_cost", 1), r["engine"]
+
+    before = {key(r): r for r in baseline}
+    old_total = new_total = 0.0
+    excluded = 0
+    for record in records:
+        old = before.get(key(record))
+        if old is None:
+            continue
+        speedup = old["seconds"] / record["seconds"] if record["seconds"] else math.inf
+        valid = old["valid"] and record["valid"]
+        if valid:
+            old_total += old["seconds"]
+            new_total += record["seconds"]
+        else:
+            excluded += 1
+        print(f"{record['map_type']:8} {record['size']:5} {record['density']:4} {record['engine']:24} "
+              f"{old['seconds'] * 1000:10.2f} -> {record['seconds'] * 1000:10.2f} ms  x{speedup:.2f}  "
+              f"nodes {old['nodes_expanded']} -> {record['nodes_expanded']}  "
+              f"pushes {old['heap_pushes']} -> {record['heap_pushes']}  "
+              f"pops {old['heap_pops']} -> {record['heap_pops']}"
+              + ("" if valid else "  INVALID PATH (excluded from total)"))
+    if new_total:
+        print(f"total over cases valid in both: {old_total * 1000:.2f} -> {new_total * 1000:.2f} ms  "
+              f"x{old_total / new_total:.2f}" + (f"  ({excluded} invalid case(s) excluded)" if excluded else ""))
+    elif excluded:
+        print(f"no case is valid in both runs; all {excluded} were excluded from the total")
+
+
+def parse_list(text, cast):
+    return [cast(v) for v in text.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated square grid sizes")
+    parser.add_argument("--densities", default=",".join(map(str, DEFAULT_DENSITIES)),
+                        help="comma-separated obstacle densities (fraction of cells)")
+    parser.add_argument("--map-types", default="uniform",
+                        help=f"comma-separated map types ({', '.join(GENERATORS)})")
+    parser.add_argument("--engines", default=",".join(ENGINES),
+                        help="comma-separated engines")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-cost", type=int, default=1,
+                        help="highest terrain cost; 1 benchmarks unit-cost maps")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case; the best is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--no-verify", action="store_true", help="skip the reference searches")
+    parser.add_argument("--out", default="benchmark.json", help="results file")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    engines = parse_list(args.engines, str)
+    unknown = [name for name in engines if name not in ENGINES]
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(unknown)}")
+
+    records = run_benchmarks(parse_list(args.sizes, int), parse_list(args.densities, float),
+                             parse_list(args.map_types, str), engines, args.seed,
+                             args.repeat, not args.no_memory, not args.no_verify,
+                             max_cost=args.max_cost)
+    with open(args.out, "w") as f:
+        json.dump({
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "results": records,
+        }, f, indent=1)
+
+    summarize(records, sys.stderr)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(records, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+CPU-bound work (map generation, whole-trace searches, distance fields) run
+off the event loop.
+
+Jobs go to a ProcessPoolExecutor so a large map never blocks the worker's
+other requests. Grids cross the process boundary through shared memory: the
+parent writes the padded walkable flags, followed by the terrain costs on
+weighted maps (or the worker writes a generated grid or terrain) into a
+SharedMemory block and only its name is pickled. Small jobs run inline,
+where process hand-off would cost more than the work itself.
+"""
+import asyncio
+import math
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+
+from distance_field import DistanceField, compute_distance_field
+from grid import FlatGrid
+from map_generators import generate_grid, generate_terrain
+from search_stats import SearchStats
+from session_backend import pack_path, pack_steps, unpack_path, unpack_steps
+from trace_store import StoredTrace
+
+INLINE_CELLS = 10_000  # Jobs on grids up to this many cells skip the pool
+
+
+def _attach(name):
+    return shared_memory.SharedMemory(name=name)
+
+
+def _generate_into(name, rows, cols, obstacle_count, map_type, seed):
+    shm = _attach(name)
+    try:
+        grid = generate_grid(rows, cols, obstacle_count, map_type, seed)
+        np.ndarray((rows, cols), dtype=np.uint8, buffer=shm.buf)[:] = grid
+    finally:
+        shm.close()
+
+
+def _terrain_into(name, rows, cols, max_cost, seed):
+    shm = _attach(name)
+    try:
+        np.ndarray((rows, cols), dtype=np.uint8, buffer=shm.buf)[:] = generate_terrain(rows, cols, max_cost, seed)
+    finally:
+        shm.close()
+
+
+def _shared_flat(name, rows, cols, weighted) -> FlatGrid:
+    shm = _attach(name)
+    try:
+        size = (rows + 2) * (cols + 2)
+        costs = bytes(shm.buf[size:2 * size]) if weighted else None
+        return FlatGrid.from_walkable(rows, cols, shm.buf, costs)
+    finally:
+        shm.close()
+
+
+def _trace_shared(name, rows, cols, weighted, engine, start, end):
+    # Engines are module-level functions, so they pickle by name
+    flat = _shared_flat(name, rows, cols, weighted)
+    trace = StoredTrace(flat, engine, start, end)
+    trace.stats = SearchStats()
+    trace.ensure(math.inf)
+    return pack_steps(trace.steps, rows, cols), pack_path(trace.path, cols), trace.stats.as_dict()
+
+
+def _distance_field_shared(name, rows, cols, weighted, root):
+    field = compute_distance_field(_shared_flat(name, rows, cols, weighted), root)
+    return field.distances.tobytes(), field.parents.tobytes()
+
+
+class ComputePool:
+    """
+    Runs CPU-bound jobs in a process pool and returns them as awaitables.
+
+    :param workers: Worker processes; 0 runs every job inline.
+    :param inline_cells: Grids up to this many cells are always run inline.
+    """
+    def __init__(self, workers: int, inline_cells: int = INLINE_CELLS):
+        self.workers = workers
+        self.inline_cells = inline_cells
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def _use_pool(self, rows, cols) -> bool:
+        return self.workers > 0 and rows * cols > self.inline_cells
+
+    async def _run(self, job, *args):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, job, *args)
+
+    async def _run_shared_flat(self, flat, job, *args):
+        weighted = flat.costs is not None
+        shm = shared_memory.SharedMemory(create=True, size=flat.size * (2 if weighted else 1))
+        try:
+            shm.buf[:flat.size] = flat.walkable
+            if weighted:
+                shm.buf[flat.size:2 * flat.size] = flat.costs
+            return await self._run(job, shm.name, flat.rows, flat.cols, weighted, *args)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def generate_grid(self, rows, cols, obstacle_count, map_type="uniform", seed=None) -> np.ndarray:
+        """
+        map_generators.generate_grid, written by the worker straight into shared memory.
+        """
+        if not self._use_pool(rows, cols):
+            return generate_grid(rows, cols, obstacle_count, map_type, seed)
+        shm = shared_memory.SharedMemory(create=True, size=rows * cols)
+        try:
+            await self._run(_generate_into, shm.name, rows, cols, obstacle_count, map_type, seed)
+            return np.ndarray((rows, cols), dtype=np.uint8, buffer=shm.buf).astype(int)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def generate_terrain(self, rows, cols, max_cost, seed=None) -> np.ndarray:
+        """
+        map_generators.generate_terrain, written by the worker straight into shared memory.
+        """
+        if not self._use_pool(rows, cols):
+            return generate_terrain(rows, cols, max_cost, seed)
+        shm = shared_memory.SharedMemory(create=True, size=rows * cols)
+        try:
+            await self._run(_terrain_into, shm.name, rows, cols, max_cost, seed)
+            return np.ndarray((rows, cols), dtype=np.uint8, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def fill_trace(self, trace: StoredTrace, count):
+        """
+        Make at least `count` steps of the trace available. Inline this runs
+        the search just that far; on the pool the whole search runs at once
+        and its steps and path are stored on the trace.
+        """
+        flat = trace.flat
+        if trace.completed or len(trace.steps) >= count:
+            return
+        if not self._use_pool(flat.rows, flat.cols):
+            trace.ensure(count)
+            return
+        steps, path, counts = await self._run_shared_flat(flat, _trace_shared, trace.engine,
+                                                          trace.start, trace.end)
+        if not trace.completed:
+            trace.steps = unpack_steps(steps)
+            if trace.stats is not None:
+                trace.stats = SearchStats()  # Drop counts of any partial in-process run
+                trace.stats.add(counts)
+            trace.finish(unpack_path(path, flat.cols))
+
+    async def distance_field(self, flat, root) -> DistanceField:
+        """
+        distance_field.compute_distance_field on the pool.
+        """
+        if not self._use_pool(flat.rows, flat.cols):
+            return compute_distance_field(flat, root)
+        distance_bytes, parent_bytes = await self._run_shared_flat(flat, _distance_field_shared, tuple(root))
+        distances = array("q")
+        distances.frombytes(distance_bytes)
+        parents = array("i")
+        parents.frombytes(parent_bytes)
+        return DistanceField(flat, root, distances, parents)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+
+def create_compute_pool() -> ComputePool:
+    """
+    Pool sized by $PATHFINDING_WORKERS (default: one per CPU, 0 to disable).
+    """
+    workers = os.environ.get("PATHFINDING_WORKERS")
+    return ComputePool(int(workers) if workers is not None else (os.cpu_count() or 1))
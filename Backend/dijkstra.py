@@ -1,96 +1,416 @@
-import heapq
 from collections import defaultdict
 
+from grid import as_flat_grid, collect_steps
+from radix_heap import RadixHeap
+
 class PathResult:
     """
     Container for path finding results.
     
     :param shortest_path: List of coordinates representing the path.
     :param step_info: Dictionary containing step-by-step information of the algorithm.
+    :param step_frontier: For bidirectional searches, the same level -> "x,y" layout
+                          as step_info, mapping each expanded node to "forward" or "backward".
     """
-    def __init__(self, shortest_path, step_info):
+    def __init__(self, shortest_path, step_info, step_frontier=None):
         self.shortest_path = shortest_path
         self.step_info = step_info
+        self.step_frontier = step_frontier
+
+class BucketQueue:
+    """
+    Monotone bucket queue for unit edge costs (Dial's algorithm), for searches
+    that interleave pops from several queues.
+
+    With every edge costing 1, only two buckets are ever live: the distance
+    level being popped and the next one, so push and pop are O(1) and there are
+    no priority comparisons or stale entries.
+
+    :param item: Initial item, at distance 0.
+    """
+    def __init__(self, item):
+        self.distance = 0  # Distance of the bucket being popped
+        self.current = [item]
+        self.position = 0
+        self.next = []
+
+    def __bool__(self):
+        return self.position < len(self.current) or bool(self.next)
+
+    def peek_distance(self):
+        """
+        Distance of the next item pop() will return.
+        """
+        return self.distance if self.position < len(self.current) else self.distance + 1
+
+    def push(self, item):
+        """
+        Queue an item one step further than the current bucket.
+        """
+        self.next.append(item)
 
-def dijkstra_algorithm(grid, start, end):
+    def pop(self):
+        """
+        Remove and return (distance, item) for the closest queued item.
+        """
+        if self.position == len(self.current):
+            self.current, self.next = self.next, []
+            self.position = 0
+            self.distance += 1
+        item = self.current[self.position]
+        self.position += 1
+        return self.distance, item
+
+FRONTIERS = ("forward", "backward")
+
+def dijkstra_algorithm(grid, start, end, bidirectional=False, stats=None):
     """
-    Dijkstra's algorithm for a 20x20 grid with obstacles and intermediate steps logged.
+    Dijkstra's algorithm for a grid with obstacles and intermediate steps logged.
     
-    :param grid: 2D list representing the maze where 6 represents obstacles.
+    :param grid: 2D list representing the maze where 6 represents obstacles, or a FlatGrid.
     :param start: Tuple (x, y) representing start position.
     :param end: Tuple (x, y) representing end position.
-    :return: PathResult object containing shortest path and step information.
+    :param bidirectional: Search from both endpoints and meet in the middle.
+    :param stats: Optional SearchStats to add this search's work counters to.
+    :return: PathResult object containing shortest path and step information,
+             with step_info levels 1, 2, ... holding the nodes at distance 0, 1, ...
+             On weighted maps a move costs the terrain cost of the cell entered.
     """
-    size = len(grid)
-    visited = set()
-    distances = defaultdict(lambda: float('inf'))
-    distances[start] = 0
-    parent = {}
-    priority_queue = [(0, start)]  # (distance, (x, y))
-    level_nodes = defaultdict(dict)  # Stores nodes by their distance level
-    current_level = 0
-
-    def get_valid_neighbors(node):
-        """
-        Returns valid neighboring coordinates for a given node.
-        
-        :param node: Tuple (x, y) representing current position.
-        :return: List of valid neighboring coordinates.
-        """
-        x, y = node
-        valid_neighbors = []
-        for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:  # Up, Down, Left, Right
-            nx, ny = x + dx, y + dy
-            if (
-                0 <= nx < size and 
-                0 <= ny < size and 
-                grid[nx][ny] != 6  # Not an obstacle
-            ):
-                valid_neighbors.append((nx, ny))
-        return valid_neighbors
-
-    while priority_queue:
-        current_distance, current_node = heapq.heappop(priority_queue)
-        
-        if current_node in visited:
+    flat = as_flat_grid(grid)
+    if bidirectional:
+        return bidirectional_dijkstra(flat, start, end, stats)
+    step_info = {}
+    path = collect_steps(dijkstra_steps(flat, start, end, stats), step_info)
+    return PathResult(path, step_info)
+
+def dijkstra_steps(grid, start, end, stats=None):
+    """
+    Generator form of dijkstra_algorithm that yields each level as soon as it
+    is complete, so callers can stream the trace instead of holding it.
+
+    :yield: Tuples (level, {"x,y": [[next_x, next_y], ...]}).
+    :return: The shortest path (via StopIteration.value / yield from).
+    """
+    flat = as_flat_grid(grid)
+    if flat.costs is not None:
+        return (yield from weighted_dijkstra_steps(flat, start, end, stats))
+    walkable = flat.walkable
+    offsets = flat.offsets4  # Up, Down, Left, Right
+    source = flat.index(*start)
+    target = flat.index(*end)
+
+    visited = bytearray(flat.size)
+    distances = flat.new_scores()
+    distances[source] = 0
+    parent = flat.new_parents()
+
+    # Dial's algorithm with unit costs: walk the distance buckets in order.
+    # A node's first queued distance is final, so there are no stale entries.
+    bucket = [source]
+    current_distance = 0
+    pops = pushes = 0  # Counted per level, not per node
+    while bucket:
+        next_bucket = []
+        new_distance = current_distance + 1
+        level_nodes = {}  # Step information of this distance level
+        pops += len(bucket)
+
+        for current_node in bucket:
+            visited[current_node] = 1
+
+            if current_node == target:
+                pops -= len(bucket) - bucket.index(current_node) - 1
+                next_bucket = []
+                break
+
+            # Log all possible paths from the current node
+            next_nodes = []
+
+            for offset in offsets:
+                neighbor = current_node + offset
+                if walkable[neighbor] and not visited[neighbor]:
+                    next_nodes.append(neighbor)
+
+                    if new_distance < distances[neighbor]:
+                        distances[neighbor] = new_distance
+                        parent[neighbor] = current_node
+                        next_bucket.append(neighbor)
+
+            # Store step information for visualization
+            if next_nodes:
+                level_nodes[flat.cell_key(current_node)] = [
+                    flat.cell_list(n) for n in next_nodes
+                ]
+
+        if level_nodes:
+            yield new_distance, level_nodes
+        pushes += len(next_bucket)
+        bucket = next_bucket
+        current_distance = new_distance
+
+    if stats is not None:
+        stats.nodes_expanded += pops
+        stats.heap_pops += pops
+        stats.heap_pushes += pushes + 1  # The source was queued too
+    
+    # Reconstruct the shortest path
+    if parent[target] == -1:
+        return [tuple(start)]
+    return flat.trace_path(parent, target)
+
+
+def weighted_dijkstra_steps(flat, start, end, stats=None):
+    """
+    dijkstra_steps for a map with terrain costs, where moving into a cell
+    costs flat.costs of that cell.
+
+    Distances are integers and never decrease as nodes are popped, so the
+    queue is a RadixHeap. Levels are still distance + 1, but only distances
+    some node actually has appear.
+
+    :yield: Tuples (level, {"x,y": [[next_x, next_y], ...]}).
+    :return: The shortest path (via StopIteration.value / yield from).
+    """
+    walkable = flat.walkable
+    costs = flat.costs
+    offsets = flat.offsets4
+    source = flat.index(*start)
+    target = flat.index(*end)
+
+    visited = bytearray(flat.size)
+    distances = flat.new_scores()
+    distances[source] = 0
+    parent = flat.new_parents()
+
+    queue = RadixHeap()
+    queue.push(0, source)
+    pops = pushes = stale = 0
+    level_distance = 0
+    level_nodes = {}
+
+    while queue:
+        distance, current_node = queue.pop()
+        pops += 1
+        if visited[current_node]:
+            stale += 1
             continue
-            
-        visited.add(current_node)
-        
-        if current_node == end:
+        visited[current_node] = 1
+
+        if distance != level_distance:
+            if level_nodes:
+                yield level_distance + 1, level_nodes
+            level_distance = distance
+            level_nodes = {}
+
+        if current_node == target:
             break
-            
-        # Log all possible paths from the current node
-        neighbors = get_valid_neighbors(current_node)
+
         next_nodes = []
-        
-        for neighbor in neighbors:
-            if neighbor not in visited:
-                new_distance = current_distance + 1
+        for offset in offsets:
+            neighbor = current_node + offset
+            if walkable[neighbor] and not visited[neighbor]:
                 next_nodes.append(neighbor)
-                
+
+                new_distance = distance + costs[neighbor]
                 if new_distance < distances[neighbor]:
                     distances[neighbor] = new_distance
                     parent[neighbor] = current_node
-                    heapq.heappush(priority_queue, (new_distance, neighbor))
-        
-        # Store step information for visualization
+                    queue.push(new_distance, neighbor)
+                    pushes += 1
+
         if next_nodes:
-            if current_distance not in level_nodes:
-                current_level += 1
-            level_nodes[current_level][f"{current_node[0]},{current_node[1]}"] = [
-                [n[0], n[1]] for n in next_nodes
+            level_nodes[flat.cell_key(current_node)] = [
+                flat.cell_list(n) for n in next_nodes
             ]
-    
-    # Convert level_nodes to final step_info format
-    step_info = {level: node_dict for level, node_dict in level_nodes.items()}
-    
-    # Reconstruct the shortest path
-    path = []
-    current = end
-    while current in parent:
-        path.append(current)
-        current = parent[current]
-    path.append(start)
-    
-    return PathResult(path[::-1], step_info)
\ No newline at end of file
+
+    if level_nodes:
+        yield level_distance + 1, level_nodes
+
+    if stats is not None:
+        stats.nodes_expanded += pops - stale
+        stats.heap_pops += pops
+        stats.stale_pops += stale
+        stats.heap_pushes += pushes + 1
+
+    if parent[target] == -1:
+        return [tuple(start)]
+    return flat.trace_path(parent, target)
+
+
+def bidirectional_dijkstra(flat, start, end, stats=None):
+    """
+    Dijkstra's algorithm searching from start and end at once.
+
+    Each round pops from the side with the smaller frontier. Every edge
+    that links a node to one reached by the other side is a candidate meeting
+    point, and the search stops once the two smallest frontier distances add
+    up to at least the best candidate, at which point it is optimal.
+
+    :param flat: FlatGrid of the map.
+    :param start: Tuple (x, y) representing start position.
+    :param end: Tuple (x, y) representing end position.
+    :param stats: Optional SearchStats to add this search's work counters to.
+    :return: PathResult whose step_info levels are distances from the expanding
+             side's endpoint, with step_frontier telling the two sides apart.
+    """
+    if flat.costs is not None:
+        return bidirectional_weighted_dijkstra(flat, start, end, stats)
+    walkable = flat.walkable
+    offsets = flat.offsets4
+    source = flat.index(*start)
+    target = flat.index(*end)
+
+    distances = (flat.new_scores(), flat.new_scores())
+    parents = (flat.new_parents(), flat.new_parents())
+    visited = (bytearray(flat.size), bytearray(flat.size))
+    queues = (BucketQueue(source), BucketQueue(target))
+    distances[0][source] = 0
+    distances[1][target] = 0
+    step_info = defaultdict(dict)
+    step_frontier = defaultdict(dict)
+
+    best = 0 if source == target else float('inf')
+    meeting = (source, source)  # (forward-side node, backward-side node)
+    pops = pushes = 0
+
+    while queues[0] and queues[1]:
+        if queues[0].peek_distance() + queues[1].peek_distance() >= best:
+            break
+
+        side = 0 if len(queues[0].next) <= len(queues[1].next) else 1
+        other = 1 - side
+        current_distance, current_node = queues[side].pop()
+        pops += 1
+        visited[side][current_node] = 1
+
+        own, theirs = distances[side], distances[other]
+        next_nodes = []
+        new_distance = current_distance + 1
+
+        for offset in offsets:
+            neighbor = current_node + offset
+            if not walkable[neighbor]:
+                continue
+
+            if not visited[side][neighbor]:
+                next_nodes.append(neighbor)
+                if new_distance < own[neighbor]:
+                    own[neighbor] = new_distance
+                    parents[side][neighbor] = current_node
+                    queues[side].push(neighbor)
+                    pushes += 1
+
+            # Candidate meeting edge current_node -> neighbor
+            if new_distance + theirs[neighbor] < best:
+                best = new_distance + theirs[neighbor]
+                meeting = (current_node, neighbor) if side == 0 else (neighbor, current_node)
+
+        if next_nodes:
+            level = current_distance + 1
+            key = flat.cell_key(current_node)
+            step_info[level][key] = [flat.cell_list(n) for n in next_nodes]
+            step_frontier[level][key] = FRONTIERS[side]
+
+    if stats is not None:
+        stats.nodes_expanded += pops
+        stats.heap_pops += pops
+        stats.heap_pushes += pushes + 2  # Both endpoints were queued too
+
+    if best == float('inf'):
+        return PathResult([tuple(start)], dict(step_info), dict(step_frontier))
+
+    # Join start -> meeting[0] with meeting[1] -> end
+    forward_node, backward_node = meeting
+    path = flat.trace_path(parents[0], forward_node)
+    if backward_node != forward_node:
+        path.extend(reversed(flat.trace_path(parents[1], backward_node)))
+
+    return PathResult(path, dict(step_info), dict(step_frontier))
+
+
+def bidirectional_weighted_dijkstra(flat, start, end, stats=None):
+    """
+    bidirectional_dijkstra for a map with terrain costs.
+
+    Each side pops from its own RadixHeap, choosing the side with the smaller
+    next distance. The backward side walks edges in reverse, so moving from a
+    node to its neighbour costs the node's own terrain cost there.
+    """
+    walkable = flat.walkable
+    costs = flat.costs
+    offsets = flat.offsets4
+    source = flat.index(*start)
+    target = flat.index(*end)
+
+    distances = (flat.new_scores(), flat.new_scores())
+    parents = (flat.new_parents(), flat.new_parents())
+    visited = (bytearray(flat.size), bytearray(flat.size))
+    queues = (RadixHeap(), RadixHeap())
+    queues[0].push(0, source)
+    queues[1].push(0, target)
+    distances[0][source] = 0
+    distances[1][target] = 0
+    step_info = defaultdict(dict)
+    step_frontier = defaultdict(dict)
+
+    best = 0 if source == target else float('inf')
+    meeting = (source, source)  # (forward-side node, backward-side node)
+    pops = pushes = stale = 0
+
+    while queues[0] and queues[1]:
+        forward_key, backward_key = queues[0].peek_key(), queues[1].peek_key()
+        if forward_key + backward_key >= best:
+            break
+
+        side = 0 if forward_key <= backward_key else 1
+        other = 1 - side
+        current_distance, current_node = queues[side].pop()
+        pops += 1
+        if visited[side][current_node]:
+            stale += 1
+            continue
+        visited[side][current_node] = 1
+
+        own, theirs = distances[side], distances[other]
+        next_nodes = []
+
+        for offset in offsets:
+            neighbor = current_node + offset
+            if not walkable[neighbor]:
+                continue
+
+            new_distance = current_distance + (costs[neighbor] if side == 0 else costs[current_node])
+            if not visited[side][neighbor]:
+                next_nodes.append(neighbor)
+                if new_distance < own[neighbor]:
+                    own[neighbor] = new_distance
+                    parents[side][neighbor] = current_node
+                    queues[side].push(new_distance, neighbor)
+                    pushes += 1
+
+            # Candidate meeting edge current_node -> neighbor
+            if new_distance + theirs[neighbor] < best:
+                best = new_distance + theirs[neighbor]
+                meeting = (current_node, neighbor) if side == 0 else (neighbor, current_node)
+
+        if next_nodes:
+            level = current_distance + 1
+            key = flat.cell_key(current_node)
+            step_info[level][key] = [flat.cell_list(n) for n in next_nodes]
+            step_frontier[level][key] = FRONTIERS[side]
+
+    if stats is not None:
+        stats.nodes_expanded += pops - stale
+        stats.heap_pops += pops
+        stats.stale_pops += stale
+        stats.heap_pushes += pushes + 2
+
+    if best == float('inf'):
+        return PathResult([tuple(start)], dict(step_info), dict(step_frontier))
+
+    forward_node, backward_node = meeting
+    path = flat.trace_path(parents[0], forward_node)
+    if backward_node != forward_node:
+        path.extend(reversed(flat.trace_path(parents[1], backward_node)))
+
+    return PathResult(path, dict(step_info), dict(step_frontier))
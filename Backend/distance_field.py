@@ -0,0 +1,199 @@
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from grid import as_flat_grid
+from radix_heap import RadixHeap
+
+UNREACHED = -1  # Distance and parent of cells the sweep never reached
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class DistanceField:
+    """
+    Distances and parents of every cell with respect to a single root cell.
+
+    Parents point one step towards the root, so a field built from the goal
+    answers "shortest path from here to the goal" for any start with a walk
+    along the parent chain.
+
+    :param flat: FlatGrid the field was computed on.
+    :param root: Tuple (x, y) the sweep started from.
+    :param distances: array("q") of per-cell distance to root (UNREACHED if unreachable).
+    :param parents: array("i") of per-cell index of the next cell towards root (UNREACHED for none).
+    """
+    def __init__(self, flat, root, distances: array, parents: array):
+        self.flat = flat
+        self.root = tuple(root)
+        self.distances = distances
+        self.parents = parents
+
+    @property
+    def nbytes(self):
+        # The FlatGrid belongs to the session, not the field
+        return (len(self.distances) * self.distances.itemsize
+                + len(self.parents) * self.parents.itemsize)
+
+    def distance(self, x, y) -> Optional[int]:
+        """
+        Distance from (x, y) to the root, or None if unreachable or off the grid.
+        """
+        if not self.flat.in_bounds(x, y):
+            return None
+        d = self.distances[self.flat.index(x, y)]
+        return None if d == UNREACHED else d
+
+    def path_from(self, x, y) -> List[Tuple[int, int]]:
+        """
+        Shortest path from (x, y) to the root, both included; [] if unreachable.
+        """
+        if self.distance(x, y) is None:
+            return []
+        path = []
+        current = self.flat.index(x, y)
+        while current != UNREACHED:
+            path.append(self.flat.coords(current))
+            current = self.parents[current]
+        return path
+
+    def distance_grid(self) -> List[List[int]]:
+        """
+        Distances as a rows x cols list, with -1 for unreachable cells.
+        """
+        flat = self.flat
+        grid = []
+        for x in range(flat.rows):
+            base = flat.index(x, 0)
+            grid.append(self.distances[base:base + flat.cols].tolist())
+        return grid
+
+    def parent_grid(self) -> List[List[Optional[List[int]]]]:
+        """
+        Parents as a rows x cols list of [x, y] pairs, None where there is no parent.
+        """
+        flat = self.flat
+        grid = []
+        for x in range(flat.rows):
+            base = flat.index(x, 0)
+            grid.append([None if p == UNREACHED else flat.cell_list(p)
+                         for p in self.parents[base:base + flat.cols]])
+        return grid
+
+
+def compute_distance_field(grid, root) -> DistanceField:
+    """
+    One BFS sweep (Dijkstra with unit costs, 4-connected) from root over the
+    whole grid, walking the distance buckets in order. On maps with terrain
+    costs the sweep is a Dijkstra over a RadixHeap instead.
+
+    :param grid: 2D list, NumPy array or FlatGrid of the map.
+    :param root: Tuple (x, y) to sweep from, usually the goal.
+    :return: DistanceField covering every reachable cell.
+    """
+    flat = as_flat_grid(grid)
+    walkable = flat.walkable
+    offsets = flat.offsets4
+    source = flat.index(*root)
+
+    # 8 + 4 bytes per cell, rather than two lists of Python objects; weighted
+    # distances can pass 2**31 on the largest maps
+    distances = array("q", [UNREACHED]) * flat.size
+    parents = array("i", [UNREACHED]) * flat.size
+    distances[source] = 0
+    if flat.costs is not None:
+        _weighted_sweep(flat, source, distances, parents)
+        return DistanceField(flat, root, distances, parents)
+
+    bucket = [source]
+    current_distance = 0
+    while bucket:
+        next_bucket = []
+        current_distance += 1
+        for current_node in bucket:
+            for offset in offsets:
+                neighbor = current_node + offset
+                if walkable[neighbor] and distances[neighbor] == UNREACHED:
+                    distances[neighbor] = current_distance
+                    parents[neighbor] = current_node
+                    next_bucket.append(neighbor)
+        bucket = next_bucket
+
+    return DistanceField(flat, root, distances, parents)
+
+
+def _weighted_sweep(flat, source, distances, parents):
+    # Paths lead towards the root, so stepping from a neighbour onto
+    # current_node costs current_node's terrain
+    walkable = flat.walkable
+    costs = flat.costs
+    offsets = flat.offsets4
+    queue = RadixHeap()
+    queue.push(0, source)
+    while queue:
+        distance, current_node = queue.pop()
+        if distance > distances[current_node]:
+            continue  # Stale entry
+        new_distance = distance + costs[current_node]
+        for offset in offsets:
+            neighbor = current_node + offset
+            if walkable[neighbor] and (distances[neighbor] == UNREACHED or new_distance < distances[neighbor]):
+                distances[neighbor] = new_distance
+                parents[neighbor] = current_node
+                queue.push(new_distance, neighbor)
+
+
+class DistanceFieldCache:
+    """
+    LRU cache of distance fields keyed by map digest and root, bounded by
+    memory: least recently used fields are dropped while the fields' nbytes
+    add up to more than `max_bytes`. The newest field is always kept.
+
+    :param max_bytes: Memory budget for all cached fields.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.fields = OrderedDict()
+        self.bytes_in_use = 0
+
+    def get(self, grid, root) -> DistanceField:
+        flat = as_flat_grid(grid)
+        field = self.lookup(flat, root)
+        if field is None:
+            field = compute_distance_field(flat, root)
+            self.store(flat, root, field)
+        return field
+
+    def lookup(self, flat, root) -> Optional[DistanceField]:
+        """
+        The cached field for this map and root, or None.
+        """
+        key = (flat.digest(), tuple(root))
+        field = self.fields.get(key)
+        if field is not None:
+            self.fields.move_to_end(key)
+        return field
+
+    def store(self, flat, root, field: DistanceField):
+        """
+        Cache a field computed elsewhere (e.g. on the compute pool).
+        """
+        key = (flat.digest(), tuple(root))
+        old = self.fields.pop(key, None)
+        if old is not None:
+            self.bytes_in_use -= old.nbytes
+        self.fields[key] = field
+        self.bytes_in_use += field.nbytes
+        while self.bytes_in_use > self.max_bytes and len(self.fields) > 1:
+            _, evicted = self.fields.popitem(last=False)
+            self.bytes_in_use -= evicted.nbytes
+
+
+distance_fields = DistanceFieldCache()
+
+
+def get_distance_field(grid, root) -> DistanceField:
+    """
+    Cached compute_distance_field: repeated queries on the same map and root
+    reuse one sweep and only pay for the parent-chain walk.
+    """
+    return distance_fields.get(grid, root)
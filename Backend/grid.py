@@ -0,0 +1,222 @@
+import hashlib
+import math
+
+OBSTACLE = 6  # Grid status number for obstacles (see README)
+SQRT2 = math.sqrt(2)
+MAX_COST = 255  # Terrain costs are stored one byte per cell
+MAX_CELLS = 4096 * 4096  # Largest rows * cols accepted; fits 4000x4000
+
+
+class FlatGrid:
+    """
+    Flat, array-backed view of a 2D grid shared by the search engines.
+
+    Cells live in a single bytearray of walkable flags surrounded by a one-cell
+    sentinel border, so cell (x, y) has index (x + 1) * stride + (y + 1) and a
+    neighbour probe never needs a bounds check: border cells are never walkable.
+
+    Weighted maps also carry `costs`, a padded bytearray in the same layout
+    holding the integer cost (1 to MAX_COST) of moving into each cell. On
+    unit-cost maps `costs` is None and engines take their unweighted paths.
+
+    :param grid: 2D list (or NumPy array) where `obstacle` marks blocked cells.
+    :param obstacle: Cell value treated as an obstacle.
+    :param costs: Optional 2D per-cell terrain costs, the same shape as grid.
+    """
+    def __init__(self, grid, obstacle=OBSTACLE, costs=None):
+        rows = len(grid)
+        cols = len(grid[0]) if rows else 0
+        stride = cols + 2
+
+        self.rows = rows
+        self.cols = cols
+        self.stride = stride
+        self.size = (rows + 2) * stride
+        self.walkable = bytearray(self.size)
+
+        if hasattr(grid, "shape"):
+            # NumPy input: build the interior in one vectorised pass
+            import numpy as np
+            padded = np.zeros((rows + 2, stride), dtype=np.uint8)
+            padded[1:-1, 1:-1] = np.asarray(grid) != obstacle
+            self.walkable[:] = padded.tobytes()
+        else:
+            for x, row in enumerate(grid):
+                base = (x + 1) * stride + 1
+                self.walkable[base:base + cols] = bytes(v != obstacle for v in row)
+
+        self.costs = None
+        self.min_cost = 1
+        if costs is not None:
+            self._set_costs(costs)
+        self._init_tables()
+
+    @classmethod
+    def from_walkable(cls, rows, cols, walkable, costs=None):
+        """
+        Rebuild a FlatGrid from another one's padded `walkable` flags (and
+        `costs`), e.g. when they are handed to a worker process through
+        shared memory.
+        """
+        flat = cls.__new__(cls)
+        flat.rows = rows
+        flat.cols = cols
+        flat.stride = cols + 2
+        flat.size = (rows + 2) * flat.stride
+        flat.walkable = bytearray(walkable[:flat.size])
+        flat.costs = None
+        flat.min_cost = 1
+        if costs is not None:
+            flat.costs = bytearray(costs[:flat.size])
+            # Border cells hold 0; the smallest real cost is the first one present
+            flat.min_cost = next(c for c in range(1, MAX_COST + 1) if flat.costs.find(c) != -1)
+        flat._init_tables()
+        return flat
+
+    def _set_costs(self, costs):
+        import numpy as np
+        costs = np.asarray(costs)
+        if costs.shape != (self.rows, self.cols):
+            raise ValueError("Terrain costs must have the grid's shape")
+        if not costs.size or costs.max() == 1:
+            return  # Uniform terrain: keep the unit-cost engines
+        if costs.min() < 1 or costs.max() > MAX_COST:
+            raise ValueError(f"Terrain costs must be 1 to {MAX_COST}")
+        padded = np.zeros((self.rows + 2, self.stride), dtype=np.uint8)
+        padded[1:-1, 1:-1] = costs
+        self.costs = bytearray(padded.tobytes())
+        self.min_cost = int(costs.min())
+
+    def _init_tables(self):
+        stride = self.stride
+        # Up, Down, Left, Right
+        self.offsets4 = (-stride, stride, -1, 1)
+        # Row-major order of the 8 surrounding cells, with matching step costs
+        self.offsets8 = (
+            -stride - 1, -stride, -stride + 1,
+            -1,                   1,
+            stride - 1,  stride,  stride + 1,
+        )
+        self.costs8 = (SQRT2, 1, SQRT2, 1, 1, SQRT2, 1, SQRT2)
+        self._digest = None
+
+    def digest(self):
+        """
+        Content hash of the map's shape and obstacles, computed once.
+
+        Used to key per-map caches, so equal maps share cached results.
+        """
+        if self._digest is None:
+            digest = hashlib.sha1(f"{self.rows}x{self.cols}:".encode())
+            digest.update(self.walkable)
+            if self.costs is not None:
+                digest.update(self.costs)
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    @property
+    def nbytes(self):
+        return len(self.walkable) + (len(self.costs) if self.costs is not None else 0)
+
+    def cost_grid(self):
+        """
+        Terrain costs as a 2D list, or None on a unit-cost map.
+        """
+        if self.costs is None:
+            return None
+        stride = self.stride
+        return [list(self.costs[(x + 1) * stride + 1:(x + 1) * stride + 1 + self.cols])
+                for x in range(self.rows)]
+
+    def index(self, x, y):
+        """
+        Convert grid coordinates to a flat cell index.
+        """
+        return (x + 1) * self.stride + (y + 1)
+
+    def coords(self, i):
+        """
+        Convert a flat cell index back to grid coordinates.
+        """
+        x, y = divmod(i, self.stride)
+        return x - 1, y - 1
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.rows and 0 <= y < self.cols
+
+    def is_walkable(self, x, y):
+        return self.in_bounds(x, y) and self.walkable[self.index(x, y)] == 1
+
+    def set_walkable(self, x, y, walkable):
+        """
+        Open or block one cell. The digest is recomputed on next use, so
+        per-map caches see an edited map as a different one; anything else
+        holding this grid sees the edit too, so callers that share grids
+        should edit a copy (see from_walkable).
+        """
+        self.walkable[self.index(x, y)] = 1 if walkable else 0
+        self._digest = None
+
+    def cell_key(self, i):
+        """
+        Format a cell index as the "x,y" key used in step_info.
+        """
+        x, y = divmod(i, self.stride)
+        return f"{x - 1},{y - 1}"
+
+    def cell_list(self, i):
+        """
+        Format a cell index as the [x, y] pair used in step_info.
+        """
+        x, y = divmod(i, self.stride)
+        return [x - 1, y - 1]
+
+    def new_scores(self, value=math.inf):
+        """
+        Allocate a per-cell score array (g-score, distance, ...).
+        """
+        return [value] * self.size
+
+    def new_parents(self):
+        """
+        Allocate a per-cell parent array; -1 means "no parent".
+        """
+        return [-1] * self.size
+
+    def trace_path(self, parent, end):
+        """
+        Follow parent links back from `end` and return the path as coordinates,
+        ordered from the root of the parent chain to `end`.
+        """
+        path = []
+        current = end
+        while current != -1:
+            path.append(self.coords(current))
+            current = parent[current]
+        path.reverse()
+        return path
+
+
+def as_flat_grid(grid, obstacle=OBSTACLE, costs=None):
+    """
+    Return `grid` as a FlatGrid, reusing it if it already is one.
+    """
+    if isinstance(grid, FlatGrid):
+        return grid
+    return FlatGrid(grid, obstacle, costs)
+
+
+def collect_steps(steps, step_info):
+    """
+    Drain a search generator that yields (level, nodes) pairs into step_info.
+
+    :param steps: Generator such as dijkstra.dijkstra_steps.
+    :param step_info: Dict to fill with level -> {"x,y": next_nodes}.
+    :return: The generator's return value (the shortest path).
+    """
+    while True:
+        try:
+            level, nodes = next(steps)
+        except StopIteration as stop:
+            return stop.value
+        step_info.setdefault(level, {}).update(nodes)
@@ -0,0 +1,500 @@
+"""
+Hierarchical path-finding (HPA*) for large maps.
+
+The grid is split into square clusters. Wherever two neighbouring clusters
+share a run of open border cells there is an entrance: one transition (two
+abstract nodes, one per side, linked at cost 1) in the middle of a narrow
+run, or one at each end of a wide one. Inside a cluster, abstract nodes are
+linked by their shortest distance within that cluster.
+
+A query connects start and end to the abstract nodes of their clusters,
+runs A* over the small abstract graph and then refines each abstract edge
+into cells with a search confined to one cluster. Paths use 4-connected
+unit moves, like Dijkstra, and are near-optimal rather than optimal.
+
+Cluster distances assume unit moves, so maps with terrain costs are handed
+to dijkstra's weighted search instead, logged as one refine phase.
+"""
+import heapq
+import math
+import threading
+from collections import OrderedDict
+from operator import and_
+from typing import Dict, List, Optional, Tuple
+
+from dijkstra import weighted_dijkstra_steps
+from grid import as_flat_grid
+
+DEFAULT_CLUSTER_SIZE = 32
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+WIDE_ENTRANCE = 6  # Runs at least this long get a transition at each end
+PHASES = ("abstract", "refine")
+
+
+class PathResult:
+    """
+    Container for path finding results.
+
+    :param shortest_path: List of coordinates representing the path.
+    :param step_info: Dictionary containing step-by-step information of the algorithm.
+    :param step_phase: The same level -> "x,y" layout as step_info, mapping each
+                       expanded node to "abstract" (entrance graph search) or
+                       "refine" (cell search inside one cluster).
+    """
+    def __init__(self, shortest_path, step_info, step_phase=None):
+        self.shortest_path = shortest_path
+        self.step_info = step_info
+        self.step_phase = step_phase
+
+
+def _runs(flags: bytes, lo: int, hi: int):
+    """
+    Yield (first, last + 1) of every run of non-zero bytes in flags[lo:hi].
+    """
+    first = flags.find(1, lo, hi)
+    while first != -1:
+        last = flags.find(0, first, hi)
+        if last == -1:
+            last = hi
+        yield first, last
+        first = flags.find(1, last, hi)
+
+
+class AbstractGraph:
+    """
+    Entrance graph of one map.
+
+    Entrances are found when the graph is built. Intra-cluster distances are
+    computed the first time a search reaches a cluster and kept, so each is
+    computed once per map and clusters no query visits cost nothing.
+
+    Searches in several threads may share a graph. link() runs under a lock
+    and replaces a node's edge dict rather than adding to it, so a search
+    iterating the old dict is never disturbed.
+
+    :param flat: FlatGrid of the map.
+    :param cluster_size: Side of a cluster, in cells.
+    """
+    def __init__(self, flat, cluster_size: int = DEFAULT_CLUSTER_SIZE):
+        self.flat = flat
+        self.cluster_size = cluster_size
+        # Abstract node (flat cell index) -> neighbour node -> distance
+        self.edges: Dict[int, Dict[int, int]] = {}
+        self.cluster_nodes: Dict[Tuple[int, int], List[int]] = {}
+        self.linked = set()  # Clusters whose intra-cluster edges exist
+        self.lock = threading.Lock()
+        self._find_entrances()
+
+    @property
+    def nbytes(self):
+        # Rough size: ~100 bytes per edge and node
+        return 100 * (len(self.edges) + sum(len(e) for e in list(self.edges.values())))
+
+    def cluster_of(self, cell) -> Tuple[int, int]:
+        x, y = divmod(cell, self.flat.stride)
+        return (x - 1) // self.cluster_size, (y - 1) // self.cluster_size
+
+    def bounds(self, cluster) -> Tuple[int, int, int, int]:
+        """
+        Padded row and column ranges [x0, x1), [y0, y1) of a cluster.
+        """
+        size = self.cluster_size
+        cx, cy = cluster
+        return (cx * size + 1, min((cx + 1) * size, self.flat.rows) + 1,
+                cy * size + 1, min((cy + 1) * size, self.flat.cols) + 1)
+
+    def _add_node(self, cell):
+        if cell not in self.edges:
+            self.edges[cell] = {}
+            self.cluster_nodes.setdefault(self.cluster_of(cell), []).append(cell)
+
+    def _add_transitions(self, first, last, cell_a, cell_b):
+        # cell_a(i) / cell_b(i): the cells facing each other across the border at i
+        if last - first < WIDE_ENTRANCE:
+            positions = ((first + last - 1) // 2,)
+        else:
+            positions = (first, last - 1)
+        for i in positions:
+            a, b = cell_a(i), cell_b(i)
+            self._add_node(a)
+            self._add_node(b)
+            self.edges[a][b] = self.edges[b][a] = 1
+
+    def _find_entrances(self):
+        flat = self.flat
+        walkable = bytes(flat.walkable)
+        stride = flat.stride
+        size = self.cluster_size
+
+        # Borders between cluster rows: padded rows x and x + 1
+        for x in range(size, flat.rows, size):
+            above = walkable[x * stride:(x + 1) * stride]
+            below = walkable[(x + 1) * stride:(x + 2) * stride]
+            both = bytes(map(and_, above, below))
+            for lo in range(1, flat.cols + 1, size):
+                for first, last in _runs(both, lo, min(lo + size, flat.cols + 1)):
+                    self._add_transitions(first, last,
+                                          lambda y: x * stride + y, lambda y: (x + 1) * stride + y)
+
+        # Borders between cluster columns: padded columns y and y + 1
+        for y in range(size, flat.cols, size):
+            left = walkable[y::stride]
+            right = walkable[y + 1::stride]
+            both = bytes(map(and_, left, right))
+            for lo in range(1, flat.rows + 1, size):
+                for first, last in _runs(both, lo, min(lo + size, flat.rows + 1)):
+                    self._add_transitions(first, last,
+                                          lambda x: x * stride + y, lambda x: x * stride + y + 1)
+
+    def view(self, cluster) -> "ClusterView":
+        return ClusterView(self.flat, *self.bounds(cluster))
+
+    def link(self, cluster):
+        """
+        Add the intra-cluster edges of `cluster`, once.
+        """
+        if cluster in self.linked:
+            return
+        with self.lock:
+            if cluster in self.linked:
+                return  # Linked by another thread meanwhile
+            nodes = self.cluster_nodes.get(cluster, [])
+            view = self.view(cluster)
+            local = [view.local(node) for node in nodes]
+            edges = {node: dict(self.edges[node]) for node in nodes}
+            for i, node in enumerate(nodes):
+                others = local[i + 1:]
+                distances, _ = view.search(local[i], others)
+                for other, target in zip(nodes[i + 1:], others):
+                    # -1: not connected inside this cluster
+                    if distances[target] >= 0:
+                        edges[node][other] = edges[other][node] = distances[target]
+            self.edges.update(edges)
+            self.linked.add(cluster)
+
+
+class ClusterView:
+    """
+    Copy of one cluster's walkable flags with its own blocked border, so a
+    search confined to the cluster needs no bounds checks and works on small
+    local arrays.
+
+    :param flat: FlatGrid of the map.
+    :param x0, x1, y0, y1: Padded row and column ranges of the cluster.
+    """
+    def __init__(self, flat, x0, x1, y0, y1):
+        self.flat = flat
+        self.x0 = x0
+        self.y0 = y0
+        stride = self.stride = y1 - y0 + 2
+        self.walkable = bytearray((x1 - x0 + 2) * stride)
+        for x in range(x0, x1):
+            base = (x - x0 + 1) * stride + 1
+            self.walkable[base:base + y1 - y0] = flat.walkable[x * flat.stride + y0:x * flat.stride + y1]
+        self.offsets = (-stride, stride, -1, 1)  # Same order as FlatGrid.offsets4
+
+    def local(self, cell) -> int:
+        x, y = divmod(cell, self.flat.stride)
+        return (x - self.x0 + 1) * self.stride + y - self.y0 + 1
+
+    def cell(self, i) -> int:
+        x, y = divmod(i, self.stride)
+        return (x - 1 + self.x0) * self.flat.stride + y - 1 + self.y0
+
+    def search(self, source, targets, trace=None):
+        """
+        Breadth-first search from local index `source`, stopping once every
+        local index in `targets` is reached.
+
+        :param trace: Optional dict filled with "x,y" -> next_nodes per expansion.
+        :return: (distances, parents) local arrays; -1 where not reached.
+        """
+        walkable = self.walkable
+        offsets = self.offsets
+        distances = [-1] * len(walkable)
+        parents = [-1] * len(walkable)
+        distances[source] = 0
+        remaining = set(targets)
+        remaining.discard(source)
+        queue = [source]
+        for current in queue:
+            if not remaining:
+                break
+            next_distance = distances[current] + 1
+            next_nodes = []
+            for offset in offsets:
+                neighbor = current + offset
+                if walkable[neighbor] and distances[neighbor] < 0:
+                    distances[neighbor] = next_distance
+                    parents[neighbor] = current
+                    queue.append(neighbor)
+                    remaining.discard(neighbor)
+                    next_nodes.append(neighbor)
+            if trace is not None and next_nodes:
+                flat = self.flat
+                trace[flat.cell_key(self.cell(current))] = [flat.cell_list(self.cell(n)) for n in next_nodes]
+        return distances, parents
+
+    def walk(self, parents, i) -> List[Tuple[int, int]]:
+        """
+        Coordinates from the search source (excluded) to local index `i`.
+        """
+        cells = []
+        while parents[i] != -1:
+            cells.append(self.flat.coords(self.cell(i)))
+            i = parents[i]
+        cells.reverse()
+        return cells
+
+
+def build_abstract_graph(grid, cluster_size: int = DEFAULT_CLUSTER_SIZE) -> AbstractGraph:
+    """
+    Find the entrances of a map.
+
+    :param grid: 2D list, NumPy array or FlatGrid of the map.
+    :param cluster_size: Side of a cluster, in cells.
+    :return: AbstractGraph to pass to hpa_algorithm(..., graph=...).
+    """
+    return AbstractGraph(as_flat_grid(grid), cluster_size)
+
+
+class AbstractGraphCache:
+    """
+    LRU cache of abstract graphs keyed by map digest and cluster size,
+    bounded by memory: least recently used graphs are dropped while the
+    graphs' nbytes add up to more than `max_bytes`. The graph being served
+    is always kept, even if it alone is over budget.
+
+    :param max_bytes: Memory budget for all cached graphs.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.graphs = OrderedDict()
+        self.sizes = {}
+        self.bytes_in_use = 0
+        # Graphs are built and prepared from worker threads
+        self.lock = threading.Lock()
+
+    def get(self, grid, cluster_size: int = DEFAULT_CLUSTER_SIZE) -> AbstractGraph:
+        flat = as_flat_grid(grid)
+        key = (flat.digest(), cluster_size)
+        with self.lock:
+            graph = self.graphs.get(key)
+            if graph is not None:
+                self.graphs.move_to_end(key)
+                return graph
+        graph = AbstractGraph(flat, cluster_size)
+        with self.lock:
+            self.graphs[key] = graph
+            self._measure(key)
+        return graph
+
+    def prepare(self, grid, start, end, cluster_size: int = DEFAULT_CLUSTER_SIZE) -> AbstractGraph:
+        """
+        get() plus the intra-cluster edges around start and end, which a
+        search links before its first step. Run this off the event loop.
+
+        :param start: Tuple (x, y) the searches start from.
+        :param end: Tuple (x, y) the searches head for.
+        """
+        flat = as_flat_grid(grid)
+        graph = self.get(flat, cluster_size)
+        for point in (start, end):
+            graph.link(graph.cluster_of(flat.index(*point)))
+        with self.lock:
+            key = (flat.digest(), cluster_size)
+            if self.graphs.get(key) is graph:
+                self._measure(key)
+        return graph
+
+    def _measure(self, key):
+        # Graphs grow as clusters are linked, so they are re-measured when prepared
+        size = self.graphs[key].nbytes
+        self.bytes_in_use += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+        while self.bytes_in_use > self.max_bytes and len(self.graphs) > 1:
+            oldest = next(iter(self.graphs))
+            if oldest == key:
+                self.graphs.move_to_end(key)
+                continue
+            del self.graphs[oldest]
+            self.bytes_in_use -= self.sizes.pop(oldest)
+
+
+abstract_graphs = AbstractGraphCache()
+
+
+def hpa_algorithm(grid, start, end, cluster_size=DEFAULT_CLUSTER_SIZE, graph=None, stats=None) -> PathResult:
+    """
+    HPA* search with intermediate steps logged.
+
+    :param grid: 2D list representing the maze where 6 represents obstacles, or a FlatGrid.
+    :param start: Tuple (x, y) representing start position.
+    :param end: Tuple (x, y) representing end position.
+    :param cluster_size: Side of a cluster, in cells, when no graph is given.
+    :param graph: AbstractGraph of this map; by default one is taken from a
+                  per-map cache.
+    :param stats: Optional SearchStats to add this search's work counters to.
+    :return: PathResult whose step_info holds one level per abstract expansion
+             followed by one level per refined abstract edge, with step_phase
+             telling the two apart. The path is [] if end is unreachable.
+    """
+    step_info = {}
+    step_phase = {}
+    levels = _hpa_levels(as_flat_grid(grid), start, end, cluster_size, graph, stats)
+    while True:
+        try:
+            phase, level, nodes = next(levels)
+        except StopIteration as stop:
+            return PathResult(stop.value, step_info, step_phase)
+        step_info[level] = nodes
+        step_phase[level] = dict.fromkeys(nodes, phase)
+
+
+def hpa_steps(grid, start, end, cluster_size=DEFAULT_CLUSTER_SIZE, graph=None, stats=None):
+    """
+    Generator form of hpa_algorithm, for streaming the trace.
+
+    :yield: Tuples (level, {"x,y": [[next_x, next_y], ...]}).
+    :return: The path, or [] if end is unreachable (via StopIteration.value).
+    """
+    levels = _hpa_levels(as_flat_grid(grid), start, end, cluster_size, graph, stats)
+    while True:
+        try:
+            _, level, nodes = next(levels)
+        except StopIteration as stop:
+            return stop.value
+        yield level, nodes
+
+
+def _hpa_levels(flat, start, end, cluster_size, graph, stats):
+    # Yields (phase, level, nodes); returns the path
+    if flat.costs is not None:
+        return (yield from _weighted_levels(flat, start, end, stats))
+    if graph is None:
+        graph = abstract_graphs.get(flat, cluster_size)
+    stride = flat.stride
+    source = flat.index(*start)
+    target = flat.index(*end)
+    if not flat.walkable[source] or not flat.walkable[target]:
+        return []
+    if source == target:
+        return [tuple(start)]
+
+    # Nearby endpoints: one search over the clusters around start, since
+    # stitching entrances together makes needless detours on short paths
+    (cx, cy), (tx, ty) = graph.cluster_of(source), graph.cluster_of(target)
+    if abs(cx - tx) <= 1 and abs(cy - ty) <= 1:
+        x0, _, y0, _ = graph.bounds((max(cx - 1, 0), max(cy - 1, 0)))
+        _, x1, _, y1 = graph.bounds((cx + 1, cy + 1))
+        view = ClusterView(flat, x0, x1, y0, y1)
+        trace = {}
+        distances, parents = view.search(view.local(source), (view.local(target),), trace)
+        if distances[view.local(target)] >= 0:
+            if trace:
+                yield PHASES[1], 0, trace
+            _add_stats(stats, len(trace), 0, 0, 0)
+            return [tuple(start)] + view.walk(parents, view.local(target))
+
+    expanded = pops = pushes = stale = 0
+
+    # Connect start and end to the abstract nodes of their clusters with
+    # edges that live only for this query
+    extra: Dict[int, Dict[int, int]] = {source: {}, target: {}}
+    for point in (source, target):
+        cluster = graph.cluster_of(point)
+        graph.link(cluster)
+        nodes = graph.cluster_nodes.get(cluster, [])
+        view = graph.view(cluster)
+        distances, _ = view.search(view.local(point), [view.local(node) for node in nodes])
+        for node in nodes:
+            distance = distances[view.local(node)]
+            if distance > 0:
+                extra[point][node] = distance
+                extra.setdefault(node, {})[point] = distance
+        expanded += len(distances) - distances.count(-1)
+
+    # A* over the abstract graph, Manhattan distance as the heuristic. Ties
+    # go to the deeper node, or every monotone route would be expanded.
+    end_x, end_y = divmod(target, stride)
+    g_score = {source: 0}
+    parent = {source: -1}
+    closed = set()
+    open_set = [(0, 0, source)]
+    level = 0
+    while open_set:
+        _, _, node = heapq.heappop(open_set)
+        pops += 1
+        if node in closed:
+            stale += 1
+            continue
+        if node == target:
+            break
+        closed.add(node)
+        graph.link(graph.cluster_of(node))
+
+        next_nodes = []
+        node_g = g_score[node]
+        for edges in (graph.edges.get(node, {}), extra.get(node, {})):
+            for neighbor, cost in edges.items():
+                tentative = node_g + cost
+                if tentative < g_score.get(neighbor, math.inf):
+                    g_score[neighbor] = tentative
+                    parent[neighbor] = node
+                    x, y = divmod(neighbor, stride)
+                    heapq.heappush(open_set, (tentative + abs(x - end_x) + abs(y - end_y), -tentative, neighbor))
+                    next_nodes.append(flat.cell_list(neighbor))
+        expanded += 1
+        pushes += len(next_nodes)
+        if next_nodes:
+            yield PHASES[0], level, {flat.cell_key(node): next_nodes}
+            level += 1
+    else:
+        _add_stats(stats, expanded, pops, pushes + 1, stale)
+        return []
+
+    abstract_path = [target]
+    while parent[abstract_path[-1]] != -1:
+        abstract_path.append(parent[abstract_path[-1]])
+    abstract_path.reverse()
+
+    # Refine each abstract edge into cells: a border crossing is one step,
+    # anything else a search inside the shared cluster
+    path = [tuple(start)]
+    for a, b in zip(abstract_path, abstract_path[1:]):
+        cluster = graph.cluster_of(a)
+        if cluster != graph.cluster_of(b):
+            path.append(flat.coords(b))
+            continue
+        trace = {}
+        view = graph.view(cluster)
+        _, parents = view.search(view.local(a), (view.local(b),), trace)
+        expanded += len(trace)
+        path.extend(view.walk(parents, view.local(b)))
+        if trace:
+            yield PHASES[1], level, trace
+            level += 1
+
+    _add_stats(stats, expanded, pops, pushes + 1, stale)
+    return path
+
+
+def _weighted_levels(flat, start, end, stats):
+    steps = weighted_dijkstra_steps(flat, start, end, stats)
+    while True:
+        try:
+            level, nodes = next(steps)
+        except StopIteration as stop:
+            path = stop.value
+            break
+        yield PHASES[1], level, nodes
+    # dijkstra_steps returns [start] when end is unreachable
+    return path if path[-1] == tuple(end) else []
+
+
+def _add_stats(stats, expanded, pops, pushes, stale):
+    if stats is not None:
+        stats.nodes_expanded += expanded
+        stats.heap_pops += pops
+        stats.heap_pushes += pushes
+        stats.stale_pops += stale
@@ -1,7 +1,15 @@
 import heapq
 import math
-from collections import defaultdict
-from typing import Tuple, List, Dict, Set, Optional
+from typing import Tuple, List, Dict, Set, Optional, Sequence
+
+from astar import weighted_astar_steps
+from grid import as_flat_grid, collect_steps
+
+ALL_DIRECTIONS = [
+    (-1, 0), (1, 0), (0, -1), (0, 1),
+    (-1, -1), (-1, 1), (1, -1), (1, 1)
+]
+DIAGONAL_COSTS = [0.0]  # DIAGONAL_COSTS[k] is the cost of k diagonal moves
 
 class PathResult:
     """
@@ -24,243 +32,315 @@ def heuristic(a: Tuple[int, int], b: Tuple[int, int]) -> float:
     dy = abs(a[1] - b[1])
     return D * (dx + dy) + (D2 - 2 * D) * min(dx, dy)
 
-def is_walkable(grid, x, y) -> bool:
+def direction_offset(flat, direction) -> int:
     """
-    Check if the position is walkable and within the grid bounds.
+    Convert a (dx, dy) direction into a flat index offset.
     """
-    return (0 <= x < len(grid) and 
-            0 <= y < len(grid[0]) and 
-            grid[x][y] != 6)
+    return direction[0] * flat.stride + direction[1]
 
-def forced_neighbors(grid, pos, direction) -> List[Tuple[int, int]]:
+def is_walkable(flat, pos) -> bool:
+    """
+    Check if the cell index is walkable; the sentinel border is never walkable.
+    """
+    return flat.walkable[pos] == 1
+
+def forced_neighbors(flat, pos, direction) -> List[int]:
     """
     Identify forced neighbors for a given position and movement direction.
     """
-    x, y = pos
+    walkable = flat.walkable
+    stride = flat.stride
     dx, dy = direction
+    step_x = dx * stride
     neighbors = []
 
     if dy == 0:  # moving horizontally
-        if not is_walkable(grid, x, y - 1) and is_walkable(grid, x + dx, y - 1):
-            neighbors.append((x + dx, y - 1))
-        if not is_walkable(grid, x, y + 1) and is_walkable(grid, x + dx, y + 1):
-            neighbors.append((x + dx, y + 1))
+        if not walkable[pos - 1] and walkable[pos + step_x - 1]:
+            neighbors.append(pos + step_x - 1)
+        if not walkable[pos + 1] and walkable[pos + step_x + 1]:
+            neighbors.append(pos + step_x + 1)
     elif dx == 0:  # moving vertically
-        if not is_walkable(grid, x - 1, y) and is_walkable(grid, x - 1, y + dy):
-            neighbors.append((x - 1, y + dy))
-        if not is_walkable(grid, x + 1, y) and is_walkable(grid, x + 1, y + dy):
-            neighbors.append((x + 1, y + dy))
+        if not walkable[pos - stride] and walkable[pos - stride + dy]:
+            neighbors.append(pos - stride + dy)
+        if not walkable[pos + stride] and walkable[pos + stride + dy]:
+            neighbors.append(pos + stride + dy)
     else:  # moving diagonally
-        if not is_walkable(grid, x - dx, y) and is_walkable(grid, x - dx, y + dy):
-            neighbors.append((x - dx, y + dy))
-        if not is_walkable(grid, x, y - dy) and is_walkable(grid, x + dx, y - dy):
-            neighbors.append((x + dx, y - dy))
+        if not walkable[pos - step_x] and walkable[pos - step_x + dy]:
+            neighbors.append(pos - step_x + dy)
+        if not walkable[pos - dy] and walkable[pos + step_x - dy]:
+            neighbors.append(pos + step_x - dy)
     return neighbors
 
-def jump(grid, from_pos, direction, end) -> Tuple[Optional[Tuple[int, int]], List[Tuple[int, int]], float]:
+def has_jump_point(flat, from_pos, direction, end, stats=None) -> bool:
+    """
+    Orthogonal jump that only reports whether a jump point exists, without
+    building the path segment.
+    """
+    walkable = flat.walkable
+    offset = direction_offset(flat, direction)
+    pos = from_pos + offset
+
+    while walkable[pos]:
+        if pos == end or forced_neighbors(flat, pos, direction):
+            break
+        pos += offset
+    if stats is not None:
+        stats.jump_cells += (pos - from_pos) // offset
+    return walkable[pos] == 1
+
+def jump_cost(steps, diagonal) -> float:
+    """
+    Cost of `steps` straight or diagonal moves, summed one move at a time so
+    every jump variant agrees on the exact float value.
+    """
+    if not diagonal:
+        return float(steps)
+    while len(DIAGONAL_COSTS) <= steps:
+        DIAGONAL_COSTS.append(DIAGONAL_COSTS[-1] + math.sqrt(2))
+    return DIAGONAL_COSTS[steps]
+
+def jump(flat, from_pos, direction, end, stats=None) -> Tuple[Optional[int], Sequence[int], float]:
     """
     Jump in the given direction and return the jump point if found.
+
+    The path segment is returned as a range of the cell indices stepped over,
+    ending at the jump point. With `stats`, the cells scanned (including those
+    of the straight scans a diagonal jump makes) are added to stats.jump_cells.
     """
-    x, y = from_pos
+    walkable = flat.walkable
     dx, dy = direction
-    path = []
-    cost = 0.0
+    offset = direction_offset(flat, direction)
+    diagonal = dx != 0 and dy != 0
+    pos = from_pos
 
     while True:
-        x += dx
-        y += dy
-        current_pos = (x, y)
-
-        if not is_walkable(grid, x, y):
-            return None, [], 0.0
+        pos += offset
 
-        path.append(current_pos)
-
-        # Calculate the movement cost
-        if dx != 0 and dy != 0:
-            cost += math.sqrt(2)
-        else:
-            cost += 1.0
-
-        # Found goal
-        if current_pos == end:
-            return current_pos, path, cost
-
-        # Found forced neighbor
-        if forced_neighbors(grid, current_pos, direction):
-            return current_pos, path, cost
-
-        # When moving diagonally, check for jump points in orthogonal directions
-        if dx != 0 and dy != 0:
-            nx, path_x, cost_x = jump(grid, current_pos, (dx, 0), end)
-            ny, path_y, cost_y = jump(grid, current_pos, (0, dy), end)
-            if nx is not None or ny is not None:
-                return current_pos, path, cost
-
-        # If we reach the edge of the grid without finding a jump point
-        if not (0 <= x < len(grid) and 0 <= y < len(grid[0])):
+        # Obstacles and the sentinel border both stop the jump
+        if not walkable[pos]:
+            if stats is not None:
+                stats.jump_cells += (pos - from_pos) // offset
             return None, [], 0.0
 
-def prune_directions(grid, current, parent, direction) -> List[Tuple[int, int]]:
+        # Found goal or forced neighbor; when moving diagonally, also stop if
+        # there is a jump point in either orthogonal direction
+        if (pos == end or
+                forced_neighbors(flat, pos, direction) or
+                (diagonal and (has_jump_point(flat, pos, (dx, 0), end, stats) or
+                               has_jump_point(flat, pos, (0, dy), end, stats)))):
+            steps = (pos - from_pos) // offset
+            if stats is not None:
+                stats.jump_cells += steps
+            return pos, range(from_pos + offset, pos + offset, offset), jump_cost(steps, diagonal)
+
+def prune_directions(flat, current, parent, direction) -> List[Tuple[int, int]]:
     """
     Prune unnecessary directions according to the JPS rules.
     """
+    walkable = flat.walkable
+    stride = flat.stride
     dx, dy = direction
     directions = []
 
     if dx != 0 and dy != 0:
         # Diagonal movement
-        if is_walkable(grid, current[0], current[1] + dy):
+        if walkable[current + dy]:
             directions.append((0, dy))
-        if is_walkable(grid, current[0] + dx, current[1]):
+        if walkable[current + dx * stride]:
             directions.append((dx, 0))
-        if is_walkable(grid, current[0] + dx, current[1] + dy):
+        if walkable[current + dx * stride + dy]:
             directions.append((dx, dy))
     else:
         if dx == 0:
             # Vertical movement
-            if is_walkable(grid, current[0], current[1] + dy):
+            if walkable[current + dy]:
                 directions.append((0, dy))
-            if not is_walkable(grid, current[0] + 1, current[1]):
+            if not walkable[current + stride]:
                 directions.append((1, dy))
-            if not is_walkable(grid, current[0] - 1, current[1]):
+            if not walkable[current - stride]:
                 directions.append((-1, dy))
         else:
             # Horizontal movement
-            if is_walkable(grid, current[0] + dx, current[1]):
+            if walkable[current + dx * stride]:
                 directions.append((dx, 0))
-            if not is_walkable(grid, current[0], current[1] + 1):
+            if not walkable[current + 1]:
                 directions.append((dx, 1))
-            if not is_walkable(grid, current[0], current[1] - 1):
+            if not walkable[current - 1]:
                 directions.append((dx, -1))
     return directions
 
-def get_successors(grid, current, end, came_from) -> List[Tuple[Tuple[int, int], List[Tuple[int, int]], float]]:
+def get_successors(flat, current, end, came_from, jump_table=None,
+                   stats=None) -> List[Tuple[int, Sequence[int], float]]:
     """
     Get successors from the current node according to JPS rules.
+
+    With a jump_table (JPS+ distances or bitmasks), jumps are answered by it
+    instead of scanning the grid cell by cell.
     """
     successors = []
-    if current in came_from:
-        parent = came_from[current]
-        dx = current[0] - parent[0]
-        dy = current[1] - parent[1]
+    parent = came_from[current]
+    if parent != -1:
+        stride = flat.stride
+        dx = current // stride - parent // stride
+        dy = current % stride - parent % stride
         # Normalize direction
         dx = (dx > 0) - (dx < 0)
         dy = (dy > 0) - (dy < 0)
-        directions = prune_directions(grid, current, parent, (dx, dy))
+        directions = prune_directions(flat, current, parent, (dx, dy))
     else:
         # If no parent, consider all directions
-        directions = [
-            (-1, 0), (1, 0), (0, -1), (0, 1),
-            (-1, -1), (-1, 1), (1, -1), (1, 1)
-        ]
+        directions = ALL_DIRECTIONS
 
-    for dx, dy in directions:
-        jp, path, cost = jump(grid, current, (dx, dy), end)
+    for direction in directions:
+        if jump_table is not None:
+            jp, path, cost = jump_table.jump(current, direction, end, stats)
+        else:
+            jp, path, cost = jump(flat, current, direction, end, stats)
         if jp:
             successors.append((jp, path, cost))
     return successors
 
-def expand_diagonal_moves(grid, path: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+def expand_diagonal_moves(flat, path: List[int]) -> List[Tuple[int, int]]:
     """
     Expand diagonal moves into orthogonal moves in the path,
     ensuring that intermediate nodes are walkable.
     """
+    walkable = flat.walkable
+    stride = flat.stride
     expanded_path = []
     for i in range(len(path) - 1):
         current = path[i]
         next_node = path[i + 1]
-        x1, y1 = current
-        x2, y2 = next_node
-        dx = x2 - x1
-        dy = y2 - y1
+        step = next_node - current
+        dy = next_node % stride - current % stride
+        dx = (step - dy) // stride
 
-        expanded_path.append(current)
+        expanded_path.append(flat.coords(current))
 
         # If the move is diagonal, expand it
         if abs(dx) == 1 and abs(dy) == 1:
             # Try horizontal first, then vertical
-            intermediate_node1 = (x2, y1)
-            intermediate_node2 = (x2, y2)
-            if is_walkable(grid, *intermediate_node1) and is_walkable(grid, *intermediate_node2):
-                expanded_path.append(intermediate_node1)
-            else:
+            intermediate_node = current + dx * stride
+            if not (walkable[intermediate_node] and walkable[next_node]):
                 # Try vertical first, then horizontal
-                intermediate_node1 = (x1, y2)
-                if is_walkable(grid, *intermediate_node1) and is_walkable(grid, *intermediate_node2):
-                    expanded_path.append(intermediate_node1)
-                else:
+                intermediate_node = current + dy
+                if not (walkable[intermediate_node] and walkable[next_node]):
                     # No valid expansion possible
                     return []  # Path is invalid
+            expanded_path.append(flat.coords(intermediate_node))
         # For orthogonal moves, no need to expand
 
-    expanded_path.append(path[-1])  # Add the last node
+    expanded_path.append(flat.coords(path[-1]))  # Add the last node
     return expanded_path
 
-def jps_algorithm(grid, start, end) -> PathResult:
+def jps_algorithm(grid, start, end, jump_table=None, stats=None, landmarks=None) -> PathResult:
     """
     The main function implementing the Jump Point Search algorithm.
+
+    Pass a JumpTable built once per map (see jps_plus.build_jump_table) to run
+    in JPS+ mode, or JumpMasks (see jps_bits.build_jump_masks) to scan straight
+    jumps with row/column bitmasks; the result is the same as the online search.
+    Pass a SearchStats as `stats` to collect work counters, and a
+    LandmarkTable (see landmarks.build_landmarks) as `landmarks` to order
+    jump points by ALT bounds instead of octile distance.
+
+    Jumping over cells assumes every move costs the same, so on maps with
+    terrain costs this runs astar's weighted search instead.
     """
-    start = tuple(start)
-    end = tuple(end)
+    step_info = {}
+    path = collect_steps(jps_steps(grid, start, end, jump_table, stats, landmarks), step_info)
+    return PathResult(path, step_info)
 
-    open_set = [(0, start)]
-    came_from = {}
+def jps_steps(grid, start, end, jump_table=None, stats=None, landmarks=None):
+    """
+    Generator form of jps_algorithm that yields every expansion as it
+    happens, so callers can stream the trace instead of holding it.
+
+    :yield: Tuples (level, {"x,y": [[next_x, next_y], ...]}).
+    :return: The path, or [] if end is unreachable (via StopIteration.value).
+    """
+    flat = jump_table.flat if jump_table is not None else as_flat_grid(grid)
+    if flat.costs is not None:
+        return (yield from weighted_astar_steps(flat, start, end, stats))
+    source = flat.index(*start)
+    target = flat.index(*end)
+    end_x, end_y = flat.coords(target)
+    bounds = landmarks.heuristic(target) if landmarks is not None else None
+
+    open_set = [(0, source)]
+    came_from = flat.new_parents()
     came_from_path = {}
-    g_score = {start: 0.0}
-    f_score = {start: heuristic(start, end)}
-    closed_set = set()
+    g_score = flat.new_scores()
+    g_score[source] = 0.0
+    closed_set = bytearray(flat.size)
 
-    step_info = defaultdict(dict)
     current_level = 0
+    pops = pushes = stale = 0
 
     while open_set:
         current_f, current = heapq.heappop(open_set)
+        pops += 1
 
-        if current == end:
+        if current == target:
             # Reconstruct path using the paths stored in came_from_path
-            path = []
+            segments = []
             current_node = current
-            while current_node != start:
-                path_segment = came_from_path[current_node]
-                path = path_segment + path  # Prepend the path segment
-                prev_node = came_from[current_node]
-                current_node = prev_node
-            path = [start] + path
+            while current_node != source:
+                segments.append(came_from_path[current_node])
+                current_node = came_from[current_node]
+            path = [source]
+            for path_segment in reversed(segments):
+                path.extend(path_segment)
 
             # Expand diagonal moves into orthogonal moves
-            path = expand_diagonal_moves(grid, path)
+            path = expand_diagonal_moves(flat, path)
             if not path:
                 # Path cannot be expanded without hitting obstacles
                 continue  # Continue searching for alternative paths
 
-            return PathResult(path, step_info)
+            if stats is not None:
+                stats.nodes_expanded += pops - stale - 1
+                stats.heap_pops += pops
+                stats.stale_pops += stale
+                stats.heap_pushes += pushes + 1
+            return path
 
-        if current in closed_set:
+        if closed_set[current]:
+            stale += 1
             continue
 
-        closed_set.add(current)
+        closed_set[current] = 1
 
-        neighbors = get_successors(grid, current, end, came_from)
+        neighbors = get_successors(flat, current, target, came_from, jump_table, stats)
 
         if neighbors:
             next_nodes = []
             for neighbor, path_segment, move_cost in neighbors:
-                if neighbor in closed_set:
+                if closed_set[neighbor]:
                     continue
 
                 tentative_g_score = g_score[current] + move_cost
 
-                if neighbor not in g_score or tentative_g_score < g_score[neighbor]:
+                if tentative_g_score < g_score[neighbor]:
                     came_from[neighbor] = current
                     came_from_path[neighbor] = path_segment
                     g_score[neighbor] = tentative_g_score
-                    f_score[neighbor] = tentative_g_score + heuristic(neighbor, end)
-                    heapq.heappush(open_set, (f_score[neighbor], neighbor))
-                    next_nodes.append([neighbor[0], neighbor[1]])
+                    nx, ny = flat.coords(neighbor)
+                    if bounds is not None:
+                        f_score = tentative_g_score + bounds[neighbor]
+                    else:
+                        f_score = tentative_g_score + heuristic((nx, ny), (end_x, end_y))
+                    heapq.heappush(open_set, (f_score, neighbor))
+                    next_nodes.append([nx, ny])
 
             if next_nodes:
-                step_info[current_level][f"{current[0]},{current[1]}"] = next_nodes
+                pushes += len(next_nodes)  # One push per queued jump point
+                yield current_level, {flat.cell_key(current): next_nodes}
                 current_level += 1
 
-    return PathResult([], step_info)
+    if stats is not None:
+        stats.nodes_expanded += pops - stale
+        stats.heap_pops += pops
+        stats.stale_pops += stale
+        stats.heap_pushes += pushes + 1
+    return []
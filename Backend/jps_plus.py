@@ -0,0 +1,157 @@
+from array import array
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from grid import as_flat_grid
+from jps import ALL_DIRECTIONS, direction_offset, jump_cost
+
+
+class JumpTable:
+    """
+    JPS+ jump distances precomputed once per map.
+
+    For every cell and each of the 8 directions, distances[direction][cell] is
+    either k > 0, meaning the k-th cell along the ray is a jump point, or
+    k <= 0, meaning the ray crosses -k walkable cells and then hits a wall
+    without passing a jump point. Jump points here are the goal-independent
+    ones (forced neighbours, and for diagonals a straight jump point in either
+    component direction); the goal is handled at query time in O(1).
+
+    :param flat: FlatGrid the table was built for.
+    :param distances: Dict of direction -> flat array of signed distances.
+    """
+    def __init__(self, flat, distances: Dict[Tuple[int, int], array]):
+        self.flat = flat
+        self.stride = flat.stride
+        self.distances = distances
+        self.offsets = {d: direction_offset(flat, d) for d in ALL_DIRECTIONS}
+
+    def jump(self, pos, direction, end, stats=None) -> Tuple[Optional[int], Sequence[int], float]:
+        """
+        Table-lookup equivalent of jps.jump: same jump point, path and cost.
+        No cells are scanned, so stats.jump_cells is left alone.
+        """
+        dist = self.distances[direction][pos]
+        offset = self.offsets[direction]
+        stride = self.stride
+        dx, dy = direction
+        reach = dist if dist > 0 else -dist
+        steps = dist if dist > 0 else 0  # 0 means no jump point
+
+        px, py = divmod(pos, stride)
+        ex, ey = divmod(end, stride)
+
+        if dx == 0:
+            # Goal further along this row
+            if ex == px and 0 < (ey - py) * dy <= reach:
+                steps = (ey - py) * dy
+        elif dy == 0:
+            # Goal further along this column
+            if ey == py and 0 < (ex - px) * dx <= reach:
+                steps = (ex - px) * dx
+        else:
+            candidates = [steps] if steps else []
+
+            # Goal on the diagonal itself
+            j = (ex - px) * dx
+            if 0 < j <= reach and (ey - py) * dy == j:
+                candidates.append(j)
+
+            # Goal seen by the (0, dy) scan from the diagonal cell on its row
+            if 0 < j <= reach:
+                ahead = self.distances[(0, dy)][pos + j * offset]
+                if ahead <= 0 and 0 < (ey - py - j * dy) * dy <= -ahead:
+                    candidates.append(j)
+
+            # Goal seen by the (dx, 0) scan from the diagonal cell on its column
+            j = (ey - py) * dy
+            if 0 < j <= reach:
+                ahead = self.distances[(dx, 0)][pos + j * offset]
+                if ahead <= 0 and 0 < (ex - px - j * dx) * dx <= -ahead:
+                    candidates.append(j)
+
+            steps = min(candidates) if candidates else 0
+
+        if not steps:
+            return None, [], 0.0
+        jump_point = pos + steps * offset
+        return jump_point, range(pos + offset, jump_point + offset, offset), jump_cost(steps, dx != 0 and dy != 0)
+
+
+def _forced_mask(walkable, rows, cols, direction):
+    """
+    Vectorised jps.forced_neighbors: True for interior cells that have a
+    forced neighbour when entered in `direction`.
+    """
+    def shifted(a, b):
+        return walkable[1 + a:rows + 1 + a, 1 + b:cols + 1 + b]
+
+    dx, dy = direction
+    if dy == 0:  # moving horizontally
+        return ((~shifted(0, -1) & shifted(dx, -1)) |
+                (~shifted(0, 1) & shifted(dx, 1)))
+    if dx == 0:  # moving vertically
+        return ((~shifted(-1, 0) & shifted(-1, dy)) |
+                (~shifted(1, 0) & shifted(1, dy)))
+    # moving diagonally
+    return ((~shifted(-dx, 0) & shifted(-dx, dy)) |
+            (~shifted(0, -dy) & shifted(dx, -dy)))
+
+
+def _scan_distances(walkable, stop, direction):
+    """
+    Signed distance from every cell to the next stop cell or wall along
+    `direction`, filled one row/column at a time from the far end.
+    """
+    height, width = walkable.shape
+    dx, dy = direction
+    distances = np.zeros((height, width), dtype=np.int32)
+
+    def step(ahead, ahead_walkable, ahead_stop):
+        return np.where(~ahead_walkable, 0,
+                        np.where(ahead_stop, 1,
+                                 np.where(ahead > 0, ahead + 1, ahead - 1)))
+
+    if dy != 0:
+        columns = range(width - 2, 0, -1) if dy > 0 else range(1, width - 1)
+        rows = slice(1 + dx, height - 1 + dx)
+        for y in columns:
+            distances[1:-1, y] = step(distances[rows, y + dy],
+                                      walkable[rows, y + dy], stop[rows, y + dy])
+    else:
+        lines = range(height - 2, 0, -1) if dx > 0 else range(1, height - 1)
+        for x in lines:
+            distances[x, 1:-1] = step(distances[x + dx, 1:-1],
+                                      walkable[x + dx, 1:-1], stop[x + dx, 1:-1])
+    return distances
+
+
+def build_jump_table(grid) -> JumpTable:
+    """
+    Precompute JPS+ jump distances for all 8 directions of every cell.
+
+    :param grid: 2D list, NumPy array or FlatGrid of the map.
+    :return: JumpTable to pass to jps_algorithm(..., jump_table=...).
+    """
+    flat = as_flat_grid(grid)
+    rows, cols = flat.rows, flat.cols
+    walkable = np.frombuffer(bytes(flat.walkable), dtype=np.uint8).reshape(rows + 2, cols + 2) != 0
+    interior = walkable[1:-1, 1:-1]
+
+    tables = {}
+    # Straight directions first: diagonal stops depend on them
+    for direction in sorted(ALL_DIRECTIONS, key=lambda d: d[0] != 0 and d[1] != 0):
+        dx, dy = direction
+        stop_cells = _forced_mask(walkable, rows, cols, direction)
+        if dx != 0 and dy != 0:
+            stop_cells = stop_cells | (tables[(dx, 0)][1:-1, 1:-1] > 0) | (tables[(0, dy)][1:-1, 1:-1] > 0)
+        stop = np.zeros_like(walkable)
+        stop[1:-1, 1:-1] = stop_cells & interior
+        tables[direction] = _scan_distances(walkable, stop, direction)
+
+    distances = {}
+    for direction, table in tables.items():
+        distances[direction] = array('i')
+        distances[direction].frombytes(table.astype(np.intc).tobytes())
+    return JumpTable(flat, distances)
@@ -0,0 +1,261 @@
+"""
+ALT heuristics (A*, Landmarks, Triangle inequality) for A* and JPS.
+
+A few landmark cells are chosen per map and the shortest 8-connected
+distance from each of them to every cell is computed once. For any cell n
+and target t, |d(L, t) - d(L, n)| <= d(n, t) for every landmark L, so the
+largest of these bounds is an admissible, consistent heuristic. Behind a
+wall it is far tighter than octile distance, which only sees the straight
+line. Tables are cached per map digest, so every query on a map after the
+first reuses them.
+
+Distances use astar's moves (unit and sqrt(2) steps, any diagonal into a
+walkable cell). JPS never moves more freely than that, so the bound holds
+for it too. Maps with terrain costs are left to the engines' own
+heuristics.
+"""
+import math
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+
+from astar import astar_steps
+from grid import SQRT2, as_flat_grid
+from jps import jps_steps
+
+DEFAULT_LANDMARKS = 8
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # About three 1000x1000 tables
+HEURISTIC_TARGETS = 2  # Per-target heuristic tables kept per landmark table
+
+
+def choose_landmarks(flat, count: int = DEFAULT_LANDMARKS) -> List[int]:
+    """
+    Spread landmarks around the edge of the map: for `count` evenly spaced
+    angles, the walkable cell closest to where that ray from the centre
+    leaves the grid. Landmarks behind the target, seen from the start, give
+    the tightest bounds, and the edge is behind most targets.
+
+    :return: Distinct flat indices, possibly fewer than `count`.
+    """
+    cells = np.flatnonzero(np.frombuffer(flat.walkable, dtype=np.uint8))
+    if not cells.size:
+        return []
+    xs, ys = np.divmod(cells, flat.stride)
+    centre_x, centre_y = (flat.rows + 1) / 2, (flat.cols + 1) / 2
+    half_x, half_y = (flat.rows - 1) / 2, (flat.cols - 1) / 2
+
+    chosen = []
+    for k in range(count):
+        angle = 2 * math.pi * k / count
+        dx, dy = math.cos(angle), math.sin(angle)
+        # Scale the ray so it ends on the border of the grid
+        scale = min(half_x / abs(dx) if abs(dx) > 1e-9 else math.inf,
+                    half_y / abs(dy) if abs(dy) > 1e-9 else math.inf)
+        px, py = centre_x + dx * scale, centre_y + dy * scale
+        cell = int(cells[np.argmin((xs - px) ** 2 + (ys - py) ** 2)])
+        if cell not in chosen:
+            chosen.append(cell)
+    return chosen
+
+
+def landmark_distances(flat, landmarks: List[int]) -> np.ndarray:
+    """
+    Shortest 8-connected distances from every landmark at once.
+
+    A vectorised label-correcting sweep: each round relaxes the eight
+    neighbours of every cell improved in the previous round, for all
+    landmarks in one set of NumPy operations, until nothing improves.
+
+    :return: (len(landmarks), flat.size) array, math.inf where unreachable.
+    """
+    size = flat.size
+    count = len(landmarks)
+    walkable = np.tile(np.frombuffer(flat.walkable, dtype=bool), count)
+    distances = np.full(count * size, math.inf)
+    offsets = np.array(flat.offsets8)
+    costs = np.array(flat.costs8)
+
+    # Landmark k's distances live at [k * size, (k + 1) * size); the border
+    # is never walkable, so neighbours never cross into another block
+    frontier = np.arange(count) * size + np.asarray(landmarks, dtype=np.int64)
+    distances[frontier] = 0.0
+    while frontier.size:
+        neighbors = (frontier[:, None] + offsets).ravel()
+        candidates = (distances[frontier][:, None] + costs).ravel()
+        better = walkable[neighbors] & (candidates < distances[neighbors])
+        neighbors, candidates = neighbors[better], candidates[better]
+        np.minimum.at(distances, neighbors, candidates)
+        frontier = np.unique(neighbors[distances[neighbors] == candidates])
+
+    return distances.reshape(count, size)
+
+
+class LandmarkTable:
+    """
+    Landmark distances of one map, and the ALT heuristic built from them.
+
+    :param flat: FlatGrid the distances were computed on.
+    :param landmarks: Flat indices of the landmark cells.
+    :param distances: (len(landmarks), flat.size) array from landmark_distances.
+    """
+    def __init__(self, flat, landmarks: List[int], distances: np.ndarray):
+        self.flat = flat
+        self.landmarks = landmarks
+        self.distances = distances
+        self.heuristics = OrderedDict()  # target -> array("d")
+
+    @property
+    def nbytes(self):
+        return self.distances.nbytes + sum(8 * len(h) for h in list(self.heuristics.values()))
+
+    def heuristic(self, target: int) -> array:
+        """
+        Per-cell lower bound on the distance to `target`: the larger of the
+        octile distance and every landmark's triangle bound.
+
+        Built for the whole map with NumPy and indexed by flat cell index, so
+        an engine pays one array lookup per node. Tables for the last few
+        targets are kept.
+        """
+        table = self.heuristics.get(target)
+        if table is not None:
+            self.heuristics.move_to_end(target)
+            return table
+
+        flat = self.flat
+        end_x, end_y = divmod(target, flat.stride)
+        xs, ys = np.divmod(np.arange(flat.size), flat.stride)
+        dx, dy = np.abs(xs - end_x), np.abs(ys - end_y)
+        # Same diagonal distance as astar.heuristic()
+        bound = np.maximum(dx, dy) + (SQRT2 - 1) * np.minimum(dx, dy)
+        for distances in self.distances:
+            to_target = distances[target]
+            if to_target != math.inf:
+                # Cells the landmark can't reach can't reach the target either
+                np.maximum(bound, np.abs(distances - to_target), out=bound)
+
+        table = array("d")
+        table.frombytes(bound.tobytes())
+        self.heuristics[target] = table
+        if len(self.heuristics) > HEURISTIC_TARGETS:
+            self.heuristics.popitem(last=False)
+        return table
+
+
+def build_landmarks(grid, count: int = DEFAULT_LANDMARKS) -> LandmarkTable:
+    """
+    Choose landmarks for a map and compute their distance arrays.
+
+    Landmarks shut in a small pocket bound almost nothing, so those reaching
+    fewer than half as many cells as the best landmark are dropped.
+
+    :param grid: 2D list, NumPy array or FlatGrid of the map.
+    :param count: Landmarks to place; memory is 8 bytes per cell per landmark.
+    """
+    flat = as_flat_grid(grid)
+    landmarks = choose_landmarks(flat, count)
+    if not landmarks:
+        return LandmarkTable(flat, [], np.empty((0, flat.size)))
+    distances = landmark_distances(flat, landmarks)
+    reached = np.isfinite(distances).sum(axis=1)
+    keep = reached * 2 >= reached.max()
+    return LandmarkTable(flat, [cell for cell, k in zip(landmarks, keep) if k], distances[keep])
+
+
+class LandmarkCache:
+    """
+    LRU cache of landmark tables keyed by map digest and landmark count,
+    bounded by memory: least recently used tables are dropped while the
+    tables' nbytes add up to more than `max_bytes`. The table being served
+    is always kept, even if it alone is over budget.
+
+    :param max_bytes: Memory budget for all cached tables.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.tables = OrderedDict()
+        self.sizes = {}
+        self.bytes_in_use = 0
+        # Tables are built and prepared from worker threads
+        self.lock = threading.Lock()
+
+    def get(self, grid, count: int = DEFAULT_LANDMARKS) -> LandmarkTable:
+        flat = as_flat_grid(grid)
+        key = (flat.digest(), count)
+        with self.lock:
+            table = self.tables.get(key)
+            if table is not None:
+                self.tables.move_to_end(key)
+                return table
+        table = build_landmarks(flat, count)
+        with self.lock:
+            self.tables[key] = table
+            self._measure(key)
+        return table
+
+    def prepare(self, grid, target, count: int = DEFAULT_LANDMARKS) -> LandmarkTable:
+        """
+        get() plus the heuristic for `target`, so a search started with the
+        table does no NumPy work. Run this off the event loop.
+
+        :param target: Tuple (x, y) the searches will head for.
+        """
+        flat = as_flat_grid(grid)
+        table = self.get(flat, count)
+        table.heuristic(flat.index(*target))
+        with self.lock:
+            key = (flat.digest(), count)
+            if self.tables.get(key) is table:
+                self._measure(key)
+        return table
+
+    def _measure(self, key):
+        # Per-target heuristics grow a table, so it is re-measured as they are added
+        size = self.tables[key].nbytes
+        self.bytes_in_use += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+        while self.bytes_in_use > self.max_bytes and len(self.tables) > 1:
+            oldest = next(iter(self.tables))
+            if oldest == key:
+                self.tables.move_to_end(key)
+                continue
+            del self.tables[oldest]
+            self.bytes_in_use -= self.sizes.pop(oldest)
+
+
+landmark_tables = LandmarkCache()
+
+
+def astar_alt_steps(grid, start, end, stats=None, landmarks=None):
+    """
+    astar_steps guided by landmark bounds. Without `landmarks` the map's table is
+    taken from landmark_tables, which builds it on a miss; that takes
+    seconds on large maps, so async callers should pass one from
+    landmark_tables.prepare run in a thread.
+
+    :yield: Tuples (level, {"x,y": [[next_x, next_y], ...]}).
+    :return: The path, or [] if end is unreachable (via StopIteration.value).
+    """
+    flat = as_flat_grid(grid)
+    if landmarks is None and flat.costs is None:
+        landmarks = landmark_tables.get(flat)
+    return (yield from astar_steps(flat, start, end, stats, landmarks=landmarks))
+
+
+def jps_alt_steps(grid, start, end, stats=None, landmarks=None):
+    """
+    jps_steps guided by landmark bounds. Without `landmarks` the map's table is
+    taken from landmark_tables, which builds it on a miss; that takes
+    seconds on large maps, so async callers should pass one from
+    landmark_tables.prepare run in a thread.
+
+    :yield: Tuples (level, {"x,y": [[next_x, next_y], ...]}).
+    :return: The path, or [] if end is unreachable (via StopIteration.value).
+    """
+    flat = as_flat_grid(grid)
+    if landmarks is None and flat.costs is None:
+        landmarks = landmark_tables.get(flat)
+    return (yield from jps_steps(flat, start, end, stats=stats, landmarks=landmarks))
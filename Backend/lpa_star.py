@@ -0,0 +1,165 @@
+import heapq
+import math
+from typing import Iterable, List, Tuple
+
+from grid import FlatGrid, as_flat_grid
+
+
+class LPAStar:
+    """
+    Lifelong Planning A* between two fixed cells, for maps edited a few cells
+    at a time.
+
+    The planner keeps its g / rhs values and priority queue between calls.
+    After cells are opened or blocked only the vertices whose distance from
+    start actually changes are expanded again, so a small edit costs a small
+    repair instead of a new search. Start and end never move here, so this
+    is D* Lite without its key modifier for a moving start.
+
+    Moves are 4-connected and cost the terrain cost of the cell entered (1
+    on unit-cost maps), so paths match dijkstra_algorithm's in length; the
+    heuristic is Manhattan distance to end times the cheapest terrain.
+
+    :param grid: 2D list, NumPy array or FlatGrid. The planner edits its own
+                 copy, never the grid passed in.
+    :param start: Tuple (x, y) representing start position.
+    :param end: Tuple (x, y) representing end position.
+    """
+    def __init__(self, grid, start, end):
+        flat = as_flat_grid(grid)
+        self.flat = FlatGrid.from_walkable(flat.rows, flat.cols, flat.walkable, flat.costs)
+        self.start = tuple(start)
+        self.end = tuple(end)
+        self.source = self.flat.index(*start)
+        self.target = self.flat.index(*end)
+        self.end_x, self.end_y = divmod(self.target, self.flat.stride)
+
+        self.g = self.flat.new_scores()
+        self.rhs = self.flat.new_scores()
+        self.rhs[self.source] = 0
+        # Heap of (k1, k2, cell); queued holds each cell's live key, so
+        # entries with any other key are stale and skipped when popped
+        self.queue: List[Tuple[float, float, int]] = []
+        self.queued = {}
+        self.pushes = 0  # Since the last compute(); edits push entries too
+        self._update(self.source)
+
+    @property
+    def nbytes(self):
+        # g and rhs hold one pointer per cell each
+        return self.flat.nbytes + 16 * self.flat.size
+
+    def _key(self, cell):
+        best = min(self.g[cell], self.rhs[cell])
+        x, y = divmod(cell, self.flat.stride)
+        return best + self.flat.min_cost * (abs(x - self.end_x) + abs(y - self.end_y)), best
+
+    def _update(self, cell):
+        walkable = self.flat.walkable
+        g = self.g
+        if cell != self.source:
+            best = math.inf
+            if walkable[cell]:
+                for offset in self.flat.offsets4:
+                    neighbor = cell + offset
+                    if walkable[neighbor] and g[neighbor] < best:
+                        best = g[neighbor]
+                best += 1 if self.flat.costs is None else self.flat.costs[cell]
+            self.rhs[cell] = best
+        if g[cell] != self.rhs[cell]:
+            key = self._key(cell)
+            if self.queued.get(cell) != key:
+                self.queued[cell] = key
+                heapq.heappush(self.queue, (*key, cell))
+                self.pushes += 1
+        else:
+            self.queued.pop(cell, None)
+
+    def compute(self, stats=None) -> List[int]:
+        """
+        Expand inconsistent vertices until the path to end is settled.
+
+        :param stats: Optional SearchStats to add this call's work counters to.
+        :return: Cells expanded by this call, in order.
+        """
+        g, rhs = self.g, self.rhs
+        queue, queued = self.queue, self.queued
+        offsets = self.flat.offsets4
+        target = self.target
+        expanded = []
+        pops = stale = 0
+
+        while queue:
+            k1, k2, cell = queue[0]
+            if queued.get(cell) != (k1, k2):
+                heapq.heappop(queue)
+                pops += 1
+                stale += 1
+                continue
+            if (k1, k2) >= self._key(target) and rhs[target] == g[target]:
+                break
+            heapq.heappop(queue)
+            pops += 1
+            del queued[cell]
+            expanded.append(cell)
+            if g[cell] > rhs[cell]:
+                g[cell] = rhs[cell]
+            else:
+                g[cell] = math.inf
+                self._update(cell)
+            for offset in offsets:
+                self._update(cell + offset)
+
+        if stats is not None:
+            stats.nodes_expanded += len(expanded)
+            stats.heap_pops += pops
+            stats.heap_pushes += self.pushes
+            stats.stale_pops += stale
+        self.pushes = 0
+        return expanded
+
+    def set_cells(self, changes: Iterable[Tuple[int, int, bool]], stats=None) -> List[int]:
+        """
+        Open or block cells and repair the search.
+
+        :param changes: (x, y, walkable) per cell; cells already in that state are skipped.
+        :param stats: Optional SearchStats to add the repair's work counters to.
+        :return: Cells expanded by the repair, in order.
+        """
+        flat = self.flat
+        changed = []
+        for x, y, walkable in changes:
+            if flat.is_walkable(x, y) != bool(walkable):
+                flat.set_walkable(x, y, walkable)
+                changed.append(flat.index(x, y))
+        # Edges into and out of a changed cell changed: it and its neighbours
+        for cell in changed:
+            self._update(cell)
+            for offset in flat.offsets4:
+                self._update(cell + offset)
+        return self.compute(stats)
+
+    def path(self) -> List[Tuple[int, int]]:
+        """
+        Current shortest path from start to end, or [] if end is unreachable.
+        """
+        g = self.g
+        if g[self.target] == math.inf:
+            return []
+        walkable = self.flat.walkable
+        offsets = self.flat.offsets4
+        cell = self.target
+        path = [self.flat.coords(cell)]
+        while cell != self.source:
+            # Step to the neighbour closest to start
+            cell = min((cell + offset for offset in offsets if walkable[cell + offset]),
+                       key=g.__getitem__)
+            path.append(self.flat.coords(cell))
+        path.reverse()
+        return path
+
+    def frontier(self) -> List[Tuple[int, int]]:
+        """
+        Cells still queued as locally inconsistent after the last compute.
+        """
+        return [self.flat.coords(cell) for cell in self.queued]
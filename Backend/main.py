@@ -1,10 +1,31 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 import numpy as np
 import asyncio
-from models import MapRequest, Algorithm
-from session_manager import SessionManager
-from pathfinding import PathFinder
+import json
+import math
+import random
+import threading
+import time
+from typing import Optional, Tuple
+from models import MapRequest, Algorithm, MapType, DistanceFieldRequest, ToggleCellsRequest
+from grid import MAX_COST, OBSTACLE, FlatGrid
+from distance_field import distance_fields
+from dijkstra import dijkstra_steps
+from astar import astar_steps
+from jps import jps_steps
+from hpa import abstract_graphs, hpa_steps
+from landmarks import astar_alt_steps, jps_alt_steps, landmark_tables
+from lpa_star import LPAStar
+from session_backend import create_session_backend
+from search_session import ResumableSearch
+from trace_store import StoredTrace, TraceStore
+from playback import DEFAULT_RATE, Playback, run_playback
+from compute_pool import create_compute_pool
+from map_generators import generate_grid, generate_terrain
+import metrics
+import profiling
 
 app = FastAPI()
 
@@ -17,61 +38,152 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-session_manager = SessionManager()
+# In-process by default; SESSION_BACKEND=sqlite:///path shares sessions between workers
+session_manager = create_session_backend()
+trace_store = TraceStore()
+# Map generation and whole searches run here, off the event loop ($PATHFINDING_WORKERS)
+compute_pool = create_compute_pool()
 
-def create_grid(size: Tuple[int, int], obstacle_count: int) -> np.ndarray:
+MAX_STEP_RANGE = 50000  # Most steps served by one /traces request
+
+# Request paths whose latency is recorded for /metrics
+TIMED_PATHS = {"/generate-map", "/next-step", "/toggle-cells"}
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    if request.url.path not in TIMED_PATHS:
+        return await call_next(request)
+    started = time.perf_counter()
+    response = await call_next(request)
+    metrics.observe_request(request.url.path, time.perf_counter() - started)
+    return response
+
+# Generator engines: each yields (level, {"x,y": next_nodes}) and returns the path
+STEP_ENGINES = {
+    Algorithm.DIJKSTRA: dijkstra_steps,
+    Algorithm.ASTAR: astar_steps,
+    Algorithm.JUMP_POINT: jps_steps,
+    Algorithm.ASTAR_ALT: astar_alt_steps,
+    Algorithm.JUMP_POINT_ALT: jps_alt_steps,
+    Algorithm.HPA: hpa_steps,
+}
+ALT_ALGORITHMS = (Algorithm.ASTAR_ALT, Algorithm.JUMP_POINT_ALT)
+
+async def create_grid(size: Tuple[int, int], obstacle_count: int,
+                      map_type: MapType = MapType.UNIFORM, seed: Optional[int] = None) -> np.ndarray:
     rows, cols = size
-    grid = np.zeros((rows, cols), dtype=int)
-    
-    # Keep start and end points clear
-    available_positions = [(i, j) for i in range(rows) for j in range(cols)
-                         if (i, j) != (0, 0) and (i, j) != (rows-1, cols-1)]
-    
-    # Place obstacles randomly
-    obstacle_positions = np.random.choice(
-        len(available_positions), 
-        size=min(obstacle_count, len(available_positions)), 
-        replace=False
-    )
-    
-    for pos_idx in obstacle_positions:
-        x, y = available_positions[pos_idx]
-        grid[x, y] = 1
-        
-        # Check if path exists (you'll need to implement this)
-        pathfinder = PathFinder(grid)
-        if not pathfinder.has_valid_path():
-            grid[x, y] = 0
-            
-    return grid
+    # Start (0, 0) and end (rows-1, cols-1) are kept clear and connected by the generator
+    return await compute_pool.generate_grid(rows, cols, obstacle_count, map_type.value, seed)
+
+async def create_terrain(size: Tuple[int, int], max_cost: int, seed: Optional[int] = None) -> Optional[np.ndarray]:
+    # None keeps the map unit-cost, so engines skip their weighted paths
+    if max_cost == 1:
+        return None
+    return await compute_pool.generate_terrain(size[0], size[1], max_cost, seed)
 
 @app.post("/generate-map")
-async def generate_map(request: MapRequest):
-    grid = create_grid(request.grid_size, request.obstacle_count)
-    pathfinder = PathFinder(grid)
-    
-    # Calculate all steps based on selected algorithm
-    if request.algorithm == Algorithm.DIJKSTRA:
-        steps = pathfinder.dijkstra()
-    elif request.algorithm == Algorithm.ASTAR:
-        steps = pathfinder.astar()  # To be implemented
+async def generate_map(request: MapRequest, x_profile: Optional[str] = Header(None)):
+    if not 1 <= request.max_cost <= MAX_COST:
+        raise HTTPException(status_code=400, detail=f"max_cost must be 1 to {MAX_COST}")
+    seed = request.seed
+    profiled = None
+    if request.profile or profiling.requested(x_profile):
+        # Profiled maps always get a seed so the slow case can be regenerated
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        grid, costs, profiled = await asyncio.to_thread(profile_map, request, seed)
     else:
-        steps = pathfinder.jump_point()  # To be implemented
+        grid = await create_grid(request.grid_size, request.obstacle_count,
+                           request.map_type, seed)
+        costs = await create_terrain(request.grid_size, request.max_cost, seed)
+    flat = FlatGrid(grid, costs=costs)
+    end = (flat.rows - 1, flat.cols - 1)
+    prepared = await prepare_search(flat, request.algorithm)
     
+    # Keep the search suspended in the session; /next-step advances it lazily
     session_data = {
         "grid": grid,
-        "algorithm": request.algorithm,
-        "steps": steps,
-        "current_step": 0
+        "costs": costs,
+        "flat_grid": flat,
+        "algorithm": request.algorithm.value,
+        "step": 0,
+        "search": start_search(flat, request.algorithm, prepared),
     }
     
     session_manager.add_session(request.session_id, session_data)
+    trace_id = register_trace(grid, flat, request.algorithm, costs)
     
-    return {
+    response = {
         "grid": grid.tolist(),
         "start": (0, 0),
-        "end": (request.grid_size[0]-1, request.grid_size[1]-1)
+        "end": (request.grid_size[0]-1, request.grid_size[1]-1),
+        "trace_id": trace_id
     }
+    if costs is not None:
+        response["costs"] = costs.tolist()
+    if profiled is not None:
+        # The profiled run already searched the whole map; keep its trace
+        trace, profile_name = profiled
+        stored = trace_store.get(trace_id)
+        if stored is not None and not stored.completed:
+            stored.steps = trace.steps
+            stored.path = trace.path
+        response["seed"] = seed
+        response["profile"] = profile_name
+    return response
+
+def profile_map(request: MapRequest, seed: int):
+    # Generation and the whole search run inline in this thread, so the
+    # profile shows them instead of a process-pool hand-off
+    rows, cols = request.grid_size
+    algorithm = request.algorithm
+    with profiling.RequestProfile(seed, algorithm.value) as profile:
+        grid = generate_grid(rows, cols, request.obstacle_count, request.map_type.value, seed)
+        costs = None if request.max_cost == 1 else generate_terrain(rows, cols, request.max_cost, seed)
+        flat = FlatGrid(grid, costs=costs)
+        trace = StoredTrace(flat, STEP_ENGINES[algorithm], (0, 0), (rows - 1, cols - 1), algorithm.value)
+        trace.ensure(math.inf)
+    return grid, costs, (trace, profile.save())
+
+def register_trace(grid: np.ndarray, flat: FlatGrid, algorithm: Algorithm,
+                   costs: Optional[np.ndarray] = None) -> str:
+    end = (flat.rows - 1, flat.cols - 1)
+    trace_id = trace_store.register(flat, algorithm.value, STEP_ENGINES[algorithm], (0, 0), end)
+    session_manager.save_trace(trace_id, grid, algorithm.value, (0, 0), end, costs)
+    return trace_id
+
+async def prepare_search(flat: FlatGrid, algorithm: Algorithm) -> dict:
+    # ALT tables and HPA* entrance graphs take up to seconds to build on a
+    # large map, so they are built (or fetched) in a thread and handed to the
+    # engine rather than built lazily on the search's first step, inside the
+    # event loop. Weighted maps use neither.
+    end = (flat.rows - 1, flat.cols - 1)
+    if flat.costs is not None:
+        return {}
+    if algorithm in ALT_ALGORITHMS:
+        return {"landmarks": await asyncio.to_thread(landmark_tables.prepare, flat, end)}
+    if algorithm == Algorithm.HPA:
+        return {"graph": await asyncio.to_thread(abstract_graphs.prepare, flat, (0, 0), end)}
+    return {}
+
+def start_search(flat: FlatGrid, algorithm: Algorithm, prepared: Optional[dict] = None) -> ResumableSearch:
+    # prepared: engine keyword arguments from prepare_search
+    stats = metrics.new_search_stats()
+    end = (flat.rows - 1, flat.cols - 1)
+    steps = STEP_ENGINES[algorithm](flat, (0, 0), end, stats=stats, **(prepared or {}))
+    return ResumableSearch(steps, cells=flat.size, stats=stats)
+
+async def session_search(session_data: dict) -> ResumableSearch:
+    # The suspended search is worker-local; if another worker served this
+    # session's last steps, replay the search up to the stored step
+    search = session_data.get("search")
+    if search is None or search.step_count != session_data["step"]:
+        flat = session_flat_grid(session_data)
+        algorithm = Algorithm(session_data["algorithm"])
+        search = start_search(flat, algorithm, await prepare_search(flat, algorithm))
+        search.skip(session_data["step"])
+        session_data["search"] = search
+    return search
 
 @app.post("/next-step")
 async def get_next_step(session_id: str):
@@ -79,20 +191,259 @@ async def get_next_step(session_id: str):
     if not session_data:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    if session_data["current_step"] >= len(session_data["steps"]):
-        return {"completed": True}
-    
-    step = session_data["steps"][session_data["current_step"]]
-    session_data["current_step"] += 1
+    search = await session_search(session_data)
+    step = search.next_step()
+    session_data["step"] = search.step_count
+    session_manager.save_session(session_id, session_data)
+    if step is None:
+        if search.stats is not None:
+            flat = session_flat_grid(session_data)
+            metrics.observe_search(session_data["algorithm"], flat.rows, flat.cols, search.stats)
+            search.stats = None  # Record each search once
+        return {"completed": True, "path": search.path}
     
     return {
         "current_node": step.current_node,
-        "visited_nodes": step.visited_nodes,
         "next_nodes": step.next_nodes,
-        "path_so_far": step.path_so_far,
+        "level": step.level,
+        "step": step.step,
         "completed": False
     }
 
+def lookup_trace(trace_id: str):
+    trace = trace_store.get(trace_id)
+    if trace is not None:
+        return trace
+    # Registered by another worker (or evicted here): rebuild it from the backend
+    record = session_manager.load_trace(trace_id)
+    if record is None:
+        return None
+    flat = FlatGrid(record["grid"], costs=record.get("costs"))
+    algorithm = Algorithm(record["algorithm"])
+    trace_store.register(flat, algorithm.value, STEP_ENGINES[algorithm], record["start"], record["end"])
+    trace = trace_store.get(trace_id)
+    if trace is not None and "steps" in record:
+        trace.steps = record["steps"]
+        trace.path = record["path"]
+        trace.saved = True
+    return trace
+
+@app.get("/traces/{trace_id}/steps")
+async def get_trace_steps(trace_id: str, request: Request,
+                          first: int = Query(0, alias="from", ge=0),
+                          last: int = Query(..., alias="to", ge=0)):
+    # Read-only: steps [from, to) of an immutable trace, safe to prefetch, retry and cache
+    trace = lookup_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    if last < first or last - first > MAX_STEP_RANGE:
+        raise HTTPException(status_code=400, detail=f"Range must be 0 to {MAX_STEP_RANGE} steps")
+
+    etag = f'"{trace_id}:{first}-{last}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    await compute_pool.fill_trace(trace, last)
+    steps = trace.step_range(first, last)
+    if trace.completed and not trace.saved:
+        session_manager.save_trace_result(trace_id, trace.steps, trace.path)
+        trace.saved = True
+    body = {
+        "trace_id": trace_id,
+        "from": first,
+        "to": first + len(steps),
+        "steps": [
+            {"current_node": node, "next_nodes": next_nodes, "level": level}
+            for node, next_nodes, level in steps
+        ],
+        "completed": trace.completed and first + len(steps) >= len(trace.steps),
+    }
+    if body["completed"]:
+        body["total"] = len(trace.steps)
+        body["path"] = trace.path
+    content = json.dumps(body)
+    metrics.observe_trace_bytes(trace.algorithm, trace.flat.rows, trace.flat.cols, len(content))
+    return Response(content, media_type="application/json", headers=headers)
+
+def session_flat_grid(session_data: dict) -> FlatGrid:
+    # Built once per session so per-map caches can key on its digest cheaply
+    if "flat_grid" not in session_data:
+        session_data["flat_grid"] = FlatGrid(session_data["grid"], costs=session_data.get("costs"))
+    return session_data["flat_grid"]
+
+def session_trace(session_data: dict):
+    # Re-registering is a no-op unless the trace was evicted from the store
+    flat = session_flat_grid(session_data)
+    algorithm = Algorithm(session_data["algorithm"])
+    trace_id = trace_store.register(flat, algorithm.value, STEP_ENGINES[algorithm],
+                                    (0, 0), (flat.rows - 1, flat.cols - 1))
+    return trace_store.get(trace_id)
+
+@app.websocket("/ws/playback/{session_id}")
+async def playback_socket(websocket: WebSocket, session_id: str, rate: float = DEFAULT_RATE):
+    # Server-paced animation: levels are pushed at the client's rate, with
+    # pause / resume / seek / rate control messages instead of one POST per step
+    await websocket.accept()
+    if not (math.isfinite(rate) and rate > 0):
+        # Same rule as the "rate" control message
+        await websocket.close(code=1008, reason="rate must be a positive finite number")
+        return
+    session_data = session_manager.get_session(session_id)
+    if not session_data:
+        await websocket.close(code=4404, reason="Session not found")
+        return
+    # Warm this worker's caches for traces whose search runs inline
+    await prepare_search(session_flat_grid(session_data), Algorithm(session_data["algorithm"]))
+    await run_playback(websocket, Playback(session_trace(session_data), rate, compute_pool.fill_trace))
+
+def session_planner(session_data: dict) -> LPAStar:
+    # Worker-local like the suspended search: built with one full solve the
+    # first time, or again if the map was edited elsewhere (another worker)
+    flat = session_flat_grid(session_data)
+    planner = session_data.get("planner")
+    if planner is None or planner.flat.digest() != flat.digest():
+        planner = LPAStar(flat, (0, 0), (flat.rows - 1, flat.cols - 1))
+        planner.compute()
+        session_data["planner"] = planner
+    return planner
+
+def replan(session_data: dict, cells, include_frontier: bool):
+    # Runs in a worker thread. Edits to one session go one at a time, and
+    # each diffs against the map the previous edit left behind
+    with session_data.setdefault("planner_lock", threading.Lock()):
+        flat = session_flat_grid(session_data)
+        # A cell listed twice flips back
+        changes = {}
+        for x, y in cells:
+            changes[(x, y)] = not changes.get((x, y), flat.is_walkable(x, y))
+        changes = {cell: walkable for cell, walkable in changes.items() if walkable != flat.is_walkable(*cell)}
+
+        # The planner keeps its search state, so only the affected region is re-searched
+        planner = session_planner(session_data)
+        stats = metrics.new_search_stats()
+        repaired = planner.set_cells([(x, y, walkable) for (x, y), walkable in changes.items()], stats)
+        metrics.observe_search("lpa_star", flat.rows, flat.cols, stats)
+
+        # Copy-on-write: stored traces and per-map caches still hold the old map
+        grid = np.array(session_data["grid"], copy=True)
+        for (x, y), walkable in changes.items():
+            grid[x, y] = 0 if walkable else OBSTACLE
+        flat = FlatGrid.from_walkable(flat.rows, flat.cols, planner.flat.walkable, flat.costs)
+        session_data.update(grid=grid, flat_grid=flat, step=0)
+        session_data.pop("search", None)  # /next-step restarts on the edited map
+
+        response = {
+            "path": planner.path(),
+            "obstacles": [cell for cell, walkable in changes.items() if not walkable],
+            "cleared": [cell for cell, walkable in changes.items() if walkable],
+            "repaired": [flat.cell_list(cell) for cell in repaired],
+        }
+        if include_frontier:
+            response["frontier"] = planner.frontier()
+        return grid, flat, response
+
+@app.post("/toggle-cells")
+async def toggle_cells(request: ToggleCellsRequest):
+    session_data = session_manager.get_session(request.session_id)
+    if not session_data:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    flat = session_flat_grid(session_data)
+    end = (flat.rows - 1, flat.cols - 1)
+    for x, y in request.cells:
+        if not flat.in_bounds(x, y) or (x, y) in ((0, 0), end):
+            raise HTTPException(status_code=400, detail="Cells must be on the grid and not the start or end")
+
+    # The first solve of a large map takes seconds, so it, the repair and
+    # the map update run off the event loop
+    grid, flat, response = await asyncio.to_thread(
+        replan, session_data, request.cells, request.include_frontier)
+
+    session_manager.add_session(request.session_id, session_data)
+    algorithm = Algorithm(session_data["algorithm"])
+    response["trace_id"] = register_trace(grid, flat, algorithm, session_data.get("costs"))
+    return response
+
+@app.post("/distance-field")
+async def distance_field(request: DistanceFieldRequest):
+    session_data = session_manager.get_session(request.session_id)
+    if not session_data:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    flat = session_flat_grid(session_data)
+    source = request.source or (flat.rows - 1, flat.cols - 1)
+    if not flat.is_walkable(*source):
+        raise HTTPException(status_code=400, detail="Source must be a walkable cell")
+
+    # One sweep per map and source; every start below is a parent-chain walk
+    field = distance_fields.lookup(flat, source)
+    if field is None:
+        field = await compute_pool.distance_field(flat, source)
+        distance_fields.store(flat, source, field)
+    response = {
+        "source": source,
+        "paths": [field.path_from(x, y) for x, y in request.starts],
+    }
+    if request.include_field:
+        response["distances"] = field.distance_grid()
+        response["parents"] = field.parent_grid()
+    return response
+
+def stream_levels(steps, sse: bool, on_complete=None):
+    # Forward each level as soon as the engine yields it, then the final path
+    sent = 0
+    while True:
+        try:
+            level, nodes = next(steps)
+            event = {"level": level, "nodes": nodes}
+        except StopIteration as stop:
+            event = {"completed": True, "path": stop.value}
+        line = json.dumps(event)
+        chunk = f"data: {line}\n\n" if sse else line + "\n"
+        sent += len(chunk)
+        yield chunk
+        if "completed" in event:
+            if on_complete is not None:
+                on_complete(sent)
+            return
+
+@app.get("/stream-steps/{session_id}")
+async def stream_steps(session_id: str, format: str = "ndjson"):
+    session_data = session_manager.get_session(session_id)
+    if not session_data:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+
+    flat = session_flat_grid(session_data)
+    algorithm = session_data["algorithm"]
+    stats = metrics.new_search_stats()
+    steps = STEP_ENGINES[Algorithm(algorithm)](flat, (0, 0), (flat.rows - 1, flat.cols - 1), stats=stats)
+    sse = format == "sse"
+
+    def on_complete(sent):
+        metrics.observe_search(algorithm, flat.rows, flat.cols, stats)
+        metrics.observe_trace_bytes(algorithm, flat.rows, flat.cols, sent)
+
+    # A sync iterator is run in the threadpool, so the search never blocks the event loop
+    return StreamingResponse(
+        stream_levels(steps, sse, on_complete),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+    )
+
+@app.get("/profiles/{name}")
+async def get_profile(name: str):
+    # cProfile output saved by a profiled /generate-map
+    path = profiling.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(session_manager.stats(), trace_store.stats()), media_type="text/plain; version=0.0.4")
+
 # Start session cleanup task
 @app.on_event("startup")
 async def startup_event():
@@ -101,4 +452,8 @@ async def startup_event():
             session_manager.cleanup_sessions()
             await asyncio.sleep(60)  # Check every minute
             
-    asyncio.create_task(cleanup_task()) 
\ No newline at end of file
+    asyncio.create_task(cleanup_task())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    compute_pool.shutdown() 
\ No newline at end of file
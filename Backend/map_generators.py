@@ -0,0 +1,252 @@
+import numpy as np
+
+from grid import OBSTACLE
+
+ROOM_BAND = 12  # Height of the bands rooms are chained along
+
+
+def _ranges(starts, lengths):
+    """
+    Concatenate np.arange(s, s + n) for every (s, n) pair without a Python loop.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(np.asarray(starts, dtype=np.int64), lengths) + np.arange(total) - offsets
+
+
+def reachable_from(free, start):
+    """
+    Vectorised flood fill over 4-connected free cells.
+
+    Expands the whole BFS frontier with one NumPy operation per level.
+
+    :param free: 2D boolean array, True for walkable cells.
+    :param start: Tuple (x, y) to flood from; must be walkable.
+    :return: 2D boolean array marking the cells reachable from start.
+    """
+    rows, cols = free.shape
+    stride = cols + 2
+    padded = np.zeros((rows + 2, stride), dtype=bool)
+    padded[1:-1, 1:-1] = free
+    walkable = padded.ravel()
+    seen = np.zeros_like(walkable)
+    offsets = np.array([-stride, stride, -1, 1])
+
+    source = (start[0] + 1) * stride + start[1] + 1
+    seen[source] = True
+    frontier = np.array([source])
+    while frontier.size:
+        neighbors = (frontier[:, None] + offsets).ravel()
+        neighbors = np.unique(neighbors[walkable[neighbors] & ~seen[neighbors]])
+        seen[neighbors] = True
+        frontier = neighbors
+
+    return seen.reshape(padded.shape)[1:-1, 1:-1]
+
+
+def ensure_connected(grid, start, end):
+    """
+    Make sure end is reachable from start, repairing the grid in place.
+
+    Runs one flood fill from start; if end is cut off, carves an L-shaped
+    corridor from end to the closest reachable cell.
+    """
+    grid[start] = 0
+    grid[end] = 0
+    reached = reachable_from(grid != OBSTACLE, start)
+    if reached[end]:
+        return grid
+
+    xs, ys = np.nonzero(reached)
+    nearest = np.argmin(np.abs(xs - end[0]) + np.abs(ys - end[1]))
+    x, y = int(xs[nearest]), int(ys[nearest])
+    grid[min(x, end[0]):max(x, end[0]) + 1, y] = 0
+    grid[end[0], min(y, end[1]):max(y, end[1]) + 1] = 0
+    return grid
+
+
+def uniform_noise(rows, cols, obstacle_count, rng, start, end):
+    """
+    Scatter exactly obstacle_count obstacles uniformly, then repair connectivity.
+    """
+    grid = np.zeros((rows, cols), dtype=int)
+    flat = grid.ravel()
+    blocked = np.ones(rows * cols, dtype=bool)
+    blocked[[start[0] * cols + start[1], end[0] * cols + end[1]]] = False
+    available = np.flatnonzero(blocked)
+    count = min(obstacle_count, available.size)
+    flat[rng.choice(available, size=count, replace=False)] = OBSTACLE
+    return ensure_connected(grid, start, end)
+
+
+def cellular_caves(rows, cols, obstacle_count, rng, start, end, iterations=4):
+    """
+    Cave map from a cellular automaton: seed random walls at the requested
+    density, then repeatedly turn a cell into a wall when at least 5 cells of
+    its 3x3 neighbourhood are walls (out-of-bounds counts as wall).
+    """
+    density = min(max(obstacle_count / float(rows * cols), 0.0), 0.7)
+    walls = rng.random((rows, cols)) < density
+
+    for _ in range(iterations):
+        padded = np.ones((rows + 2, cols + 2), dtype=np.int8)
+        padded[1:-1, 1:-1] = walls
+        counts = sum(
+            padded[1 + dx:rows + 1 + dx, 1 + dy:cols + 1 + dy]
+            for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+        )
+        walls = counts >= 5
+
+    grid = np.where(walls, OBSTACLE, 0)
+    return ensure_connected(grid, start, end)
+
+
+def recursive_division_maze(rows, cols, obstacle_count, rng, start, end):
+    """
+    Recursive-division maze, dividing every chamber of a recursion level at once.
+
+    Walls sit on odd rows/columns and each has a single gap on an even one, so
+    every even cell stays connected by construction; the corner cells are never
+    covered by a wall. obstacle_count is ignored.
+    """
+    grid = np.zeros((rows, cols), dtype=int)
+    flat = grid.ravel()
+    # Inclusive chamber bounds, one entry per chamber at the current level
+    r0 = np.array([0]); r1 = np.array([rows - 1])
+    c0 = np.array([0]); c1 = np.array([cols - 1])
+
+    while r0.size:
+        height = r1 - r0
+        width = c1 - c0
+        can_h = height >= 2
+        can_v = width >= 2
+        keep = can_h | can_v
+        r0, r1, c0, c1 = r0[keep], r1[keep], c0[keep], c1[keep]
+        height, width, can_h, can_v = height[keep], width[keep], can_h[keep], can_v[keep]
+        if not r0.size:
+            break
+
+        coin = rng.random(r0.size) < 0.5
+        horizontal = can_h & (~can_v | (height > width) | ((height == width) & coin))
+
+        # Horizontal walls: odd row strictly inside, gap on an even column
+        h = horizontal
+        wall_r = r0[h] + 1 + 2 * (rng.random(h.sum()) * ((height[h] - 2) // 2 + 1)).astype(np.int64)
+        gap_c = c0[h] + 2 * (rng.random(h.sum()) * (width[h] // 2 + 1)).astype(np.int64)
+        flat[_ranges(wall_r * cols + c0[h], width[h] + 1)] = OBSTACLE
+        flat[wall_r * cols + gap_c] = 0
+
+        # Vertical walls: odd column strictly inside, gap on an even row
+        v = ~horizontal
+        wall_c = c0[v] + 1 + 2 * (rng.random(v.sum()) * ((width[v] - 2) // 2 + 1)).astype(np.int64)
+        gap_r = r0[v] + 2 * (rng.random(v.sum()) * (height[v] // 2 + 1)).astype(np.int64)
+        column = _ranges(r0[v], height[v] + 1)
+        flat[column * cols + np.repeat(wall_c, height[v] + 1)] = OBSTACLE
+        flat[gap_r * cols + wall_c] = 0
+
+        # Split every chamber in two for the next level
+        r0 = np.concatenate([r0[h], wall_r + 1, r0[v], r0[v]])
+        r1 = np.concatenate([wall_r - 1, r1[h], r1[v], r1[v]])
+        c0 = np.concatenate([c0[h], c0[h], c0[v], wall_c + 1])
+        c1 = np.concatenate([c1[h], c1[h], wall_c - 1, c1[v]])
+
+    grid[start] = 0
+    grid[end] = 0
+    return grid
+
+
+def rooms_and_corridors(rows, cols, obstacle_count, rng, start, end):
+    """
+    Solid rock with rectangular rooms carved out, chained together by
+    L-shaped corridors. The start and end cells are the first and last links
+    of the chain, so they are connected by construction. obstacle_count is ignored.
+    """
+    grid = np.full((rows, cols), OBSTACLE, dtype=int)
+    flat = grid.ravel()
+
+    room_count = max(1, (rows * cols) // 200)
+    heights = rng.integers(2, max(3, min(10, rows // 3 + 1)), size=room_count)
+    widths = rng.integers(2, max(3, min(10, cols // 3 + 1)), size=room_count)
+    heights = np.minimum(heights, rows)
+    widths = np.minimum(widths, cols)
+    tops = (rng.random(room_count) * (rows - heights + 1)).astype(np.int64)
+    lefts = (rng.random(room_count) * (cols - widths + 1)).astype(np.int64)
+
+    # Carve every row of every room in one scatter
+    room_rows = _ranges(tops, heights)
+    row_lefts = np.repeat(lefts, heights)
+    row_widths = np.repeat(widths, heights)
+    flat[np.repeat(room_rows * cols, row_widths) + _ranges(row_lefts, row_widths)] = 0
+
+    # Chain rooms in serpentine order over horizontal bands so that
+    # consecutive rooms are close together
+    centres_x = tops + heights // 2
+    centres_y = lefts + widths // 2
+    band = centres_x // ROOM_BAND
+    order = np.lexsort((np.where(band % 2 == 0, centres_y, -centres_y), band))
+    xs = np.concatenate([[start[0]], centres_x[order], [end[0]]])
+    ys = np.concatenate([[start[1]], centres_y[order], [end[1]]])
+
+    # Horizontal leg along row xs[i] from ys[i] to ys[i+1], then vertical leg
+    # along column ys[i+1] from xs[i] to xs[i+1]
+    y_lo = np.minimum(ys[:-1], ys[1:])
+    y_len = np.abs(ys[1:] - ys[:-1]) + 1
+    flat[np.repeat(xs[:-1] * cols, y_len) + _ranges(y_lo, y_len)] = 0
+    x_lo = np.minimum(xs[:-1], xs[1:])
+    x_len = np.abs(xs[1:] - xs[:-1]) + 1
+    flat[_ranges(x_lo, x_len) * cols + np.repeat(ys[1:], x_len)] = 0
+
+    return grid
+
+
+GENERATORS = {
+    "uniform": uniform_noise,
+    "caves": cellular_caves,
+    "maze": recursive_division_maze,
+    "rooms": rooms_and_corridors,
+}
+
+
+def generate_grid(rows, cols, obstacle_count, map_type="uniform", seed=None):
+    """
+    Build a map whose end (rows-1, cols-1) is reachable from start (0, 0).
+
+    :param rows: Number of rows.
+    :param cols: Number of columns.
+    :param obstacle_count: Obstacle budget (used by "uniform" and "caves").
+    :param map_type: One of the GENERATORS keys.
+    :param seed: Optional seed for reproducible maps.
+    :return: 2D int array where 6 marks obstacles and 0 empty cells.
+    """
+    rng = np.random.default_rng(seed)
+    start = (0, 0)
+    end = (rows - 1, cols - 1)
+    return GENERATORS[map_type](rows, cols, obstacle_count, rng, start, end)
+
+
+def generate_terrain(rows, cols, max_cost, seed=None, scale=16):
+    """
+    Smooth per-cell terrain costs: value noise on a coarse lattice, blended
+    bilinearly so cheap and expensive regions form patches.
+
+    :param rows: Number of rows.
+    :param cols: Number of columns.
+    :param max_cost: Highest cost, at most grid.MAX_COST; 1 gives uniform terrain.
+    :param seed: Optional seed for reproducible terrain.
+    :param scale: Lattice spacing in cells; larger means bigger patches.
+    :return: 2D uint8 array of costs from 1 to max_cost.
+    """
+    rng = np.random.default_rng(seed)
+    lattice = rng.random((rows // scale + 2, cols // scale + 2), dtype=np.float32)
+    xs = np.arange(rows, dtype=np.float32) / scale
+    ys = np.arange(cols, dtype=np.float32) / scale
+    x0, y0 = xs.astype(np.int64), ys.astype(np.int64)
+    fx, fy = (xs - x0)[:, None], (ys - y0)[None, :]
+
+    top, bottom = lattice[x0], lattice[x0 + 1]
+    noise = (top[:, y0] * (1 - fy) + top[:, y0 + 1] * fy) * (1 - fx)
+    noise += (bottom[:, y0] * (1 - fy) + bottom[:, y0 + 1] * fy) * fx
+    return np.minimum(noise * max_cost + 1, max_cost).astype(np.uint8)
@@ -0,0 +1,158 @@
+"""
+Prometheus-style metrics for the API, rendered in the text exposition format
+at /metrics.
+
+Search counters (search_stats.SearchStats) are recorded as histograms per
+algorithm and grid size class, next to request latency. The session
+backend's and the trace store's stats() (entries held, bytes in use,
+evictions, ...) are rendered as gauges and counters at scrape time. Set
+PATHFINDING_METRICS=0 to turn recording off; engines then run without a
+SearchStats and nothing is observed.
+"""
+import os
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from search_stats import SearchStats
+
+ENABLED = os.environ.get("PATHFINDING_METRICS", "1") != "0"
+
+COUNT_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_CLASSES = (400, 2_500, 10_000, 40_000, 250_000, 1_000_000, 4_000_000, 16_000_000)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with labels.
+
+    :param name: Metric name.
+    :param help_text: HELP line.
+    :param labels: Label names, in the order observe() receives values.
+    :param buckets: Upper bounds of the buckets, ascending; +Inf is implicit.
+    """
+    def __init__(self, name: str, help_text: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self.series: Dict[Tuple[str, ...], list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_values, (counts, total) in sorted(self.series.items()):
+                labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+                prefix = labels + "," if labels else ""
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+                lines.append(f"{self.name}_sum{{{labels}}} {total:g}")
+                lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+SEARCH_LABELS = ("algorithm", "grid_cells")
+
+nodes_expanded = Histogram("pathfinding_nodes_expanded", "Nodes expanded per search.",
+                           SEARCH_LABELS, COUNT_BUCKETS)
+heap_pushes = Histogram("pathfinding_heap_pushes", "Open-set insertions per search.",
+                        SEARCH_LABELS, COUNT_BUCKETS)
+heap_pops = Histogram("pathfinding_heap_pops", "Open-set removals per search.",
+                      SEARCH_LABELS, COUNT_BUCKETS)
+stale_pops = Histogram("pathfinding_stale_pops", "Removals of already expanded nodes per search.",
+                       SEARCH_LABELS, COUNT_BUCKETS)
+jump_cells = Histogram("pathfinding_jump_cells", "Cells scanned by JPS jumps per search.",
+                       SEARCH_LABELS, COUNT_BUCKETS)
+trace_bytes = Histogram("pathfinding_trace_bytes", "Bytes of step trace per response or stream.",
+                        SEARCH_LABELS, COUNT_BUCKETS)
+request_seconds = Histogram("http_request_duration_seconds", "Request latency.",
+                            ("path",), LATENCY_BUCKETS)
+
+REGISTRY = (nodes_expanded, heap_pushes, heap_pops, stale_pops, jump_cells, trace_bytes, request_seconds)
+
+STORE_COUNTERS = ("evictions", "expirations")  # Only ever grow; other store stats are gauges
+
+
+def size_class(rows: int, cols: int) -> str:
+    """
+    Grid size label: the smallest class bound holding rows * cols cells, so
+    arbitrary sizes map onto a few label values.
+    """
+    cells = rows * cols
+    index = bisect_left(SIZE_CLASSES, cells)
+    return str(SIZE_CLASSES[index]) if index < len(SIZE_CLASSES) else "+Inf"
+
+
+def new_search_stats() -> Optional[SearchStats]:
+    """
+    A SearchStats to pass to an engine, or None when metrics are off.
+    """
+    return SearchStats() if ENABLED else None
+
+
+def observe_search(algorithm: str, rows: int, cols: int, stats):
+    if stats is None:
+        return
+    labels = (algorithm, size_class(rows, cols))
+    nodes_expanded.observe(stats.nodes_expanded, *labels)
+    heap_pushes.observe(stats.heap_pushes, *labels)
+    heap_pops.observe(stats.heap_pops, *labels)
+    stale_pops.observe(stats.stale_pops, *labels)
+    if stats.jump_cells:
+        jump_cells.observe(stats.jump_cells, *labels)
+
+
+def observe_trace_bytes(algorithm: str, rows: int, cols: int, size: int):
+    if ENABLED:
+        trace_bytes.observe(size, algorithm, size_class(rows, cols))
+
+
+def observe_request(path: str, seconds: float):
+    if ENABLED:
+        request_seconds.observe(seconds, path)
+
+
+def render_store_stats(store: str, stats: Dict[str, int]) -> List[str]:
+    """
+    A store's stats, e.g. {"sessions": 3, "evictions": 1} for store
+    "session", as pathfinding_<store>s and pathfinding_<store>_<name>[_total]
+    samples.
+    """
+    lines = []
+    for key, value in sorted(stats.items()):
+        if key == store + "s":
+            name, kind = f"pathfinding_{key}", "gauge"
+        elif key in STORE_COUNTERS:
+            name, kind = f"pathfinding_{store}_{key}_total", "counter"
+        else:
+            name, kind = f"pathfinding_{store}_{key}", "gauge"
+        description = key.replace("_", " ").capitalize()
+        lines += [f"# HELP {name} {description} of the {store} store.", f"# TYPE {name} {kind}",
+                  f"{name} {value}"]
+    return lines
+
+
+def render(session_stats: Optional[Dict[str, int]] = None,
+           trace_stats: Optional[Dict[str, int]] = None) -> str:
+    lines = []
+    for histogram in REGISTRY:
+        lines.extend(histogram.render())
+    if session_stats:
+        lines.extend(render_store_stats("session", session_stats))
+    if trace_stats:
+        lines.extend(render_store_stats("trace", trace_stats))
+    return "\n".join(lines) + "\n"
@@ -1,20 +1,55 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from enum import Enum
 from typing import List, Tuple, Optional
 
+from grid import MAX_CELLS
+
 class Algorithm(str, Enum):
     DIJKSTRA = "dijkstra"
     ASTAR = "astar"
     JUMP_POINT = "jump_point"
+    ASTAR_ALT = "astar_alt"  # A* with landmark (ALT) bounds, tables cached per map
+    JUMP_POINT_ALT = "jump_point_alt"
+    HPA = "hpa"  # hierarchical, near-optimal; for very large maps
+
+class MapType(str, Enum):
+    UNIFORM = "uniform"  # obstacles scattered uniformly at random
+    CAVES = "caves"  # cellular-automata caves
+    MAZE = "maze"  # recursive-division maze
+    ROOMS = "rooms"  # rooms joined by corridors
 
 class MapRequest(BaseModel):
     session_id: str
     algorithm: Algorithm
-    obstacle_count: int
+    obstacle_count: int = Field(ge=0)
     grid_size: Tuple[int, int] = (20, 20)  # default 20x20
+    map_type: MapType = MapType.UNIFORM
+    seed: Optional[int] = None  # fixed seed for reproducible maps
+    profile: bool = False  # run under cProfile and save the profile (also the X-Profile header)
+    max_cost: int = 1  # terrain costs 1..max_cost per cell; 1 is a unit-cost map
+
+    @field_validator("grid_size")
+    @classmethod
+    def check_grid_size(cls, size):
+        # Same limit as the Lambda (pathfinding.py)
+        rows, cols = size
+        if rows < 1 or cols < 1 or rows * cols > MAX_CELLS:
+            raise ValueError(f"Grid must have between 1 and {MAX_CELLS} cells")
+        return size
 
 class PathStep(BaseModel):
-    current_node: Tuple[int, int]
-    visited_nodes: List[Tuple[int, int]]
-    next_nodes: List[Tuple[int, int]]
-    path_so_far: List[Tuple[int, int]] 
\ No newline at end of file
+    current_node: Tuple[int, int]  # node expanded in this step
+    next_nodes: List[Tuple[int, int]]  # nodes it queued
+    level: int  # step_info level the expansion belongs to
+    step: int  # 0-based index of this step in the search 
+
+class ToggleCellsRequest(BaseModel):
+    session_id: str
+    cells: List[Tuple[int, int]]  # each flips between free and obstacle
+    include_frontier: bool = True  # return the cells still queued after the repair
+
+class DistanceFieldRequest(BaseModel):
+    session_id: str
+    source: Optional[Tuple[int, int]] = None  # defaults to the session's end point
+    starts: List[Tuple[int, int]] = []  # answer a shortest path from each of these
+    include_field: bool = True  # return the full distance and parent grids
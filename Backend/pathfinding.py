@@ -1,160 +1,252 @@
+import base64
 import json
+import os
 import random
+import zlib
 
-from heapq import heappush, heappop
-from collections import defaultdict
-# from dijkstra import dijkstra_algorithm
-
-
-def create_empty_grid(size=20):
-    grid = []
-    for i in range(size):
-        row = []
-        for j in range(size):
-            # Set start point (0,0) and end point (19,19)
-            if i == 0 and j == 0:
-                row.append(1)  # Start
-            elif i == size-1 and j == size-1:
-                row.append(2)  # End
-            else:
-                row.append(0)  # Empty
-        grid.append(row)
-    return grid
-
-def is_valid_path_exists(grid):
-    size = len(grid)
-    visited = [[False] * size for _ in range(size)]
-    
-    def is_valid_move(x, y):
-        return (0 <= x < size and 
-                0 <= y < size and 
-                not visited[x][y] and 
-                grid[x][y] != 6)  # Not an obstacle
-    
-    def dfs(x, y):
-        if x == size-1 and y == size-1:  # Reached end point
-            return True
-            
-        visited[x][y] = True
-        
-        # Try all 4 directions: right, down, left, up
-        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-        for dx, dy in directions:
-            new_x, new_y = x + dx, y + dy
-            if is_valid_move(new_x, new_y):
-                if dfs(new_x, new_y):
-                    return True
-                    
-        return False
-    
-    return dfs(0, 0)  # Start from (0,0)
-
-def add_obstacles(grid, obstacle_count):
-    size = len(grid)
-    obstacles_added = 0
-    max_attempts = obstacle_count * 10  # Prevent infinite loop
-    attempts = 0
-    
-    while obstacles_added < obstacle_count and attempts < max_attempts:
-        # Create a copy of the grid
-        temp_grid = [row[:] for row in grid]
-        
-        i = random.randint(0, size-1)
-        j = random.randint(0, size-1)
-        
-        # Don't place obstacles on start, end, or existing obstacles
-        if temp_grid[i][j] == 0:
-            temp_grid[i][j] = 6  # Add obstacle temporarily
-            
-            # Check if path still exists
-            if is_valid_path_exists(temp_grid):
-                grid[i][j] = 6  # Make obstacle permanent
-                obstacles_added += 1
-                
-        attempts += 1
-    
-    return grid
-
-def get_path_information(grid, algorithm):
-    start = (0, 0)
-    end = (len(grid)-1, len(grid)-1)
-    
-    if algorithm == 0:
-        return dijkstra_algorithm(grid, start, end)
-    elif algorithm == 1:
-        return astar_algorithm(grid, start, end)
-    elif algorithm == 2:
-        return jps_algorithm(grid, start, end)
-    else:
-        return dijkstra_algorithm(grid, start, end)  # default to Dijkstra
-
-class PathResult:
-    def __init__(self, shortest_path, step_info):
-        self.shortest_path = shortest_path  # List of tuples [(x,y), ...]
-        self.step_info = step_info  # Dict of "x,y": [[next_x, next_y], ...]
+from array import array
+from contextlib import nullcontext
+from collections import deque
+from astar import astar_algorithm, astar_steps
+from dijkstra import dijkstra_algorithm, dijkstra_steps
+from grid import MAX_CELLS, FlatGrid, as_flat_grid
+from hpa import hpa_algorithm, hpa_steps
+from jps import jps_algorithm, jps_steps
+from profiling import RequestProfile
+from trace_codec import as_levels, encode_trace_base64
+
+# Lambda can only write under /tmp
+PROFILE_DIR = os.environ.get("PATHFINDING_PROFILE_DIR", "/tmp/profiles")
+
+# Algorithm numbers of the Lambda API, named as in models.Algorithm
+ALGORITHM_NAMES = {0: "dijkstra", 1: "astar", 2: "jump_point", 3: "hpa"}
+ENGINES = {0: dijkstra_algorithm, 1: astar_algorithm, 2: jps_algorithm, 3: hpa_algorithm}
+STEP_ENGINES = {0: dijkstra_steps, 1: astar_steps, 2: jps_steps, 3: hpa_steps}
+
+DEFAULT_SIZE = 20
+
+# Cell states used by the flat placement buffer. ROUTE marks cells that must
+# stay open and SPARE is scratch space for scatter().
+FREE, PLACED, WALL, ROUTE, SPARE = 0, 1, 2, 3, 4
+
+def relabel(old, new):
+    """
+    bytes.translate table that turns cell state `old` into `new`.
+    """
+    table = bytearray(range(256))
+    table[old] = new
+    return bytes(table)
+
+# Cell states -> walkable flags (FlatGrid) and grid status numbers (README)
+WALKABLE = bytes([1, 0, 0, 1]) + bytes(252)
+STATUS = bytes([0, 6, 6, 0]) + bytes(252)
+
+def create_empty_cells(rows, cols):
+    """
+    A rows x cols placement buffer of FREE cells with a one-cell WALL border,
+    in the FlatGrid layout: cell (x, y) is index (x + 1) * stride + (y + 1).
+    """
+    stride = cols + 2
+    cells = bytearray((rows + 2) * stride)
+    cells[:stride] = bytes([WALL]) * stride
+    cells[-stride:] = bytes([WALL]) * stride
+    cells[::stride] = bytes([WALL]) * (rows + 2)
+    cells[stride - 1::stride] = bytes([WALL]) * (rows + 2)
+    return cells, stride
+
+def min_obstacle_path(cells, stride, start, end):
+    """
+    0-1 BFS from start to end where stepping onto a PLACED cell costs 1,
+    other open cells cost 0 and WALL cells are impassable.
+
+    Costs live in one int array and parents as a direction byte per cell, so
+    a 4000 x 4000 map needs about 80 MB rather than two lists of objects.
+
+    :return: The path as a list of flat indices that crosses the fewest
+             PLACED cells, or None if the end is walled off.
+    """
+    offsets = (1, stride, -1, -stride)
+    cost = array("i", [len(cells)]) * len(cells)
+    came_by = bytearray(len(cells))  # 1 + index into offsets of the step into a cell
+    cost[start] = 0
+    queue = deque([start])
+
+    current = start
+    while queue:
+        current = queue.popleft()
+        if current == end:
+            break
+        current_cost = cost[current]
+        for direction, offset in enumerate(offsets, 1):
+            neighbor = current + offset
+            state = cells[neighbor]
+            if state == WALL:
+                continue
+            if state == PLACED:
+                new_cost = current_cost + 1
+                if new_cost < cost[neighbor]:
+                    cost[neighbor] = new_cost
+                    came_by[neighbor] = direction
+                    queue.append(neighbor)
+            elif current_cost < cost[neighbor]:
+                cost[neighbor] = current_cost
+                came_by[neighbor] = direction
+                queue.appendleft(neighbor)
+
+    if current != end:
+        return None
+
+    path = [end]
+    while path[-1] != start:
+        path.append(path[-1] - offsets[came_by[path[-1]] - 1])
+    return path
+
+def scatter(cells, stride, old, new, count):
+    """
+    Turn `count` cells in state `old`, chosen uniformly at random, into `new`.
+
+    Cells are picked by probing random indices, which needs no candidate
+    list; when most candidates are taken every one is marked and the rest
+    given back instead, and when candidates are rare they are listed.
+
+    :return: The number of cells changed.
+    """
+    available = cells.count(old)
+    count = max(0, min(count, available))
+    if count * 2 > available:
+        cells[:] = cells.translate(relabel(old, SPARE))
+        scatter(cells, stride, SPARE, old, available - count)
+        cells[:] = cells.translate(relabel(SPARE, new))
+        return count
+    if available * 8 < len(cells):
+        candidates = []
+        i = cells.find(old)
+        while i != -1:
+            candidates.append(i)
+            i = cells.find(old, i + 1)
+        for i in random.sample(candidates, count):
+            cells[i] = new
+        return count
+    size = len(cells)
+    remaining = count
+    while remaining > 0:
+        i = random.randrange(stride, size - stride)
+        if cells[i] == old:
+            cells[i] = new
+            remaining -= 1
+    return count
+
+def place_obstacles(cells, stride, obstacle_count, start, end):
+    """
+    Place up to obstacle_count obstacles on FREE cells of a placement buffer
+    while keeping `end` reachable from `start` (flat indices).
+
+    All obstacles are placed in one batch, then a single repair pass finds the
+    start -> end route through the fewest new obstacles, clears those, and
+    re-places the same number elsewhere off that route. Since the route stays
+    open, no further connectivity checks are needed.
+    """
+    cells[start] = cells[end] = ROUTE  # Never covered
+    scatter(cells, stride, FREE, PLACED, obstacle_count)
+
+    path = min_obstacle_path(cells, stride, start, end)
+    if path is None:
+        # Existing obstacles already cut the end off; nothing can be added
+        return
+
+    cleared = 0
+    for i in path:
+        if cells[i] == PLACED:
+            cleared += 1
+        cells[i] = ROUTE
+
+    if cleared:
+        scatter(cells, stride, FREE, PLACED, cleared)
+    cells[:] = cells.translate(relabel(ROUTE, FREE))
+
+def generate_cells(rows, cols, obstacle_count, start, end):
+    """
+    Build a map as a placement buffer, without going through a 2D list.
+
+    :return: (cells, stride) as described in create_empty_cells.
+    """
+    cells, stride = create_empty_cells(rows, cols)
+    place_obstacles(cells, stride, obstacle_count,
+                    (start[0] + 1) * stride + start[1] + 1, (end[0] + 1) * stride + end[1] + 1)
+    return cells, stride
+
+def status_rows(cells, stride, rows, cols, start, end):
+    """
+    Yield each map row as bytes of grid status numbers: 0 empty, 6 obstacle,
+    1 start and 2 end.
+    """
+    for x in range(rows):
+        base = (x + 1) * stride + 1
+        row = cells[base:base + cols].translate(STATUS)
+        if x == start[0]:
+            row[start[1]] = 1
+        if x == end[0]:
+            row[end[1]] = 2
+        yield row
+
+def encode_map_base64(cells, stride, rows, cols, start, end):
+    """
+    The map as one status byte per cell, row-major, deflated and base64-encoded.
+    """
+    compressor = zlib.compressobj()
+    chunks = [compressor.compress(row) for row in status_rows(cells, stride, rows, cols, start, end)]
+    chunks.append(compressor.flush())
+    return base64.b64encode(b"".join(chunks)).decode("ascii")
+
+def get_path_information(grid, algorithm, start=(0, 0), end=None):
+    """
+    Run the selected algorithm (0 Dijkstra, 1 A*, 2 JPS, 3 HPA*; anything
+    else is Dijkstra) on a 2D grid or FlatGrid.
+
+    :return: PathResult with shortest_path and step_info.
+    """
+    flat = as_flat_grid(grid)
+    end = (flat.rows - 1, flat.cols - 1) if end is None else end
+    return ENGINES.get(algorithm, dijkstra_algorithm)(flat, start, end)
+
+def get_shortest_path(flat, algorithm, start, end):
+    """
+    Like get_path_information but keeps no trace: levels are dropped as the
+    engine yields them, so only the path is held in memory.
+    """
+    steps = STEP_ENGINES.get(algorithm, dijkstra_steps)(flat, start, end)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
 
 def format_path_info(path_result):
     # Convert step_info to the format expected by frontend
     formatted_info = []
-    for pos, next_nodes in path_result.step_info.items():
-        formatted_info.append({pos: next_nodes})
+    for nodes in as_levels(path_result.step_info).values():
+        for pos, next_nodes in nodes.items():
+            formatted_info.append({pos: next_nodes})
     return formatted_info
 
+def parse_point(value, default, rows, cols):
+    if value is None:
+        return default
+    x, y = (int(v) for v in value)
+    if not (0 <= x < rows and 0 <= y < cols):
+        raise ValueError(f"Point {[x, y]} is outside the {rows}x{cols} grid")
+    return x, y
 
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
+    'Access-Control-Allow-Credentials': True,
+    'Content-Type': 'application/json'
+}
 
-def dijkstra_algorithm(grid, start, end):
-    size = len(grid)
-    distances = defaultdict(lambda: float('inf'))
-    distances[start] = 0
-    pq = [(0, start)]
-    came_from = {}
-    step_info = defaultdict(list)
-    
-    def get_neighbors(pos):
-        x, y = pos
-        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-        neighbors = []
-        for dx, dy in directions:
-            new_x, new_y = x + dx, y + dy
-            if (0 <= new_x < size and 
-                0 <= new_y < size and 
-                grid[new_x][new_y] != 6):  # not an obstacle
-                neighbors.append((new_x, new_y))
-        return neighbors
-    
-    while pq:
-        current_dist, current = heappop(pq)
-        
-        if current == end:
-            break
-            
-        if current_dist > distances[current]:
-            continue
-            
-        neighbors = get_neighbors(current)
-        step_info[f"{current[0]},{current[1]}"] = [[n[0], n[1]] for n in neighbors]
-        
-        for neighbor in neighbors:
-            distance = current_dist + 1
-            
-            if distance < distances[neighbor]:
-                distances[neighbor] = distance
-                came_from[neighbor] = current
-                heappush(pq, (distance, neighbor))
-    
-    # Reconstruct path
-    path = []
-    current = end
-    while current in came_from:
-        path.append(current)
-        current = came_from[current]
-    path.append(start)
-    path.reverse()
-    
-    return PathResult(path, step_info)
-
-
-def lambda_handler(event, context):    
+
+def lambda_handler(event, context):
     # Handle OPTIONS request (preflight)
     # if event.get('httpMethod') == 'OPTIONS':
     #     return {
@@ -174,45 +266,94 @@ def lambda_handler(event, context):
             body = json.loads(event.get('body', '{}'))
         else:
             body = event.get('body', {})
-            
+
         algorithm = body.get('algorithm', 0)
         obstacle_count = body.get('obstacleCount', 20)
-        
-        # Create grid and add obstacles
-        grid = create_empty_grid()
-        grid = add_obstacles(grid, obstacle_count)
-        
-        # Get path information using selected algorithm
-        path_result = get_path_information(grid, algorithm)
-        path_info = format_path_info(path_result.step_info)
-        
+        if isinstance(obstacle_count, bool) or not isinstance(obstacle_count, int) or obstacle_count < 0:
+            raise ValueError("obstacleCount must be a non-negative integer")
+        # 'json' (default), 'binary' (base64 blob in the layout documented in
+        # trace_codec) or 'none' to return only the path, for very large maps
+        trace_format = body.get('traceFormat', 'json')
+        # 'json' (default) nested rows or 'binary': base64 of the deflated
+        # status bytes, row-major
+        map_format = body.get('mapFormat', 'json')
+
+        rows = int(body.get('rows', DEFAULT_SIZE))
+        cols = int(body.get('cols', rows))
+        if rows < 1 or cols < 1 or rows * cols > MAX_CELLS:
+            raise ValueError(f"Grid must have between 1 and {MAX_CELLS} cells")
+        start = parse_point(body.get('start'), (0, 0), rows, cols)
+        end = parse_point(body.get('end'), (rows - 1, cols - 1), rows, cols)
+
+        # 'profile': true runs this request under cProfile; the stats are
+        # saved under PROFILE_DIR and summarised in the response
+        profile = None
+        seed = body.get('seed')
+        if body.get('profile'):
+            if seed is None:
+                seed = random.randrange(2 ** 32)
+            profile = RequestProfile(seed, ALGORITHM_NAMES.get(algorithm, "dijkstra"), PROFILE_DIR)
+        if seed is not None:
+            random.seed(seed)
+
+        with profile or nullcontext():
+            # Create grid and add obstacles
+            cells, stride = generate_cells(rows, cols, obstacle_count, start, end)
+            flat = FlatGrid.from_walkable(rows, cols, cells.translate(WALKABLE))
+
+            # Get path information using selected algorithm
+            if trace_format == 'none':
+                shortest_path = get_shortest_path(flat, algorithm, start, end)
+                path_info = None
+            else:
+                path_result = get_path_information(flat, algorithm, start, end)
+                shortest_path = path_result.shortest_path
+                if trace_format == 'binary':
+                    path_info = encode_trace_base64(path_result.step_info, rows, cols)
+                else:
+                    path_info = format_path_info(path_result)
+                del path_result
+        del flat
+
+        if map_format == 'binary':
+            grid = encode_map_base64(cells, stride, rows, cols, start, end)
+        else:
+            grid = [list(row) for row in status_rows(cells, stride, rows, cols, start, end)]
+
+        response_body = {
+            'map': grid,
+            'mapFormat': map_format,
+            'rows': rows,
+            'cols': cols,
+            'start': start,
+            'end': end,
+            'pathInformation': path_info,
+            'traceFormat': trace_format,
+            'shortestPath': [[x, y] for x, y in shortest_path]
+        }
+        if profile is not None:
+            response_body['seed'] = seed
+            response_body['profile'] = {'file': profile.save(), 'summary': profile.summary()}
+
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-                'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
-                'Access-Control-Allow-Credentials': True,
-                'Content-Type': 'application/json'
-            },
+            'headers': CORS_HEADERS,
+            'body': json.dumps(response_body)
+        }
+
+    except (TypeError, ValueError) as e:
+        return {
+            'statusCode': 400,
+            'headers': CORS_HEADERS,
             'body': json.dumps({
-                'map': grid,
-                'pathInformation': path_info,
-                'shortestPath': [[x, y] for x, y in path_result.shortest_path]
+                'error': str(e)
             })
         }
-        
     except Exception as e:
         return {
             'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-                'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
-                'Access-Control-Allow-Credentials': True,
-                'Content-Type': 'application/json'
-            },
+            'headers': CORS_HEADERS,
             'body': json.dumps({
                 'error': str(e)
             })
-        }
\ No newline at end of file
+        }
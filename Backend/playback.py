@@ -0,0 +1,122 @@
+import asyncio
+import json
+import math
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+DEFAULT_RATE = 20.0  # Levels pushed per second
+MIN_RATE = 0.1
+MAX_RATE = 1000.0
+
+
+class Playback:
+    """
+    Position and controls of one client's animation over a stored trace.
+
+    Control messages from the client are JSON objects:
+    {"type": "pause"}, {"type": "resume"}, {"type": "seek", "step": n}
+    and {"type": "rate", "levels_per_second": r}.
+
+    :param trace: trace_store.StoredTrace to play.
+    :param rate: Initial number of levels pushed per second.
+    :param fill: Coroutine function (trace, count) that makes steps available
+                 off the event loop, such as ComputePool.fill_trace; None
+                 runs the search inline.
+    """
+    def __init__(self, trace, rate=DEFAULT_RATE, fill=None):
+        self.trace = trace
+        self.fill = fill
+        self.position = 0
+        self.rate = min(max(rate, MIN_RATE), MAX_RATE)
+        self.playing = True
+        self.closed = False
+        self.outbox = []  # Replies to control messages, sent by the playback loop
+        self.changed = asyncio.Event()
+
+    def handle(self, message: dict):
+        """
+        Apply one control message.
+        """
+        kind = message.get("type")
+        if kind == "pause":
+            self.playing = False
+        elif kind == "resume":
+            self.playing = True
+        elif kind == "seek":
+            self.position = max(0, int(message["step"]))
+        elif kind == "rate":
+            rate = float(message["levels_per_second"])
+            if not (math.isfinite(rate) and rate > 0):
+                raise ValueError("levels_per_second must be a positive finite number")
+            self.rate = min(max(rate, MIN_RATE), MAX_RATE)
+        else:
+            raise ValueError(f"Unknown message type: {kind}")
+        self.changed.set()
+
+    async def next_frame(self) -> dict:
+        """
+        The next level of the trace as a message, advancing the position.
+        Past the last step the search result is sent and playback pauses.
+        """
+        if self.fill is not None:
+            # A seek far ahead would otherwise run the search up to it here
+            await self.fill(self.trace, self.position + 1)
+        steps = self.trace.level_at(self.position)
+        if not steps:
+            self.playing = False
+            return {"type": "completed", "total": len(self.trace.steps), "path": self.trace.path}
+        frame = {
+            "type": "level",
+            "level": steps[0][2],
+            "from": self.position,
+            "steps": [{"current_node": node, "next_nodes": next_nodes}
+                      for node, next_nodes, _ in steps],
+        }
+        self.position += len(steps)
+        return frame
+
+
+async def _read_controls(websocket: WebSocket, playback: Playback):
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+                if not isinstance(message, dict):
+                    raise ValueError("Control messages must be JSON objects")
+                playback.handle(message)
+            except (KeyError, TypeError, ValueError, OverflowError) as error:
+                playback.outbox.append({"type": "error", "detail": str(error)})
+                playback.changed.set()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        playback.closed = True
+        playback.changed.set()
+
+
+async def run_playback(websocket: WebSocket, playback: Playback):
+    """
+    Push levels of the trace at the client's rate until it disconnects.
+
+    One task reads control messages while this loop sends, so a pause, seek
+    or rate change takes effect without waiting out the current interval.
+    """
+    reader = asyncio.create_task(_read_controls(websocket, playback))
+    try:
+        while not playback.closed:
+            playback.changed.clear()
+            while playback.outbox:
+                await websocket.send_json(playback.outbox.pop(0))
+            timeout = None
+            if playback.playing:
+                await websocket.send_json(await playback.next_frame())
+                timeout = 1.0 / playback.rate
+            try:
+                await asyncio.wait_for(playback.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # Client went away mid-send
+    finally:
+        reader.cancel()
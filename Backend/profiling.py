@@ -0,0 +1,96 @@
+"""
+Opt-in profiling of single requests.
+
+A request that asks for it runs under cProfile and its stats are written to
+$PATHFINDING_PROFILE_DIR (default ./profiles) as a .prof file named after the
+map seed and algorithm, readable with `python -m pstats` or snakeviz.
+Requests that don't ask never touch this module's profiler.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import time
+from typing import Optional
+
+PROFILE_DIR = os.environ.get("PATHFINDING_PROFILE_DIR", "profiles")
+
+# Only names this module wrote are served back
+PROFILE_NAME = re.compile(r"^[\w.-]+\.prof$")
+
+
+def requested(value) -> bool:
+    """
+    Whether a request flag or header value turns profiling on.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+class RequestProfile:
+    """
+    cProfile session for one request, tagged with the map seed and algorithm.
+
+        with RequestProfile(seed, "astar") as profile:
+            ...
+        name = profile.save()
+
+    :param seed: Map seed, so the profiled map can be regenerated.
+    :param algorithm: Algorithm value of the search.
+    :param directory: Where save() writes; defaults to PROFILE_DIR.
+    """
+    def __init__(self, seed: Optional[int], algorithm: str, directory: Optional[str] = None):
+        self.seed = seed
+        self.algorithm = algorithm
+        self.directory = directory or PROFILE_DIR
+        self.profiler = cProfile.Profile()
+        self.started = None
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.disable()
+        self.seconds += time.perf_counter() - self.started
+        return False
+
+    @property
+    def name(self) -> str:
+        seed = "random" if self.seed is None else self.seed
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        return f"{stamp}-{os.getpid()}-{self.algorithm}-seed{seed}.prof"
+
+    def save(self) -> str:
+        """
+        Write the stats in pstats format.
+
+        :return: The file name, relative to the profile directory.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        name = self.name
+        self.profiler.dump_stats(os.path.join(self.directory, name))
+        return name
+
+    def summary(self, limit: int = 25) -> str:
+        """
+        The `limit` most expensive functions by cumulative time, as text.
+        """
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+
+def profile_path(name: str, directory: Optional[str] = None) -> Optional[str]:
+    """
+    Path of a saved profile, or None if the name is not one save() could
+    have written or the file is gone.
+    """
+    if not PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(directory or PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,68 @@
+class RadixHeap:
+    """
+    Monotone priority queue for non-negative integer keys.
+
+    An item lives in bucket b, the bit length of (key XOR last popped key),
+    so bucket 0 holds items whose key equals the last key popped. When
+    bucket 0 runs dry, the lowest non-empty bucket is split around its
+    smallest key. An item moves to a lower bucket on each split, so a pop
+    costs amortised O(log C) for keys spanning C, with no comparisons
+    between items and no (key, item) tuples.
+
+    Keys pushed must not be smaller than the last key popped. That holds for
+    Dijkstra and for A* with a consistent heuristic.
+    """
+    __slots__ = ("last", "keys", "items", "size")
+
+    def __init__(self):
+        self.last = 0
+        # Parallel key / item lists per bucket
+        self.keys = [[] for _ in range(65)]
+        self.items = [[] for _ in range(65)]
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+    def push(self, key: int, item):
+        b = (key ^ self.last).bit_length()
+        self.keys[b].append(key)
+        self.items[b].append(item)
+        self.size += 1
+
+    def _refill(self):
+        # Split the lowest non-empty bucket around its minimum key
+        keys, items = self.keys, self.items
+        b = 1
+        while not keys[b]:
+            b += 1
+        bucket_keys, bucket_items = keys[b], items[b]
+        keys[b], items[b] = [], []
+        last = self.last = min(bucket_keys)
+        for key, item in zip(bucket_keys, bucket_items):
+            target = (key ^ last).bit_length()
+            keys[target].append(key)
+            items[target].append(item)
+
+    def peek_key(self) -> int:
+        """
+        Smallest key in the heap, which must not be empty.
+        """
+        if not self.keys[0]:
+            self._refill()
+        return self.last
+
+    def pop(self):
+        """
+        Remove an item with the smallest key.
+
+        :return: (key, item).
+        """
+        if not self.keys[0]:
+            self._refill()
+        self.keys[0].pop()
+        self.size -= 1
+        return self.last, self.items[0].pop()
@@ -0,0 +1,87 @@
+from typing import Iterator, List, Optional, Tuple
+
+from models import PathStep
+
+BYTES_PER_CELL = 16  # Score and parent list slots a running engine holds per cell
+BYTES_PER_PATH_NODE = 64  # A coordinate tuple of two small ints plus its list slot
+
+
+class ResumableSearch:
+    """
+    A suspended search that a session advances one expanded node at a time.
+
+    Holds the engine's generator (and through it the open set and score
+    arrays) instead of a precomputed list of steps, so a session costs O(cells)
+    and steps nobody asks for are never computed.
+
+    :param steps: Generator such as dijkstra.dijkstra_steps, yielding
+                  (level, {"x,y": [[next_x, next_y], ...]}) and returning the path.
+    :param cells: Cells of the searched grid (FlatGrid.size), for size accounting.
+    :param stats: SearchStats the engine was given, if any.
+    """
+    def __init__(self, steps, cells=0, stats=None):
+        self.steps = steps
+        self.cells = cells
+        self.stats = stats
+        self.level = None
+        self.pending: Iterator = iter(())  # Nodes of self.level not handed out yet
+        self.step_count = 0
+        self.path: Optional[List[Tuple[int, int]]] = None  # Set once the search finishes
+
+    @property
+    def completed(self) -> bool:
+        return self.path is not None
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Estimated memory held: the engine's per-cell state while the search
+        is suspended, only the path once it has finished.
+        """
+        if self.completed:
+            return len(self.path) * BYTES_PER_PATH_NODE
+        return self.cells * BYTES_PER_CELL
+
+    def skip(self, count):
+        """
+        Advance the search by `count` expanded nodes without building steps,
+        e.g. to resume a session another worker had advanced.
+        """
+        while count > 0 and not self.completed:
+            for _ in self.pending:
+                self.step_count += 1
+                count -= 1
+                if not count:
+                    return
+            try:
+                self.level, nodes = next(self.steps)
+            except StopIteration as stop:
+                self.path = stop.value
+                self.steps = None
+                break
+            self.pending = iter(nodes.items())
+
+    def next_step(self) -> Optional[PathStep]:
+        """
+        Advance the search by one expanded node.
+
+        :return: The next PathStep, or None once the search has finished.
+        """
+        while not self.completed:
+            for key, next_nodes in self.pending:
+                x, y = key.split(",")
+                self.step_count += 1
+                return PathStep(
+                    current_node=(int(x), int(y)),
+                    next_nodes=[tuple(n) for n in next_nodes],
+                    level=self.level,
+                    step=self.step_count - 1,
+                )
+            try:
+                self.level, nodes = next(self.steps)
+            except StopIteration as stop:
+                self.path = stop.value
+                self.steps = None  # Release the engine's search state
+                break
+            self.pending = iter(nodes.items())
+        return None
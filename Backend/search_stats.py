@@ -0,0 +1,26 @@
+class SearchStats:
+    """
+    Work counters for one search.
+
+    Engines count in local variables and add them here once, when the search
+    finishes, so a search run without a SearchStats pays only for a few
+    integer additions.
+    """
+    __slots__ = ("nodes_expanded", "heap_pushes", "heap_pops", "stale_pops", "jump_cells")
+
+    def __init__(self):
+        self.nodes_expanded = 0
+        self.heap_pushes = 0  # Priority / bucket queue insertions
+        self.heap_pops = 0
+        self.stale_pops = 0  # Pops of entries for nodes already expanded
+        self.jump_cells = 0  # Cells stepped over by JPS jump scans
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def add(self, counts):
+        """
+        Add counters from another SearchStats' as_dict(), e.g. from a worker process.
+        """
+        for name, value in counts.items():
+            setattr(self, name, getattr(self, name) + value)
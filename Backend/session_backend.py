@@ -0,0 +1,328 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from trace_codec import decode_trace, encode_trace
+
+class SessionBackend(ABC):
+    """
+    Interface of a session store. Subclasses must implement the session
+    methods; the trace methods default to doing nothing.
+
+    A session is a dict with at least "grid" (NumPy array), "algorithm"
+    (Algorithm value) and "step" (how many steps /next-step has served), plus
+    "costs" (terrain cost array) on weighted maps. Shared backends persist
+    only those fields; any other entry (FlatGrid, suspended search, ...) is
+    worker-local state that can be rebuilt from them.
+
+    Traces are registered by content hash so any worker can rebuild a trace
+    it never computed, and a finished trace can be stored to skip the search.
+    """
+    @abstractmethod
+    def add_session(self, session_id: str, data: dict):
+        ...
+
+    @abstractmethod
+    def get_session(self, session_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def save_session(self, session_id: str, data: dict):
+        """
+        Persist changes made to a session returned by get_session.
+        """
+
+    @abstractmethod
+    def cleanup_sessions(self):
+        ...
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+    def save_trace(self, trace_id: str, grid, algorithm: str, start, end, costs=None):
+        """
+        Record what a trace id stands for. Local backends can skip this.
+        """
+
+    def save_trace_result(self, trace_id: str, steps, path):
+        """
+        Store the finished steps and path of a trace. Local backends can skip this.
+        """
+
+    def load_trace(self, trace_id: str) -> Optional[dict]:
+        """
+        :return: Dict with grid, costs (None on unit-cost maps), algorithm,
+                 start, end and, if stored, steps and path; None if the trace
+                 is unknown.
+        """
+        return None
+
+
+def pack_grid(grid) -> bytes:
+    # Cell states are small numbers, so one byte each, and deflate does the rest
+    return zlib.compress(np.ascontiguousarray(grid, dtype=np.uint8).tobytes())
+
+
+def unpack_grid(blob: bytes, rows: int, cols: int) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(blob), dtype=np.uint8).reshape(rows, cols).astype(int)
+
+
+def pack_steps(steps, rows, cols) -> bytes:
+    """
+    Encode a StoredTrace step list with trace_codec. Each level's steps are
+    contiguous and expand distinct nodes, so level -> {"x,y": next_nodes}
+    keeps their order.
+    """
+    step_info = {}
+    for (x, y), next_nodes, level in steps:
+        step_info.setdefault(level, {})[f"{x},{y}"] = next_nodes
+    return encode_trace(step_info, rows, cols)
+
+
+def unpack_steps(blob: bytes) -> List[Tuple[Tuple[int, int], List[Tuple[int, int]], int]]:
+    _, _, step_info = decode_trace(blob)
+    steps = []
+    for level, nodes in step_info.items():
+        for key, next_nodes in nodes.items():
+            x, y = key.split(",")
+            steps.append(((int(x), int(y)), [tuple(n) for n in next_nodes], level))
+    return steps
+
+
+def pack_path(path, cols) -> bytes:
+    cells = array("i", (x * cols + y for x, y in path))
+    if sys.byteorder != "little":
+        cells.byteswap()
+    return zlib.compress(cells.tobytes())
+
+
+def unpack_path(blob: bytes, cols) -> List[Tuple[int, int]]:
+    cells = array("i")
+    cells.frombytes(zlib.decompress(blob))
+    if sys.byteorder != "little":
+        cells.byteswap()
+    return [divmod(cell, cols) for cell in cells]
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS maps (
+    map_key TEXT PRIMARY KEY,
+    rows INTEGER NOT NULL,
+    cols INTEGER NOT NULL,
+    cells BLOB NOT NULL,
+    costs BLOB
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    map_key TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    last_activity REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_activity ON sessions (last_activity);
+CREATE TABLE IF NOT EXISTS traces (
+    trace_id TEXT PRIMARY KEY,
+    map_key TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    start_x INTEGER NOT NULL,
+    start_y INTEGER NOT NULL,
+    end_x INTEGER NOT NULL,
+    end_y INTEGER NOT NULL,
+    steps BLOB,
+    path BLOB,
+    last_activity REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS traces_by_activity ON traces (last_activity);
+"""
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    Session backend in a local SQLite database in WAL mode, shared by every
+    worker process on the machine.
+
+    Grids are stored once per distinct map as deflated bytes; sessions store
+    only the map key, algorithm and step cursor, so /next-step writes one
+    small row. Each worker keeps its decoded grid and suspended search in a
+    small local cache and rebuilds them when a session arrives from another
+    worker.
+
+    :param path: Database file.
+    :param ttl: Seconds of inactivity before a session or trace expires.
+    :param local_sessions: Sessions whose worker-local state is cached.
+    """
+    def __init__(self, path: str, ttl: float = 600.0, local_sessions: int = 256):
+        self.path = path
+        self.ttl = ttl
+        self.local_sessions = local_sessions
+        self.local: "OrderedDict[str, dict]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA busy_timeout=5000")
+        self.db.executescript(SCHEMA)
+        # Databases created before terrain costs lack the column
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(maps)")]
+        if "costs" not in columns:
+            self.db.execute("ALTER TABLE maps ADD COLUMN costs BLOB")
+
+    @contextmanager
+    def _transaction(self):
+        # The connection autocommits each statement; writes that depend on
+        # each other (a map row and the session or trace pointing at it) go
+        # in one transaction so cleanup_sessions in another worker can't run
+        # between them. IMMEDIATE takes the write lock up front.
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def _store_map(self, grid, costs=None) -> str:
+        cells = pack_grid(grid)
+        rows, cols = grid.shape
+        packed_costs = None if costs is None else pack_grid(costs)
+        map_key = hashlib.sha1(f"{rows}x{cols}:".encode() + cells + (packed_costs or b"")).hexdigest()
+        self.db.execute("INSERT OR IGNORE INTO maps (map_key, rows, cols, cells, costs) VALUES (?, ?, ?, ?, ?)",
+                        (map_key, rows, cols, cells, packed_costs))
+        return map_key
+
+    def _load_map(self, map_key) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        rows, cols, cells, costs = self.db.execute(
+            "SELECT rows, cols, cells, costs FROM maps WHERE map_key = ?", (map_key,)).fetchone()
+        return unpack_grid(cells, rows, cols), None if costs is None else unpack_grid(costs, rows, cols)
+
+    def _cache_local(self, session_id, data):
+        self.local[session_id] = data
+        self.local.move_to_end(session_id)
+        if len(self.local) > self.local_sessions:
+            self.local.popitem(last=False)
+
+    def add_session(self, session_id: str, data: dict):
+        grid = np.asarray(data["grid"])
+        with self.lock:
+            with self._transaction():
+                map_key = self._store_map(grid, data.get("costs"))
+                self.db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                                (session_id, map_key, data["algorithm"], data["step"], time.time()))
+            data["map_key"] = map_key
+            self._cache_local(session_id, data)
+
+    def get_session(self, session_id: str) -> Optional[dict]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT map_key, algorithm, step, last_activity FROM sessions WHERE session_id = ?",
+                (session_id,)).fetchone()
+            if row is None:
+                self.local.pop(session_id, None)
+                return None
+            map_key, algorithm, step, last_activity = row
+            now = time.time()
+            if now - last_activity > self.ttl:
+                return None
+            self.db.execute("UPDATE sessions SET last_activity = ? WHERE session_id = ?",
+                            (now, session_id))
+
+            data = self.local.get(session_id)
+            if data is None or data["map_key"] != map_key:
+                grid, costs = self._load_map(map_key)
+                data = {"grid": grid, "costs": costs, "map_key": map_key}
+            data["algorithm"] = algorithm
+            data["step"] = step
+            self._cache_local(session_id, data)
+            return data
+
+    def save_session(self, session_id: str, data: dict):
+        with self.lock:
+            self.db.execute("UPDATE sessions SET step = ?, last_activity = ? WHERE session_id = ?",
+                            (data["step"], time.time(), session_id))
+
+    def cleanup_sessions(self):
+        cutoff = time.time() - self.ttl
+        with self.lock, self._transaction():
+            self.db.execute("DELETE FROM sessions WHERE last_activity < ?", (cutoff,))
+            self.db.execute("DELETE FROM traces WHERE last_activity < ?", (cutoff,))
+            self.db.execute("""
+                DELETE FROM maps WHERE map_key NOT IN (SELECT map_key FROM sessions)
+                                   AND map_key NOT IN (SELECT map_key FROM traces)""")
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            sessions, = self.db.execute("SELECT COUNT(*) FROM sessions").fetchone()
+            map_bytes, = self.db.execute(
+                "SELECT COALESCE(SUM(LENGTH(cells) + COALESCE(LENGTH(costs), 0)), 0) FROM maps").fetchone()
+            trace_bytes, = self.db.execute(
+                "SELECT COALESCE(SUM(LENGTH(steps) + LENGTH(path)), 0) FROM traces").fetchone()
+        return {"sessions": sessions, "map_bytes": map_bytes, "trace_bytes": trace_bytes}
+
+    def save_trace(self, trace_id: str, grid, algorithm: str, start, end, costs=None):
+        with self.lock, self._transaction():
+            map_key = self._store_map(np.asarray(grid), costs)
+            self.db.execute("""
+                INSERT INTO traces VALUES (?, ?, ?, ?, ?, ?, ?, NULL, NULL, ?)
+                ON CONFLICT (trace_id) DO UPDATE SET last_activity = excluded.last_activity""",
+                            (trace_id, map_key, algorithm, *start, *end, time.time()))
+
+    def save_trace_result(self, trace_id: str, steps, path):
+        with self.lock:
+            shape = self.db.execute(
+                "SELECT rows, cols FROM traces JOIN maps USING (map_key) WHERE trace_id = ?",
+                (trace_id,)).fetchone()
+            if shape is None:
+                return
+            rows, cols = shape
+            self.db.execute("UPDATE traces SET steps = ?, path = ? WHERE trace_id = ?",
+                            (pack_steps(steps, rows, cols), pack_path(path, cols), trace_id))
+
+    def load_trace(self, trace_id: str) -> Optional[dict]:
+        with self.lock:
+            row = self.db.execute("""
+                SELECT map_key, algorithm, start_x, start_y, end_x, end_y, steps, path, cols
+                FROM traces JOIN maps USING (map_key) WHERE trace_id = ?""", (trace_id,)).fetchone()
+            if row is None:
+                return None
+            map_key, algorithm, sx, sy, ex, ey, steps, path, cols = row
+            self.db.execute("UPDATE traces SET last_activity = ? WHERE trace_id = ?",
+                            (time.time(), trace_id))
+            grid, costs = self._load_map(map_key)
+            trace = {
+                "grid": grid,
+                "costs": costs,
+                "algorithm": algorithm,
+                "start": (sx, sy),
+                "end": (ex, ey),
+            }
+        if steps is not None:
+            trace["steps"] = unpack_steps(steps)
+            trace["path"] = unpack_path(path, cols)
+        return trace
+
+
+def create_session_backend(url: Optional[str] = None) -> SessionBackend:
+    """
+    Build the session backend named by `url` (default: $SESSION_BACKEND).
+
+    "memory" keeps sessions in this process; "sqlite:///path/to/sessions.db"
+    shares them between worker processes through a WAL-mode SQLite file.
+    """
+    url = url or os.environ.get("SESSION_BACKEND", "memory")
+    if url == "memory":
+        from session_manager import SessionManager
+        return SessionManager()
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionBackend(url[len("sqlite:///"):])
+    raise ValueError(f"Unknown session backend: {url}")
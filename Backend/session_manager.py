@@ -1,28 +1,138 @@
-from datetime import datetime, timedelta
-import asyncio
-from typing import Dict, Optional
-
-class SessionManager:
-    def __init__(self):
-        self.sessions: Dict[str, dict] = {}
-        self.last_activity: Dict[str, datetime] = {}
-        
+import heapq
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from session_backend import SessionBackend
+
+DEFAULT_TTL = 600.0  # Seconds of inactivity before a session expires
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def estimate_bytes(value) -> int:
+    """
+    Approximate memory held by a session value. Objects exposing `nbytes`
+    (NumPy arrays, FlatGrid, ResumableSearch) report it themselves.
+    """
+    nbytes = getattr(value, "nbytes", None)
+    if nbytes is not None:
+        return int(nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_bytes(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class SessionManager(SessionBackend):
+    """
+    In-memory session store bounded by idle time and by memory, for a
+    single worker process.
+
+    Sessions are kept in least-recently-used order. Expiry uses a heap with
+    one deadline entry per session: touching a session only updates its
+    last-activity time, and a stale entry is pushed back with the real
+    deadline when it reaches the top, so expiring k sessions costs
+    O(k log n) instead of a scan of every session. When the estimated
+    size of all sessions exceeds `max_bytes`, least recently used sessions
+    are evicted until it fits.
+
+    :param ttl: Seconds of inactivity before a session expires.
+    :param max_bytes: Memory budget for all stored sessions.
+    :param clock: Monotonic time source, in seconds.
+    """
+    def __init__(self, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self.last_activity: Dict[str, float] = {}
+        self.sizes: Dict[str, int] = {}
+        self.deadlines: List[Tuple[float, str]] = []
+        self.scheduled: Set[str] = set()  # Session ids with an entry in self.deadlines
+
+        self.bytes_in_use = 0
+        self.evictions = 0
+        self.expirations = 0
+
     def add_session(self, session_id: str, data: dict):
+        self.cleanup_sessions()
+        if session_id in self.sessions:
+            self._remove(session_id)
         self.sessions[session_id] = data
-        self.last_activity[session_id] = datetime.now()
-        
+        self.last_activity[session_id] = self.clock()
+        self.sizes[session_id] = estimate_bytes(data)
+        self.bytes_in_use += self.sizes[session_id]
+        if session_id not in self.scheduled:
+            heapq.heappush(self.deadlines, (self.last_activity[session_id] + self.ttl, session_id))
+            self.scheduled.add(session_id)
+        self._enforce_budget(keep=session_id)
+
     def get_session(self, session_id: str) -> Optional[dict]:
+        data = self.sessions.get(session_id)
+        if data is None:
+            return None
+        if self.clock() - self.last_activity[session_id] > self.ttl:
+            # Expired but not yet collected
+            self._remove(session_id)
+            self.expirations += 1
+            return None
+        self.last_activity[session_id] = self.clock()
+        self.sessions.move_to_end(session_id)
+        # Sessions shrink or grow as their search runs, so re-measure on use
+        size = estimate_bytes(data)
+        self.bytes_in_use += size - self.sizes[session_id]
+        self.sizes[session_id] = size
+        self._enforce_budget(keep=session_id)
+        return data
+
+    def save_session(self, session_id: str, data: dict):
+        pass  # get_session hands out the stored dict itself
+
+    def remove_session(self, session_id: str):
         if session_id in self.sessions:
-            self.last_activity[session_id] = datetime.now()
-            return self.sessions[session_id]
-        return None
-        
+            self._remove(session_id)
+
     def cleanup_sessions(self):
-        current_time = datetime.now()
-        expired_sessions = [
-            sid for sid, last_active in self.last_activity.items()
-            if (current_time - last_active) > timedelta(minutes=10)
-        ]
-        for sid in expired_sessions:
-            del self.sessions[sid]
-            del self.last_activity[sid] 
\ No newline at end of file
+        now = self.clock()
+        deadlines = self.deadlines
+        while deadlines and deadlines[0][0] <= now:
+            _, sid = heapq.heappop(deadlines)
+            self.scheduled.discard(sid)
+            if sid not in self.sessions:
+                continue  # Already evicted or removed
+            deadline = self.last_activity[sid] + self.ttl
+            if deadline <= now:
+                self._remove(sid)
+                self.expirations += 1
+            else:
+                # Touched since this entry was pushed; reschedule
+                heapq.heappush(deadlines, (deadline, sid))
+                self.scheduled.add(sid)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self.sessions),
+            "bytes_in_use": self.bytes_in_use,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, session_id: str):
+        # The heap entry stays behind and is dropped when it reaches the top
+        del self.sessions[session_id]
+        del self.last_activity[session_id]
+        self.bytes_in_use -= self.sizes.pop(session_id)
+
+    def _enforce_budget(self, keep: str):
+        # Evict least recently used first; never the session being served
+        while self.bytes_in_use > self.max_bytes and len(self.sessions) > 1:
+            oldest = next(iter(self.sessions))
+            if oldest == keep:
+                self.sessions.move_to_end(keep)
+                continue
+            self._remove(oldest)
+            self.evictions += 1
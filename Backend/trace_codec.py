@@ -0,0 +1,146 @@
+"""
+Compact binary encoding for step traces (step_info).
+
+step_info maps level -> {"x,y": [[next_x, next_y], ...]}. As JSON that is
+mostly repeated digits, brackets and quotes; here every cell becomes a flat
+index (x * cols + y) stored in typed arrays, delta-encoded so neighbouring
+cells become small numbers that deflate well.
+
+Layout, all integers little-endian:
+
+    offset  type        field
+    0       4 bytes     magic b"PFT1"
+    4       uint32      flags (bit 0: everything after the header is zlib-deflated)
+    8       uint32      rows
+    12      uint32      cols
+    16      uint32      L, number of levels
+    20      uint32      N, number of expanded nodes
+    24      uint32      M, number of next-node entries
+    28      int32[L]    level ids, in step_info order
+            uint32[L]   expanded nodes per level
+            int32[N]    expanded node cells, each minus the previous node's cell
+                        in the same level (the first node of a level minus 0)
+            uint32[N]   next-node count per expanded node
+            int32[M]    next-node cells, each minus its expanded node's cell
+
+Every array is 4-byte aligned, so once inflated a client can view the
+payload directly as Int32Array / Uint32Array slices without parsing.
+"""
+import base64
+import struct
+import sys
+import zlib
+from array import array
+
+MAGIC = b"PFT1"
+FLAG_DEFLATE = 1
+HEADER = struct.Struct("<4s6I")
+
+
+def as_levels(step_info):
+    """
+    Accept both level -> {"x,y": next_nodes} and a flat {"x,y": next_nodes}
+    trace (the original Lambda layout), the latter as level 0.
+    """
+    if step_info and isinstance(next(iter(step_info.values())), list):
+        return {0: step_info}
+    return step_info
+
+
+def _little_endian(values):
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_trace(step_info, rows, cols, compress=True) -> bytes:
+    """
+    Encode a step trace into the binary layout described above.
+
+    :param step_info: Trace as returned in PathResult.step_info.
+    :param rows: Grid rows.
+    :param cols: Grid columns; cells are encoded as x * cols + y.
+    :param compress: Deflate everything after the header.
+    :return: The encoded blob.
+    """
+    levels = as_levels(step_info)
+    level_ids = array("i")
+    level_sizes = array("I")
+    node_deltas = array("i")
+    next_counts = array("I")
+    next_deltas = array("i")
+
+    for level, nodes in levels.items():
+        level_ids.append(int(level))
+        level_sizes.append(len(nodes))
+        previous = 0
+        for key, next_nodes in nodes.items():
+            x, y = key.split(",")
+            cell = int(x) * cols + int(y)
+            node_deltas.append(cell - previous)
+            previous = cell
+            next_counts.append(len(next_nodes))
+            next_deltas.extend(nx * cols + ny - cell for nx, ny in next_nodes)
+
+    payload = b"".join(_little_endian(a) for a in
+                       (level_ids, level_sizes, node_deltas, next_counts, next_deltas))
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= FLAG_DEFLATE
+
+    header = HEADER.pack(MAGIC, flags, rows, cols,
+                         len(level_ids), len(node_deltas), len(next_deltas))
+    return header + payload
+
+
+def decode_trace(blob):
+    """
+    Decode a blob produced by encode_trace.
+
+    :return: Tuple (rows, cols, step_info) with step_info in the usual
+             level -> {"x,y": [[next_x, next_y], ...]} form.
+    """
+    magic, flags, rows, cols, level_count, node_count, next_count = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Not a step trace blob")
+    payload = blob[HEADER.size:]
+    if flags & FLAG_DEFLATE:
+        payload = zlib.decompress(payload)
+
+    arrays = []
+    offset = 0
+    for typecode, count in (("i", level_count), ("I", level_count), ("i", node_count),
+                            ("I", node_count), ("i", next_count)):
+        values = array(typecode)
+        values.frombytes(payload[offset:offset + 4 * count])
+        if sys.byteorder != "little":
+            values.byteswap()
+        arrays.append(values)
+        offset += 4 * count
+    level_ids, level_sizes, node_deltas, next_counts, next_deltas = arrays
+
+    step_info = {}
+    node = 0
+    next_index = 0
+    for level, size in zip(level_ids, level_sizes):
+        nodes = {}
+        cell = 0
+        for _ in range(size):
+            cell += node_deltas[node]
+            x, y = divmod(cell, cols)
+            next_nodes = []
+            for delta in next_deltas[next_index:next_index + next_counts[node]]:
+                next_nodes.append(list(divmod(cell + delta, cols)))
+            next_index += next_counts[node]
+            nodes[f"{x},{y}"] = next_nodes
+            node += 1
+        step_info[level] = nodes
+    return rows, cols, step_info
+
+
+def encode_trace_base64(step_info, rows, cols, compress=True) -> str:
+    """
+    encode_trace as a base64 string, for embedding in a JSON body.
+    """
+    return base64.b64encode(encode_trace(step_info, rows, cols, compress)).decode("ascii")
@@ -0,0 +1,176 @@
+import hashlib
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import metrics
+from search_session import ResumableSearch
+
+# Measured per step ((x, y), [(x, y), ...], level) of a Python step list:
+# the step, its key and list, and each queued node tuple with its ints
+STEP_BYTES = 200
+NODE_BYTES = 120
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class StoredTrace:
+    """
+    The step list of one search, materialised lazily as ranges are requested.
+
+    Steps are deterministic for a given map, algorithm and endpoints, so a
+    trace is immutable once identified by its content hash.
+
+    :param flat: FlatGrid of the map.
+    :param engine: Step generator function such as dijkstra.dijkstra_steps.
+    :param start: Tuple (x, y) representing start position.
+    :param end: Tuple (x, y) representing end position.
+    :param algorithm: Algorithm value used to label this search's metrics;
+                      None records no metrics.
+    """
+    def __init__(self, flat, engine, start, end, algorithm=None):
+        self.flat = flat
+        self.engine = engine
+        self.start = start
+        self.end = end
+        self.algorithm = algorithm
+        self.stats = metrics.new_search_stats() if algorithm is not None else None
+        # (current_node, next_nodes, level) per step
+        self.steps: List[Tuple[Tuple[int, int], List[Tuple[int, int]], int]] = []
+        self.search: Optional[ResumableSearch] = None
+        self.path = None
+        self.saved = False  # Finished steps written to a shared session backend
+        self.measured = (None, 0, 0)  # (steps list, steps counted, their bytes)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Estimated memory of the stored steps and any suspended search; the
+        FlatGrid is shared with the session and not counted.
+        """
+        steps, counted, size = self.measured
+        if steps is not self.steps:
+            # Replaced wholesale (pool result, backend restore): count afresh
+            steps, counted, size = self.steps, 0, 0
+        for _, next_nodes, _ in steps[counted:]:
+            size += STEP_BYTES + NODE_BYTES * len(next_nodes)
+        self.measured = (steps, len(steps), size)
+        search = self.search.nbytes if self.search is not None else 0
+        return size + search
+
+    @property
+    def completed(self) -> bool:
+        return self.path is not None
+
+    def ensure(self, count):
+        """
+        Run the search until at least `count` steps exist or it finishes.
+        """
+        if self.completed or len(self.steps) >= count:
+            return
+        if self.search is None:
+            self.search = ResumableSearch(self.engine(self.flat, self.start, self.end, stats=self.stats),
+                                          cells=self.flat.size)
+        while len(self.steps) < count:
+            step = self.search.next_step()
+            if step is None:
+                self.finish(self.search.path)
+                return
+            self.steps.append((step.current_node, step.next_nodes, step.level))
+
+    def finish(self, path):
+        """
+        Mark the trace complete once every step is stored, and record its metrics.
+        """
+        self.path = path
+        self.search = None
+        if self.algorithm is not None:
+            metrics.observe_search(self.algorithm, self.flat.rows, self.flat.cols, self.stats)
+
+    def step_range(self, first, last):
+        """
+        Steps [first, last), computing them if needed.
+        """
+        self.ensure(last)
+        return self.steps[first:last]
+
+    def level_at(self, first):
+        """
+        The run of steps from `first` that share its expansion level.
+        """
+        self.ensure(first + 1)
+        if first >= len(self.steps):
+            return []
+        level = self.steps[first][2]
+        last = first + 1
+        while True:
+            self.ensure(last + 1)
+            if last >= len(self.steps) or self.steps[last][2] != level:
+                return self.steps[first:last]
+            last += 1
+
+
+def trace_id(flat, algorithm, start, end) -> str:
+    """
+    Content hash identifying a trace: same map, algorithm and endpoints give
+    the same steps, so they share one id and one cached copy.
+    """
+    key = f"{flat.digest()}:{algorithm}:{tuple(start)}:{tuple(end)}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class TraceStore:
+    """
+    LRU registry of traces by content hash, independent of sessions so trace
+    URLs stay valid after the session that created them moves on.
+
+    Bounded by memory like SessionManager: traces grow as their steps are
+    computed, so each is re-measured when it is registered or fetched, and
+    least recently used traces are evicted while the total is over
+    `max_bytes`. The trace being served is never evicted.
+
+    :param max_bytes: Memory budget for all stored traces.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.traces = OrderedDict()
+        self.sizes = {}
+        self.bytes_in_use = 0
+        self.evictions = 0
+
+    def register(self, flat, algorithm, engine, start, end) -> str:
+        tid = trace_id(flat, algorithm, start, end)
+        if tid in self.traces:
+            self.traces.move_to_end(tid)
+        else:
+            self.traces[tid] = StoredTrace(flat, engine, start, end, algorithm)
+            self.sizes[tid] = 0
+        self._measure(tid)
+        return tid
+
+    def get(self, tid) -> Optional[StoredTrace]:
+        trace = self.traces.get(tid)
+        if trace is not None:
+            self.traces.move_to_end(tid)
+            self._measure(tid)
+        return trace
+
+    def stats(self):
+        return {
+            "traces": len(self.traces),
+            "bytes_in_use": self.bytes_in_use,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+    def _measure(self, tid):
+        size = self.traces[tid].nbytes
+        self.bytes_in_use += size - self.sizes[tid]
+        self.sizes[tid] = size
+        # Evict least recently used first; never the trace being served
+        while self.bytes_in_use > self.max_bytes and len(self.traces) > 1:
+            oldest = next(iter(self.traces))
+            if oldest == tid:
+                self.traces.move_to_end(tid)
+                continue
+            del self.traces[oldest]
+            self.bytes_in_use -= self.sizes.pop(oldest)
+            self.evictions += 1